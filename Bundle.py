@@ -0,0 +1,27 @@
+from typing import Dict
+from DiscountType import DiscountType
+
+
+class Bundle:
+  # A set of items sold together: quantities maps item IDs to how many of
+  # each make up one set. A MULTI_BUY bundle sells the set for value dollars
+  # ("3 for $10"), a BUNDLE takes value dollars off the set ("buy X + Y save $2").
+  __slots__ = ('type', 'value', 'quantities', 'name')
+
+  def __init__(self, type: DiscountType, value: float, quantities: Dict[str, int], name: str):
+    if type not in (DiscountType.MULTI_BUY, DiscountType.BUNDLE):
+      raise ValueError('A bundle must be a MULTI_BUY or BUNDLE discount.')
+    if not quantities or min(quantities.values()) < 1:
+      raise ValueError('A bundle needs at least one of each of its items.')
+    self.type: DiscountType = type
+    self.value: float = value
+    self.quantities: Dict[str, int] = quantities
+    self.name: str = name
+
+  def saving_cents(self, unit_cents: Dict[str, int]) -> int:
+    # Cents saved by one set, given each item's price in cents; never more
+    # than the set costs, and negative if the set is dearer than its items
+    set_cents = sum(unit_cents[item_id] * quantity for item_id, quantity in self.quantities.items())
+    if self.type is DiscountType.MULTI_BUY:
+      return set_cents - round(self.value * 100)
+    return min(round(self.value * 100), set_cents)
@@ -1,7 +1,56 @@
+from datetime import date, datetime
+from typing import Optional
+
+
 class Customer:
+  __slots__ = ('membership_number', 'name', '_date_of_birth', 'id_verified', '_delivery_distance_km', '_delivery_surcharge', '_adult_from_ordinal')
+
   def __init__(self, membership_number: str, name: str, date_of_birth: str, id_verified: bool, delivery_distance_km: float):
     self.membership_number: str = membership_number
     self.name: str = name
     self.date_of_birth: str = date_of_birth
     self.id_verified: bool = id_verified
     self.delivery_distance_km: float = delivery_distance_km
+
+  @property
+  def date_of_birth(self) -> Optional[str]:
+    return self._date_of_birth
+
+  @date_of_birth.setter
+  def date_of_birth(self, date_of_birth: Optional[str]) -> None:
+    self._date_of_birth = date_of_birth
+    self._adult_from_ordinal: Optional[int] = None
+
+  @property
+  def delivery_distance_km(self) -> Optional[float]:
+    return self._delivery_distance_km
+
+  @delivery_distance_km.setter
+  def delivery_distance_km(self, delivery_distance_km: Optional[float]) -> None:
+    self._delivery_distance_km = delivery_distance_km
+    # Deliveries cost $5 or $0.50 for every kilometre, whichever is greater.
+    # Worked out once per distance; None if the customer cannot have
+    # deliveries because no positive distance is known.
+    self._delivery_surcharge: Optional[float] = None
+    if delivery_distance_km is not None and not delivery_distance_km <= 0:
+      self._delivery_surcharge = round(max(5, 0.5 * delivery_distance_km), 2)
+
+  def delivery_surcharge(self) -> Optional[float]:
+    return self._delivery_surcharge
+
+  def adult_from_ordinal(self) -> Optional[int]:
+    # Proleptic Gregorian ordinal of the customer's 18th birthday, worked out
+    # once per date of birth. A 29 February birthday turns 18 on 1 March in
+    # non-leap years. Raises ValueError if the date of birth is not dd/mm/YYYY.
+    if self._date_of_birth is None:
+      return None
+
+    if self._adult_from_ordinal is None:
+      birth = datetime.strptime(self._date_of_birth, "%d/%m/%Y").date()
+      try:
+        adult_from = birth.replace(year=birth.year + 18)
+      except ValueError:
+        adult_from = date(birth.year + 18, 3, 1)
+      self._adult_from_ordinal = adult_from.toordinal()
+
+    return self._adult_from_ordinal
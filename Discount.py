@@ -1,8 +1,65 @@
+from itertools import count
+from typing import Tuple
 from DiscountType import DiscountType
 
+# Every change to a discount's type or value takes a new, globally unique version number.
+_discount_versions = count()
+
 
 class Discount:
+  __slots__ = ('_type', '_value', 'item_id', 'version')
+
   def __init__(self, type: DiscountType, value: float, item_id: str):
     self.type: DiscountType = type
     self.value: float = value
     self.item_id: str = item_id
+
+  @property
+  def type(self) -> DiscountType:
+    return self._type
+
+  @type.setter
+  def type(self, type: DiscountType) -> None:
+    self._type = type
+    self.version: int = next(_discount_versions)
+
+  @property
+  def value(self) -> float:
+    return self._value
+
+  @value.setter
+  def value(self, value: float) -> None:
+    self._value = value
+    self.version = next(_discount_versions)
+
+  def freeze(self) -> 'FrozenDiscount':
+    return FrozenDiscount(self.type, self.value, self.item_id)
+
+
+class FrozenDiscount(Discount):
+  # Immutable, hashable discount that can be used as a dictionary or cache key.
+  __slots__ = ('_key', '_hash')
+
+  def __init__(self, type: DiscountType, value: float, item_id: str):
+    super().__init__(type, value, item_id)
+    self._key: Tuple[DiscountType, float, str] = (type, value, item_id)
+    self._hash: int = hash(self._key)
+
+  def __setattr__(self, name: str, value: object) -> None:
+    if hasattr(self, '_hash'):
+      raise AttributeError("FrozenDiscount attribute '{}' cannot be changed".format(name))
+    super().__setattr__(name, value)
+
+  def __eq__(self, other: object) -> bool:
+    if not isinstance(other, FrozenDiscount):
+      return NotImplemented
+    return self._key == other._key
+
+  def __hash__(self) -> int:
+    return self._hash
+
+  def __reduce__(self) -> Tuple[type, Tuple[DiscountType, float, str]]:
+    return (FrozenDiscount, self._key)
+
+  def thaw(self) -> Discount:
+    return Discount(self.type, self.value, self.item_id)
@@ -0,0 +1,25 @@
+from datetime import datetime
+from typing import Optional
+from Discount import Discount
+from DiscountType import DiscountType
+
+
+class DiscountRule:
+  # A discount on one item, on every item in a category, or on every item in
+  # the store when neither is given, in effect from start (inclusive) to end
+  # (exclusive); None means open ended. Where several rules apply to an item
+  # at once the highest priority wins.
+  __slots__ = ('discount', 'item_id', 'category', 'start', 'end', 'priority')
+
+  def __init__(self, type: DiscountType, value: float, item_id: Optional[str] = None, category: Optional[str] = None,
+               start: Optional[datetime] = None, end: Optional[datetime] = None, priority: int = 0):
+    if item_id is not None and category is not None:
+      raise ValueError('A discount rule applies to an item or a category, not both.')
+    if start is not None and end is not None and end <= start:
+      raise ValueError('A discount rule must end after it starts.')
+    self.discount: Discount = Discount(type, value, item_id or '')
+    self.item_id: Optional[str] = item_id
+    self.category: Optional[str] = category
+    self.start: Optional[datetime] = start
+    self.end: Optional[datetime] = end
+    self.priority: int = priority
@@ -0,0 +1,186 @@
+"""Discount rules compiled into timelines searched by binary search."""
+import heapq
+from bisect import bisect_right
+from datetime import datetime
+from typing import (Dict, Iterable, Iterator, List, Mapping, Optional,
+                    Sequence, Tuple)
+from Item import Item
+from Discount import Discount
+from Transaction import Transaction
+from DiscountRule import DiscountRule
+
+# A more specific rule beats a broader one of the same priority
+_STORE, _CATEGORY, _ITEM = 0, 1, 2
+_STORE_KEY = (_STORE, '')
+
+# (-priority, -scope, order): the smallest rank wins
+_Rank = Tuple[int, int, int]
+_Ranked = Tuple[_Rank, DiscountRule]
+
+CatalogEntry = Tuple[Item, int, Optional[int]]
+
+
+class _Timeline:
+    """The winning rule of one item, category or the whole store over time."""
+
+    __slots__ = ('starts', 'winners')
+
+    def __init__(self, rules: Sequence[_Ranked]):
+        # Sweep the rule boundaries in time order, keeping the rules that
+        # have started in a heap by rank; rules that have ended are only
+        # dropped once they reach the top.
+        rules = sorted(rules, key=lambda ranked: ranked[1].start
+                       or datetime.min)
+        boundaries = sorted({rule.start or datetime.min
+                             for _, rule in rules}
+                            | {rule.end for _, rule in rules
+                               if rule.end is not None})
+        self.starts: List[datetime] = []
+        self.winners: List[Optional[_Ranked]] = []
+        active: List[Tuple[_Rank, DiscountRule]] = []
+        upcoming = 0
+        for boundary in boundaries:
+            while (upcoming < len(rules) and
+                   (rules[upcoming][1].start or datetime.min) <= boundary):
+                heapq.heappush(active, rules[upcoming])
+                upcoming += 1
+            while (active and active[0][1].end is not None and
+                   active[0][1].end <= boundary):
+                heapq.heappop(active)
+            winner = active[0] if active else None
+            if not self.winners or self.winners[-1] is not winner:
+                self.starts.append(boundary)
+                self.winners.append(winner)
+
+    def at(self, when: datetime) -> Optional[_Ranked]:
+        index = bisect_right(self.starts, when) - 1
+        return self.winners[index] if index >= 0 else None
+
+
+class DiscountSchedule:
+    """
+    Discount rules for items, categories and the whole store, over time.
+
+    The rules are compiled once, into one timeline per item, per category
+    and for the whole store. Each timeline is a sorted list of the times
+    at which its winning rule changes, so finding the discount of an item
+    at a given time takes one binary search per timeline the item belongs
+    to, however many rules there are.
+
+    Where several rules are in effect for an item, the highest priority
+    wins; then an item rule beats a category rule, which beats a store
+    rule; then the rule given first wins. Categories are matched without
+    regard to case. Discounts from a plain discounts dictionary become
+    item rules of priority 0 that never end.
+    """
+
+    def __init__(self, rules: Iterable[DiscountRule],
+                 discounts_dict: Optional[Mapping[str, Discount]] = None):
+        """Compile discount rules, and any plain discounts, into timelines."""
+        rules = list(rules)
+        for item_id, discount in (discounts_dict or {}).items():
+            rule = DiscountRule(discount.type, discount.value, item_id)
+            rule.discount = discount
+            rules.append(rule)
+
+        grouped: Dict[Tuple[int, str], List[_Ranked]] = {}
+        for order, rule in enumerate(rules):
+            if rule.item_id is not None:
+                key = (_ITEM, rule.item_id)
+            elif rule.category is not None:
+                key = (_CATEGORY, rule.category.casefold())
+            else:
+                key = _STORE_KEY
+            grouped.setdefault(key, []).append(
+                ((-rule.priority, -key[0], order), rule))
+
+        self.rules = rules
+        self._timelines: Dict[Tuple[int, str], _Timeline] = {
+            key: _Timeline(ranked) for key, ranked in grouped.items()}
+
+    def __len__(self) -> int:
+        """Return the number of rules in the schedule."""
+        return len(self.rules)
+
+    def rule_for(self, item: Item, when: datetime
+                 ) -> Optional[DiscountRule]:
+        """Return the rule that decides an item's discount at a time."""
+        timelines = self._timelines
+        best = None
+        keys = [(_ITEM, item.id), _STORE_KEY]
+        keys.extend((_CATEGORY, category.casefold())
+                    for category in item.categories)
+        for key in keys:
+            timeline = timelines.get(key)
+            if timeline is None:
+                continue
+            found = timeline.at(when)
+            if found is not None and (best is None or found[0] < best[0]):
+                best = found
+        return best[1] if best is not None else None
+
+    def discount_for(self, item: Item, when: datetime) -> Optional[Discount]:
+        """Return the discount in effect for an item at a time, if any."""
+        rule = self.rule_for(item, when)
+        return rule.discount if rule is not None else None
+
+    def at(self, when: datetime, items_dict: Mapping[str, CatalogEntry]
+           ) -> 'ActiveDiscounts':
+        """Return the discounts in effect at a time, as a discounts dict."""
+        return ActiveDiscounts(self, when, items_dict)
+
+    def for_transaction(self, trans: Transaction,
+                        items_dict: Mapping[str, CatalogEntry]
+                        ) -> 'ActiveDiscounts':
+        """Return the discounts in effect when a transaction was made."""
+        return ActiveDiscounts(self, trans.timestamp(), items_dict)
+
+
+class ActiveDiscounts(Mapping):
+    """
+    Discounts dictionary of the rules in effect at one time.
+
+    Can be passed wherever a discounts dictionary is expected, such as
+    calculate_final_item_price and checkout. Each item ID is resolved
+    against the schedule the first time it is looked up; the items
+    dictionary supplies the item's categories.
+    """
+
+    def __init__(self, schedule: DiscountSchedule, when: datetime,
+                 items_dict: Mapping[str, CatalogEntry]):
+        """Resolve discounts from a schedule at a time."""
+        self.schedule = schedule
+        self.when = when
+        self._items = items_dict
+        self._resolved: Dict[str, Optional[Discount]] = {}
+
+    def get(self, item_id: str,  # type: ignore[override]
+            default: Optional[Discount] = None) -> Optional[Discount]:
+        """Return the discount of an item ID, or default if it has none."""
+        try:
+            discount = self._resolved[item_id]
+        except KeyError:
+            entry = self._items.get(item_id)
+            discount = (self.schedule.discount_for(entry[0], self.when)
+                        if entry is not None else None)
+            self._resolved[item_id] = discount
+        return default if discount is None else discount
+
+    def __getitem__(self, item_id: str) -> Discount:
+        """Return the discount of an item ID."""
+        discount = self.get(item_id)
+        if discount is None:
+            raise KeyError(item_id)
+        return discount
+
+    def __contains__(self, item_id: object) -> bool:
+        """Return True if the item ID has a discount."""
+        return isinstance(item_id, str) and self.get(item_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the IDs of the discounted items."""
+        return (item_id for item_id in self._items if item_id in self)
+
+    def __len__(self) -> int:
+        """Return the number of discounted items."""
+        return sum(1 for _ in self)
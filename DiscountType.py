@@ -4,3 +4,6 @@ from enum import Enum
 class DiscountType(Enum):
   PERCENTAGE = 'Percentage'
   FLAT = 'Flat'
+  # Bundle discounts, applied to whole sets of items by the cart-level solver
+  MULTI_BUY = 'Multi-buy'
+  BUNDLE = 'Bundle'
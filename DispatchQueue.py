@@ -0,0 +1,93 @@
+"""Finalised delivery orders queued for dispatch by distance band."""
+import heapq
+from datetime import datetime
+from itertools import count
+from threading import Lock
+from typing import Iterator, List, Optional, Tuple
+from FulfilmentType import FulfilmentType
+from Transaction import Transaction
+from FulfilmentException import FulfilmentException
+
+# (distance band, transaction time, order queued, transaction)
+_Entry = Tuple[int, datetime, int, Transaction]
+
+
+class DispatchQueue:
+    """
+    Heap of finalised delivery transactions, nearest band and oldest first.
+
+    Customers' delivery distances are grouped into bands of band_km
+    kilometres, so a van's run is made of orders that are near each other.
+    Within a band orders come out by transaction time, and orders made at
+    the same time in the order they were queued. push() and pop() take
+    O(log n); pop_batch() takes O(k log n) for k orders.
+
+    Checkout lanes and the dispatch office may share one queue: every
+    method that reads or changes the queued orders holds the queue's lock.
+    band() reads only band_km, so it needs no lock.
+    """
+
+    def __init__(self, band_km: float = 5.0):
+        """Start an empty queue with distance bands band_km wide."""
+        if band_km <= 0:
+            raise ValueError('Distance bands must be wider than 0 km.')
+        self.band_km = band_km
+        self._heap: List[_Entry] = []
+        self._queued = count()
+        self._lock = Lock()
+
+    def band(self, trans: Transaction) -> int:
+        """
+        Return the distance band of a delivery transaction.
+
+        Raises FulfilmentException unless the transaction has a customer
+        who can have deliveries, as cfs does.
+        """
+        customer = trans.customer
+        if customer is None or customer.delivery_surcharge() is None:
+            raise FulfilmentException()
+        return int(customer.delivery_distance_km // self.band_km)
+
+    def push(self, trans: Transaction) -> None:
+        """
+        Queue a finalised delivery transaction.
+
+        Raises ValueError if the transaction is not finalised, and
+        FulfilmentException if it is not a delivery or cannot be delivered.
+        """
+        if trans is None or not trans.finalised:
+            raise ValueError('Only finalised transactions can be dispatched.')
+        if trans.fulfilment_type is not FulfilmentType.DELIVERY:
+            raise FulfilmentException()
+        band, when = self.band(trans), trans.timestamp()
+        with self._lock:
+            heapq.heappush(self._heap,
+                           (band, when, next(self._queued), trans))
+
+    def peek(self) -> Optional[Transaction]:
+        """Return the next transaction to dispatch, or None if empty."""
+        with self._lock:
+            return self._heap[0][3] if self._heap else None
+
+    def pop(self) -> Transaction:
+        """Remove and return the next transaction; IndexError if empty."""
+        with self._lock:
+            return heapq.heappop(self._heap)[3]
+
+    def pop_batch(self, size: int = 10000) -> List[Transaction]:
+        """Remove and return up to size transactions, in dispatch order."""
+        heap = self._heap
+        with self._lock:
+            return [heapq.heappop(heap)[3]
+                    for _ in range(min(size, len(heap)))]
+
+    def __len__(self) -> int:
+        """Return the number of queued transactions."""
+        with self._lock:
+            return len(self._heap)
+
+    def __iter__(self) -> Iterator[Transaction]:
+        """Iterate over a snapshot of the queue, in dispatch order."""
+        with self._lock:
+            entries = sorted(self._heap)
+        return (entry[3] for entry in entries)
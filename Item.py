@@ -1,9 +1,101 @@
-from typing import List
+from itertools import count
+from typing import Callable, FrozenSet, Iterable, List, Optional, Tuple
+
+# Case-folded restricted category names, and a counter bumped on every change
+# so items can tell whether their cached restriction flag is still current.
+_restricted_categories: FrozenSet[str] = frozenset(['alcohol', 'tobacco', 'knives'])
+_restricted_version: int = 0
+
+# Every price change takes a new, globally unique version number.
+_price_versions = count()
+
+
+def set_restricted_categories(categories: Iterable[str]) -> None:
+  global _restricted_categories, _restricted_version
+  _restricted_categories = frozenset(category.casefold() for category in categories)
+  _restricted_version += 1
+
+
+def get_restricted_categories() -> FrozenSet[str]:
+  return _restricted_categories
 
 
 class Item:
+  # __weakref__ lets ItemCatalog track the item objects it has handed out,
+  # and price_hook lets it copy every price change into its own columns
+  __slots__ = ('id', 'name', '_original_price', 'price_version', 'price_hook', '_categories', '_restricted', '_restricted_version', '__weakref__')
+
   def __init__(self, id: str, name: str, original_price: float, categories: List[str]):
+    self.price_hook: Optional[Callable[['Item'], None]] = None
     self.id: str = id
     self.name: str = name
     self.original_price: float = original_price
     self.categories: List[str] = categories
+
+  @property
+  def original_price(self) -> float:
+    return self._original_price
+
+  @original_price.setter
+  def original_price(self, original_price: float) -> None:
+    self._original_price = original_price
+    self.price_version: int = next(_price_versions)
+    if self.price_hook is not None:
+      self.price_hook(self)
+
+  @property
+  def categories(self) -> List[str]:
+    return self._categories
+
+  @categories.setter
+  def categories(self, categories: List[str]) -> None:
+    # Replace the list (rather than mutating it) for the flag to be recomputed
+    self._categories = categories
+    self._update_restricted()
+
+  def _update_restricted(self) -> None:
+    self._restricted = any(category.casefold() in _restricted_categories for category in self._categories)
+    self._restricted_version = _restricted_version
+
+  @property
+  def restricted(self) -> bool:
+    if self._restricted_version != _restricted_version:
+      self._update_restricted()
+    return self._restricted
+
+  def freeze(self) -> 'FrozenItem':
+    return FrozenItem(self.id, self.name, self.original_price, self.categories)
+
+
+class FrozenItem(Item):
+  # Immutable, hashable item that can be used as a dictionary or cache key.
+  # Items are equal when their ID, name, price and categories are equal.
+  __slots__ = ('_key', '_hash')
+
+  def __init__(self, id: str, name: str, original_price: float, categories: Iterable[str]):
+    super().__init__(id, name, original_price, tuple(categories))
+    self._key: Tuple[str, str, float, Tuple[str, ...]] = (id, name, original_price, self._categories)
+    self._hash: int = hash(self._key)
+
+  def __setattr__(self, name: str, value: object) -> None:
+    # Only the cached restriction flag may change once the item is built
+    if name in _ITEM_FIELDS and hasattr(self, '_hash'):
+      raise AttributeError("FrozenItem attribute '{}' cannot be changed".format(name))
+    super().__setattr__(name, value)
+
+  def __eq__(self, other: object) -> bool:
+    if not isinstance(other, FrozenItem):
+      return NotImplemented
+    return self._key == other._key
+
+  def __hash__(self) -> int:
+    return self._hash
+
+  def __reduce__(self) -> Tuple[type, Tuple[str, str, float, Tuple[str, ...]]]:
+    return (FrozenItem, self._key)
+
+  def thaw(self) -> Item:
+    return Item(self.id, self.name, self.original_price, list(self.categories))
+
+
+_ITEM_FIELDS: FrozenSet[str] = frozenset(['id', 'name', 'original_price', 'categories', '_original_price', 'price_version', '_categories'])
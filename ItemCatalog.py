@@ -0,0 +1,246 @@
+"""Columnar item catalog usable wherever an items dictionary is expected."""
+from array import array
+from typing import (Any, Dict, Iterable, Iterator, List, MutableMapping,
+                    Optional, Sequence, Tuple, Union)
+from weakref import WeakValueDictionary
+from Item import Item
+
+CatalogEntry = Tuple[Item, int, Optional[int]]
+
+# Purchase quantity limits are stored as integers, -1 meaning no limit.
+_NO_LIMIT = -1
+
+
+class _Entry(Sequence):
+    """
+    An (item, stock, limit) entry whose item is only looked up when read.
+
+    Reading the stock level or limit of an entry, as the stock and purchase
+    limit checks do, never builds an Item object. The entry compares equal
+    to the tuple of its three values.
+    """
+
+    __slots__ = ('_catalog', '_item_id', '_stock', '_limit')
+
+    def __init__(self, catalog: 'ItemCatalog', item_id: str, stock: int,
+                 limit: Optional[int]):
+        self._catalog = catalog
+        self._item_id = item_id
+        self._stock = stock
+        self._limit = limit
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if index == 1:
+            return self._stock
+        if index == 2:
+            return self._limit
+        return (self._catalog.item(self._item_id), self._stock,
+                self._limit)[index]
+
+    def __iter__(self) -> Iterator[Any]:
+        yield self._catalog.item(self._item_id)
+        yield self._stock
+        yield self._limit
+
+    def __len__(self) -> int:
+        return 3
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (tuple, _Entry)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return repr(tuple(self))
+
+
+class ItemCatalog(MutableMapping):
+    """
+    Map string item IDs to (item, stock level, purchase quantity limit).
+
+    Prices, stock levels and purchase quantity limits are kept in
+    contiguous numeric arrays with one row per item, and item categories
+    are stored as codes into a table of interned category names.
+    Item objects are only built when an entry's item is read, and the same
+    object is handed out again for as long as something still references
+    it. A price set on a handed out item is written through to the price
+    column at once, so it survives the item being garbage collected.
+    Writing an entry back, as checkout does after every line, updates the
+    row in place instead of storing a new tuple.
+    """
+
+    def __init__(self, entries: Iterable[CatalogEntry] = ()):
+        """Build a catalog from (item, stock, limit) tuples."""
+        self._index: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._name_blob = bytearray()
+        self._name_start = array('L')
+        self._name_len = array('H')
+        self._prices = array('d')
+        self._stock = array('q')
+        self._limits = array('q')
+        self._cat_start = array('L')
+        self._cat_len = array('H')
+        self._cat_codes = array('L')
+        self._cat_names: List[str] = []
+        self._cat_lookup: Dict[str, int] = {}
+        self._live: 'WeakValueDictionary[int, Item]' = WeakValueDictionary()
+
+        for entry in entries:
+            self[entry[0].id] = entry
+
+    def _columns(self) -> tuple:
+        return (self._ids, self._name_start, self._name_len, self._prices,
+                self._stock, self._limits, self._cat_start, self._cat_len)
+
+    def _category_code(self, category: str) -> int:
+        code = self._cat_lookup.get(category)
+        if code is None:
+            code = len(self._cat_names)
+            self._cat_names.append(category)
+            self._cat_lookup[category] = code
+        return code
+
+    def _write_name(self, row: int, name: str) -> None:
+        encoded = name.encode('utf-8')
+        if len(encoded) <= self._name_len[row]:
+            start = self._name_start[row]
+            self._name_blob[start:start + len(encoded)] = encoded
+        else:
+            self._name_start[row] = len(self._name_blob)
+            self._name_blob.extend(encoded)
+        self._name_len[row] = len(encoded)
+
+    def _write_categories(self, row: int, categories: List[str]) -> None:
+        codes = [self._category_code(c) for c in categories]
+        if len(codes) <= self._cat_len[row]:
+            start = self._cat_start[row]
+            self._cat_codes[start:start + len(codes)] = array('L', codes)
+        else:
+            self._cat_start[row] = len(self._cat_codes)
+            self._cat_codes.extend(codes)
+        self._cat_len[row] = len(codes)
+
+    def _add_row(self, item: Item, stock: int, limit: Optional[int]) -> None:
+        row = len(self._ids)
+        self._index[item.id] = row
+        self._ids.append(item.id)
+        self._name_start.append(len(self._name_blob))
+        self._name_len.append(0)
+        self._write_name(row, item.name)
+        self._prices.append(item.original_price)
+        self._stock.append(stock)
+        self._limits.append(_NO_LIMIT if limit is None else limit)
+        self._cat_start.append(len(self._cat_codes))
+        self._cat_len.append(0)
+        self._write_categories(row, item.categories)
+        self._track(row, item)
+
+    def _track(self, row: int, item: Item) -> None:
+        self._live[row] = item
+        item.price_hook = self._write_price
+
+    def _write_price(self, item: Item) -> None:
+        row = self._index.get(item.id)
+        if row is not None and self._live.get(row) is item:
+            self._prices[row] = item.original_price
+
+    def name(self, item_id: str) -> str:
+        """Return the name of an item."""
+        row = self._index[item_id]
+        start = self._name_start[row]
+        return self._name_blob[start:start + self._name_len[row]].decode()
+
+    def categories(self, item_id: str) -> List[str]:
+        """Return the category names of an item."""
+        row = self._index[item_id]
+        start = self._cat_start[row]
+        return [self._cat_names[code] for code in
+                self._cat_codes[start:start + self._cat_len[row]]]
+
+    def item(self, item_id: str) -> Item:
+        """Return the item object for an item ID."""
+        row = self._index[item_id]
+        item = self._live.get(row)
+        if item is None:
+            item = Item(item_id, self.name(item_id), self._prices[row],
+                        self.categories(item_id))
+            self._track(row, item)
+        return item
+
+    def stock(self, item_id: str) -> int:
+        """Return the current stock level of an item."""
+        return self._stock[self._index[item_id]]
+
+    def limit(self, item_id: str) -> Optional[int]:
+        """Return the purchase quantity limit of an item, if any."""
+        limit = self._limits[self._index[item_id]]
+        return None if limit == _NO_LIMIT else limit
+
+    def set_stock(self, item_id: str, stock: int) -> None:
+        """Overwrite the stock level of an item in place."""
+        self._stock[self._index[item_id]] = stock
+
+    def set_limit(self, item_id: str, limit: Optional[int]) -> None:
+        """Overwrite the purchase quantity limit of an item in place."""
+        self._limits[self._index[item_id]] = (_NO_LIMIT if limit is None
+                                              else limit)
+
+    def __getitem__(self, item_id: str) -> _Entry:
+        """Return the (item, stock, limit) entry of an item ID."""
+        row = self._index[item_id]
+        limit = self._limits[row]
+        return _Entry(self, item_id, self._stock[row],
+                      None if limit == _NO_LIMIT else limit)
+
+    def __setitem__(self, item_id: str, entry: CatalogEntry) -> None:
+        """Store an (item, stock, limit) tuple, in place if it exists."""
+        item, stock, limit = entry
+        if item.id != item_id:
+            raise KeyError(item_id)
+        row = self._index.get(item_id)
+        if row is None:
+            self._add_row(item, stock, limit)
+            return
+
+        self._stock[row] = stock
+        self._limits[row] = _NO_LIMIT if limit is None else limit
+        if self._live.get(row) is not item:
+            # A different item object replaces the row's descriptive fields
+            self._write_name(row, item.name)
+            self._write_categories(row, item.categories)
+            self._track(row, item)
+        self._prices[row] = item.original_price
+
+    def __delitem__(self, item_id: str) -> None:
+        """Remove an item ID and its row from the catalog."""
+        row = self._index.pop(item_id)
+        last = len(self._ids) - 1
+        # Move the last row into the freed slot to keep the arrays dense
+        if row != last:
+            moved = self._ids[last]
+            self._index[moved] = row
+            for column in self._columns():
+                column[row] = column[last]
+            item = self._live.get(last)
+            if item is not None:
+                self._live[row] = item
+            else:
+                self._live.pop(row, None)
+        self._live.pop(last, None)
+        for column in self._columns():
+            del column[last]
+
+    def __contains__(self, item_id: object) -> bool:
+        """Return True if the item ID is in the catalog."""
+        return item_id in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the item IDs in the catalog."""
+        return iter(self._ids)
+
+    def __len__(self) -> int:
+        """Return the number of items in the catalog."""
+        return len(self._ids)
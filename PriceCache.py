@@ -0,0 +1,66 @@
+"""Cache of final item prices, validated by item and discount versions."""
+from typing import Dict, Optional, Tuple
+from Item import Item
+from Discount import Discount
+
+# (item, item price version, discount, discount version, final price)
+_Entry = Tuple[Item, int, Optional[Discount], int, float]
+
+
+class PriceCache:
+    """
+    Remember the final price of each item ID.
+
+    An entry is only reused while the same item object still has the same
+    price version and the discounts dictionary still maps its ID to the
+    same discount object at the same version. Changing an item's original
+    price, or a discount's type or value, therefore only invalidates the
+    entry for that one item.
+    At most max_entries prices are kept; storing one more drops the oldest
+    stored entry, so the cache, and the items and discounts it refers to,
+    cannot grow with the number of item IDs ever priced.
+    Hits and misses are counted so the cache can be monitored.
+    """
+
+    def __init__(self, max_entries: int = 16384) -> None:
+        """Create an empty cache holding at most max_entries prices."""
+        if max_entries < 1:
+            raise ValueError('A price cache must hold at least 1 entry.')
+        self.max_entries = max_entries
+        self._entries: Dict[str, _Entry] = {}
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def lookup(self, item: Item, discount: Optional[Discount]
+               ) -> Optional[float]:
+        """Return the cached final price, or None if it is out of date."""
+        entry = self._entries.get(item.id)
+        if (entry is not None and entry[0] is item
+                and entry[1] == item.price_version and entry[2] is discount
+                and entry[3] == (discount.version if discount else -1)):
+            self.hits += 1
+            return entry[4]
+        self.misses += 1
+        return None
+
+    def store(self, item: Item, discount: Optional[Discount],
+              price: float) -> None:
+        """Remember the final price of an item under a discount."""
+        entries = self._entries
+        if item.id not in entries and len(entries) >= self.max_entries:
+            # Dictionaries keep insertion order, so the first key is oldest
+            del entries[next(iter(entries))]
+        entries[item.id] = (item, item.price_version, discount,
+                            discount.version if discount else -1, price)
+
+    def invalidate(self, item_id: Optional[str] = None) -> None:
+        """Forget one item's price, or every price if no ID is given."""
+        if item_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(item_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit, miss and entry counts."""
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self._entries)}
@@ -0,0 +1,82 @@
+"""Receipt and item list layout, compiled once and reused for every receipt."""
+from typing import Callable, Sequence, Tuple
+
+# Column widths of #, item name, quantity, unit price, discounts and final
+# price, as printed on the original MegaMart receipts.
+DEFAULT_WIDTHS: Tuple[int, ...] = (5, 30, 10, 20, 35, 20)
+
+
+def _escape(text: str) -> str:
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+class ReceiptLayout:
+    """
+    Fixed text and column formats of a receipt.
+
+    Borders, headings, padded blank columns and labels are built when the
+    layout is created, and the variable parts are left as str.format
+    templates, so rendering a receipt only formats the transaction's own
+    values. Create a new layout to change the store name or column widths.
+    """
+
+    def __init__(self, store_name: str = 'Monash MegaMart',
+                 widths: Sequence[int] = DEFAULT_WIDTHS):
+        """Compile the layout for a store name and six column widths."""
+        if len(widths) != 6:
+            raise ValueError('A receipt layout needs six column widths.')
+        self.store_name: str = store_name
+        self.widths: Tuple[int, ...] = tuple(widths)
+        number, name, quantity, unit, savings, final = self.widths
+
+        self.border: str = '='.join('=' * width for width in widths) + '\n'
+        self.item_header: str = (
+            '{:<{}} {:<{}} {:<{}} {:>{}} {:>{}} {:>{}}\n'.format(
+                '#', number, 'ITEM NAME', name, 'QUANTITY', quantity,
+                'UNIT PRICE ($)', unit, 'TOTAL DISCOUNTS APPLIED ($)',
+                savings, 'FINAL PRICE ($)', final))
+        # %-template of index, name, quantity, unit price, discounts and
+        # final price, with the unit price padded ahead of its ' each'
+        self.item_row: str = (
+            '%-{}s %-{}s %-{}s %{}.2f each %{}.2f %{}.2f\n'.format(
+                number, name, quantity, max(unit - 5, 0), savings, final))
+        # The same columns for a bundle applied at checkout: its name, the
+        # number of sets, a blank unit price, the saving and its negative
+        self.bundle_row: str = '%-{}s %-{}s %-{}s %{}s %{}.2f %{}.2f\n'.format(
+            number, name, quantity, unit, savings, final)
+
+        blank = ' ' * (number + name + quantity + unit + 4)
+        rule = '{}{:>{}}={}'.format(blank, '=' * (savings - 4), savings,
+                                    '=' * final)
+
+        def row(label: str, field: str, spec: str = '.2f') -> str:
+            return '{}{:>{}} {{{}:>{}{}}}\n'.format(blank, label, savings,
+                                                    field, final, spec)
+
+        self.totals: Callable[[float], str] = (
+            rule + '\n' + row('TOTAL PRICE ($)', '0') + rule).format
+
+        border = _escape(self.border)
+        self.heading: Callable[..., str] = (
+            border + _escape(store_name.upper()) + ' RECEIPT\n' + border
+            + 'Transaction time: {date} {time}\n'
+            'Fulfilment type: {fulfilment}\n').format
+        self.customer: Callable[..., str] = (
+            'Customer: {name}\nMembership #: {membership_number}\n').format
+        self.items_heading: str = self.border + 'Purchased items:\n'
+        self.summary: Callable[..., str] = (
+            '\n' + border
+            + row('SUBTOTAL ($)', 'subtotal')
+            + row('FULFILMENT SURCHARGE ($)', 'surcharge')
+            + row('ROUNDING ($)', 'rounding') + '\n'
+            + rule + '\n'
+            + row('FINAL TOTAL ($)', 'final_total')
+            + rule + '\n\n'
+            + row('PAYMENT METHOD', 'payment_method', '')
+            + row('AMOUNT TENDERED ($)', 'tendered')
+            + row('CHANGE ($)', 'change')
+            + row('# ITEMS PURCHASED', 'items_purchased', '') + '\n'
+            + row('MONEY SAVED WITH US ($)', 'saved')
+            + border + 'Thank you for shopping at '
+            + _escape(store_name) + ', please come again!\n'
+            + border).format
@@ -0,0 +1,235 @@
+"""Stock and purchase limit columns shared by many checkout processes."""
+import multiprocessing
+import threading
+from multiprocessing import shared_memory
+from typing import (Any, Dict, Iterator, List, Mapping, MutableMapping,
+                    Optional, Sequence, Tuple)
+from Transaction import Transaction
+from Bundle import Bundle
+from Item import Item
+
+from PurchaseLimitExceededException import PurchaseLimitExceededException
+
+from megamart import RenameR, checkout
+
+CatalogEntry = Tuple[Item, int, Optional[int]]
+
+# Purchase quantity limits are stored as integers, -1 meaning no limit.
+_NO_LIMIT = -1
+# Each row is three int64 cells: version, stock level, purchase limit
+_CELLS = 3
+
+
+class SharedStockTable(MutableMapping):
+    """
+    Map item IDs to (item, stock level, purchase quantity limit).
+
+    Stock levels and purchase quantity limits live in one shared memory
+    block that every attached process reads and writes, so all lanes see
+    the same stock. Item objects stay local to each process.
+
+    Rows are spread over a fixed number of process-shared lock stripes.
+    Writers hold a row's stripe lock and bump the row's version to odd
+    before changing it and back to even afterwards; readers never lock,
+    and retry until they see the same even version before and after
+    reading, so a row is never read half written.
+
+    checkout() locks every stripe a transaction touches, in ascending
+    order so two processes can never deadlock, then runs megamart's
+    checkout against the table, so the stock checks and the stock updates
+    of one transaction happen as one step. While it runs, write() and
+    compare_and_swap() on those rows, from the same thread, use the locks
+    it already holds. checkout() itself must not be nested, and raises
+    RuntimeError if it is.
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory,
+                 item_ids: List[str], items: Mapping[str, Item],
+                 locks: List[Any], owner: bool):
+        """Wrap a shared block; use create() or attach() instead."""
+        self._memory = memory
+        self._cells = memory.buf.cast('q')
+        self._ids = item_ids
+        self._rows: Dict[str, int] = {item_id: row for row, item_id
+                                      in enumerate(item_ids)}
+        self._items = items
+        self._locks = locks
+        self._owner = owner
+        self._held = threading.local()
+
+    @classmethod
+    def create(cls, items_dict: Mapping[str, CatalogEntry],
+               stripes: int = 1024) -> 'SharedStockTable':
+        """Return a new shared table holding an items dictionary's stock."""
+        item_ids = list(items_dict)
+        memory = shared_memory.SharedMemory(
+            create=True, size=max(1, len(item_ids)) * _CELLS * 8)
+        table = cls(memory, item_ids,
+                    {item_id: items_dict[item_id][0]
+                     for item_id in item_ids},
+                    [multiprocessing.Lock() for _ in range(stripes)], True)
+        cells = table._cells
+        for row, item_id in enumerate(item_ids):
+            _, stock, limit = items_dict[item_id]
+            base = row * _CELLS
+            cells[base] = 0
+            cells[base + 1] = stock
+            cells[base + 2] = _NO_LIMIT if limit is None else limit
+        return table
+
+    def handle(self, include_items: bool = True) -> Tuple[Any, ...]:
+        """
+        Return what a worker process needs to attach to this table.
+
+        Pass it to the worker as a Process or Pool initializer argument, so
+        the locks are inherited. Leave out the items if each worker loads
+        its own copy of the catalog.
+        """
+        return (self._memory.name, self._ids,
+                self._items if include_items else None, self._locks)
+
+    @classmethod
+    def attach(cls, handle: Tuple[Any, ...],
+               items: Optional[Mapping[str, Item]] = None
+               ) -> 'SharedStockTable':
+        """Return a view of an existing table, from its handle()."""
+        name, item_ids, handle_items, locks = handle
+        return cls(shared_memory.SharedMemory(name=name), item_ids,
+                   items if items is not None else handle_items, locks,
+                   False)
+
+    def _stripe(self, row: int) -> int:
+        return row % len(self._locks)
+
+    def _held_stripes(self) -> set:
+        held = getattr(self._held, 'stripes', None)
+        if held is None:
+            held = self._held.stripes = set()
+        return held
+
+    def read(self, item_id: str) -> Tuple[int, Optional[int]]:
+        """Return the stock level and purchase quantity limit of an item."""
+        cells = self._cells
+        base = self._rows[item_id] * _CELLS
+        while True:
+            version = cells[base]
+            if version & 1:
+                continue
+            stock, limit = cells[base + 1], cells[base + 2]
+            if cells[base] == version:
+                return stock, None if limit == _NO_LIMIT else limit
+
+    def _write(self, row: int, stock: int, limit: Optional[int]) -> None:
+        cells = self._cells
+        base = row * _CELLS
+        cells[base] += 1
+        cells[base + 1] = stock
+        cells[base + 2] = _NO_LIMIT if limit is None else limit
+        cells[base] += 1
+
+    def write(self, item_id: str, stock: int, limit: Optional[int]) -> None:
+        """Overwrite the stock level and purchase limit of an item."""
+        row = self._rows[item_id]
+        stripe = self._stripe(row)
+        if stripe in self._held_stripes():
+            self._write(row, stock, limit)
+            return
+        with self._locks[stripe]:
+            self._write(row, stock, limit)
+
+    def compare_and_swap(self, item_id: str,
+                         expected: Tuple[int, Optional[int]],
+                         new: Tuple[int, Optional[int]]) -> bool:
+        """
+        Write new stock and limit values only if the row still holds expected.
+
+        Returns True if the row was changed.
+        """
+        row = self._rows[item_id]
+        stripe = self._stripe(row)
+        if stripe in self._held_stripes():
+            return self._compare_and_swap(row, expected, new)
+        with self._locks[stripe]:
+            return self._compare_and_swap(row, expected, new)
+
+    def _compare_and_swap(self, row: int,
+                          expected: Tuple[int, Optional[int]],
+                          new: Tuple[int, Optional[int]]) -> bool:
+        if self.read(self._ids[row]) != tuple(expected):
+            return False
+        self._write(row, new[0], new[1])
+        return True
+
+    def __getitem__(self, item_id: str) -> CatalogEntry:
+        """Return the (item, stock, limit) tuple of an item ID."""
+        stock, limit = self.read(item_id)
+        return self._items[item_id], stock, limit
+
+    def __setitem__(self, item_id: str, entry: CatalogEntry) -> None:
+        """Store the stock level and limit of an existing item ID."""
+        if item_id not in self._rows:
+            raise KeyError(item_id)
+        self.write(item_id, entry[1], entry[2])
+
+    def __delitem__(self, item_id: str) -> None:
+        """Rows are fixed once the table is created."""
+        raise TypeError('Items cannot be removed from a shared stock table.')
+
+    def __contains__(self, item_id: object) -> bool:
+        """Return True if the item ID is in the table."""
+        return item_id in self._rows
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the item IDs in the table."""
+        return iter(self._ids)
+
+    def __len__(self) -> int:
+        """Return the number of items in the table."""
+        return len(self._ids)
+
+    def checkout(self, trans: Transaction, items_dict: Any = None,
+                 discounts_dict: Optional[RenameR] = None,
+                 bundles: Optional[Sequence[Bundle]] = None) -> Transaction:
+        """
+        Return the checked out transaction, holding its rows' locks.
+
+        Takes the same arguments as megamart.checkout so it can be passed to
+        terminal() as checkout_func, but items_dict is ignored: the stock
+        in the table is always used.
+        """
+        if trans is None:
+            raise PurchaseLimitExceededException("debug transaction")
+
+        stripes = sorted({self._stripe(self._rows[line.item.id])
+                          for line in trans.transaction_lines
+                          if line.item is not None
+                          and line.item.id in self._rows})
+        held = self._held_stripes()
+        if held:
+            # Taking a held stripe again would deadlock, and taking only
+            # the others would break the ascending lock order
+            raise RuntimeError('SharedStockTable.checkout cannot be nested.')
+        for stripe in stripes:
+            self._locks[stripe].acquire()
+            held.add(stripe)
+        try:
+            return checkout(trans, self, discounts_dict, bundles)
+        finally:
+            for stripe in reversed(stripes):
+                held.discard(stripe)
+                self._locks[stripe].release()
+
+    def close(self) -> None:
+        """Detach from the shared block, removing it if this table made it."""
+        self._cells.release()
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+    def __enter__(self) -> 'SharedStockTable':
+        """Return the table."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close the table."""
+        self.close()
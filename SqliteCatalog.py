@@ -0,0 +1,263 @@
+"""Items, customers and discounts stored in an SQLite database file."""
+import abc
+import sqlite3
+from collections import OrderedDict
+from typing import (Any, Dict, Iterable, Iterator, Mapping, MutableMapping,
+                    Optional, Tuple)
+from Item import Item
+from Customer import Customer
+from Discount import Discount
+from DiscountType import DiscountType
+
+CatalogEntry = Tuple[Item, int, Optional[int]]
+
+# Rows kept materialised per mapping, and stock changes held before writing
+DEFAULT_CACHE_SIZE = 65536
+DEFAULT_FLUSH_EVERY = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    original_price REAL NOT NULL,
+    categories TEXT NOT NULL,
+    stock INTEGER NOT NULL,
+    purchase_limit INTEGER
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS customers (
+    membership_number TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    date_of_birth TEXT,
+    id_verified INTEGER NOT NULL,
+    delivery_distance_km REAL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS discounts (
+    item_id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    value REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+_UPSERT_ITEM = 'INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?)'
+_INSERT_CUSTOMER = 'INSERT OR REPLACE INTO customers VALUES (?, ?, ?, ?, ?)'
+_INSERT_DISCOUNT = 'INSERT OR REPLACE INTO discounts VALUES (?, ?, ?)'
+
+# Cached marker for keys known to have no row
+_MISSING = object()
+
+
+def _item_row(entry: CatalogEntry) -> tuple:
+    item, stock, limit = entry
+    return (item.id, item.name, item.original_price,
+            '|'.join(item.categories), stock, limit)
+
+
+class _CachedView(Mapping):
+    """Read-only mapping that materialises rows on demand, LRU bounded."""
+
+    _query = ''
+
+    def __init__(self, connection: sqlite3.Connection, cache_size: int):
+        self._connection = connection
+        self._cache_size = cache_size
+        self._cache: 'OrderedDict[str, Any]' = OrderedDict()
+
+    @abc.abstractmethod
+    def _build(self, row: tuple) -> Any:
+        """Return the object stored in a row of the view's query."""
+
+    def _remember(self, key: str, value: Any) -> None:
+        self._cache[key] = value
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def __getitem__(self, key: str) -> Any:
+        value = self._cache.get(key)
+        if value is None:
+            row = self._connection.execute(self._query, (key,)).fetchone()
+            value = _MISSING if row is None else self._build(row)
+            self._remember(key, value)
+        else:
+            self._cache.move_to_end(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            self[key]  # pylint: disable=pointless-statement
+        except KeyError:
+            return False
+        return True
+
+
+class SqliteItems(_CachedView, MutableMapping):
+    """
+    Map item IDs to (item, stock level, purchase quantity limit).
+
+    Entries written back, as checkout does for every item it sells, are
+    held in memory and written to the database in batches of flush_every.
+    Reads always see the latest entry, written or not.
+    """
+
+    _query = 'SELECT * FROM items WHERE id = ?'
+
+    def __init__(self, connection: sqlite3.Connection, cache_size: int,
+                 flush_every: int):
+        """Read and write the items table of a connection."""
+        super().__init__(connection, cache_size)
+        self._flush_every = flush_every
+        self._dirty: Dict[str, CatalogEntry] = {}
+
+    def _build(self, row: tuple) -> CatalogEntry:
+        item_id, name, price, categories, stock, limit = row
+        return (Item(item_id, name, price,
+                     categories.split('|') if categories else []),
+                stock, limit)
+
+    def __getitem__(self, item_id: str) -> CatalogEntry:
+        """Return the (item, stock, limit) tuple of an item ID."""
+        entry = self._dirty.get(item_id)
+        if entry is not None:
+            return entry
+        return super().__getitem__(item_id)
+
+    def __setitem__(self, item_id: str, entry: CatalogEntry) -> None:
+        """Store an (item, stock, limit) tuple, writing it back later."""
+        if entry[0].id != item_id:
+            raise KeyError(item_id)
+        self._remember(item_id, entry)
+        self._dirty[item_id] = entry
+        if len(self._dirty) >= self._flush_every:
+            self.flush()
+
+    def __delitem__(self, item_id: str) -> None:
+        """Remove an item ID from the catalog."""
+        if item_id not in self:
+            raise KeyError(item_id)
+        self._dirty.pop(item_id, None)
+        self._remember(item_id, _MISSING)
+        with self._connection:
+            self._connection.execute('DELETE FROM items WHERE id = ?',
+                                     (item_id,))
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the item IDs in the catalog."""
+        self.flush()
+        for (item_id,) in self._connection.execute(
+                'SELECT id FROM items ORDER BY id'):
+            yield item_id
+
+    def __len__(self) -> int:
+        """Return the number of items in the catalog."""
+        self.flush()
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM items').fetchone()[0]
+
+    def flush(self) -> None:
+        """Write every pending entry to the database in one transaction."""
+        if not self._dirty:
+            return
+        with self._connection:
+            self._connection.executemany(
+                _UPSERT_ITEM, map(_item_row, self._dirty.values()))
+        self._dirty.clear()
+
+
+class _Customers(_CachedView):
+    _query = 'SELECT * FROM customers WHERE membership_number = ?'
+
+    def _build(self, row: tuple) -> Customer:
+        number, name, dob, verified, distance = row
+        return Customer(number, name, dob, bool(verified), distance)
+
+    def __iter__(self) -> Iterator[str]:
+        for (number,) in self._connection.execute(
+                'SELECT membership_number FROM customers'):
+            yield number
+
+    def __len__(self) -> int:
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM customers').fetchone()[0]
+
+
+class _Discounts(_CachedView):
+    _query = 'SELECT * FROM discounts WHERE item_id = ?'
+
+    def _build(self, row: tuple) -> Discount:
+        item_id, kind, value = row
+        return Discount(DiscountType[kind], value, item_id)
+
+    def __iter__(self) -> Iterator[str]:
+        for (item_id,) in self._connection.execute(
+                'SELECT item_id FROM discounts'):
+            yield item_id
+
+    def __len__(self) -> int:
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM discounts').fetchone()[0]
+
+
+class SqliteCatalog:
+    """
+    SQLite database of items, customers and discounts.
+
+    The items, customers and discounts attributes are mappings with the
+    same keys and values as megadata.items, megadata.customers and
+    megadata.discounts, so they can be passed straight to terminal() and
+    checkout(). Rows are only turned into objects when they are looked up,
+    and at most cache_size of each are kept. Call flush() or close() to
+    write any pending stock changes.
+    """
+
+    def __init__(self, path: str, cache_size: int = DEFAULT_CACHE_SIZE,
+                 flush_every: int = DEFAULT_FLUSH_EVERY):
+        """Open, or create, the database at path."""
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(_SCHEMA)
+        self.items = SqliteItems(self._connection, cache_size, flush_every)
+        self.customers: Mapping[str, Customer] = _Customers(
+            self._connection, cache_size)
+        self.discounts: Mapping[str, Discount] = _Discounts(
+            self._connection, cache_size)
+
+    @classmethod
+    def create(cls, path: str, items: Iterable[CatalogEntry] = (),
+               customers: Iterable[Customer] = (),
+               discounts: Iterable[Discount] = (),
+               **options: int) -> 'SqliteCatalog':
+        """
+        Return a catalog at path, loaded with the given records.
+
+        Records are streamed into the database, so generators such as
+        megadata_gen.generate_items can be used for very large catalogs.
+        """
+        catalog = cls(path, **options)
+        connection = catalog._connection
+        with connection:
+            connection.executemany(_UPSERT_ITEM, map(_item_row, items))
+            connection.executemany(_INSERT_CUSTOMER, (
+                (customer.membership_number, customer.name,
+                 customer.date_of_birth, int(bool(customer.id_verified)),
+                 customer.delivery_distance_km) for customer in customers))
+            connection.executemany(_INSERT_DISCOUNT, (
+                (discount.item_id, discount.type.name, discount.value)
+                for discount in discounts))
+        return catalog
+
+    def flush(self) -> None:
+        """Write pending stock changes to the database."""
+        self.items.flush()
+
+    def close(self) -> None:
+        """Write pending stock changes and close the database."""
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self) -> 'SqliteCatalog':
+        """Return the catalog."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close the catalog."""
+        self.close()
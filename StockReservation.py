@@ -0,0 +1,130 @@
+"""All-or-nothing stock reservation shared by concurrent checkout lanes."""
+from contextlib import contextmanager
+from threading import Lock
+from typing import (Dict, Iterable, Iterator, List, Optional, Sequence,
+                    Tuple)
+from Transaction import Transaction
+from TransactionLine import TransactionLine
+from Item import Item
+from Bundle import Bundle
+
+from InsufficientStockException import InsufficientStockException
+from PurchaseLimitExceededException import PurchaseLimitExceededException
+
+from megamart import ChanR, RenameR, checkout
+
+CatalogEntry = Tuple[Item, int, Optional[int]]
+
+# (item ID, stock taken, purchase limit taken, entry before reservation)
+_Taken = Tuple[str, int, int, CatalogEntry]
+
+
+class StockReservation:
+    """
+    Reserve the stock for whole transactions against one items dictionary.
+
+    Item IDs are spread over a fixed number of lock stripes. A reservation
+    locks every stripe its items fall on, always in ascending stripe order
+    so that two lanes can never deadlock, checks every item and only then
+    takes the stock for all of them. Either all lines are reserved or
+    none are.
+    """
+
+    def __init__(self, items_dict: ChanR, stripes: int = 64):
+        """Guard an items dictionary with the given number of lock stripes."""
+        self.items_dict: ChanR = items_dict
+        self._locks: List[Lock] = [Lock() for _ in range(stripes)]
+
+    def _stripes(self, item_ids: Iterable[str]) -> List[int]:
+        return sorted({hash(item_id) % len(self._locks)
+                       for item_id in item_ids})
+
+    @contextmanager
+    def _locked(self, item_ids: Iterable[str]) -> Iterator[None]:
+        stripes = self._stripes(item_ids)
+        for stripe in stripes:
+            self._locks[stripe].acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self._locks[stripe].release()
+
+    def reserve(self, lines: Iterable[TransactionLine]) -> List[_Taken]:
+        """
+        Take the stock for every line and return what was taken.
+
+        Quantities of repeated items are added together. Stock levels and
+        purchase quantity limits are decremented the same way checkout
+        decrements them.
+        If any item is missing, out of stock or over its purchase quantity
+        limit, nothing is taken and the matching Exception is raised.
+        """
+        wanted: Dict[str, int] = {}
+        for line in lines:
+            if line.quantity is None or line.quantity < 1:
+                raise InsufficientStockException()
+            wanted[line.item.id] = wanted.get(line.item.id, 0) + line.quantity
+
+        i_d = self.items_dict
+        with self._locked(wanted):
+            for item_id, qty in wanted.items():
+                if item_id not in i_d or qty > i_d[item_id][1]:
+                    raise InsufficientStockException("debug no stock")
+                limit = i_d[item_id][2]
+                if limit and qty > limit:
+                    raise PurchaseLimitExceededException(
+                        "debug quantity limit ")
+
+            taken: List[_Taken] = []
+            for item_id, qty in wanted.items():
+                entry = i_d[item_id]
+                limit_taken = qty if entry[2] else 0
+                i_d[item_id] = (entry[0], entry[1] - qty,
+                                entry[2] - limit_taken if entry[2]
+                                else entry[2])
+                taken.append((item_id, qty, limit_taken, entry))
+            return taken
+
+    def release(self, taken: List[_Taken]) -> None:
+        """Give back stock and purchase limits taken by reserve."""
+        i_d = self.items_dict
+        with self._locked(taken_item[0] for taken_item in taken):
+            for item_id, qty, limit_taken, _ in taken:
+                entry = i_d[item_id]
+                limit: Optional[int] = entry[2]
+                i_d[item_id] = (entry[0], entry[1] + qty,
+                                limit + limit_taken if limit_taken else limit)
+
+    @contextmanager
+    def reserved(self, lines: Iterable[TransactionLine]
+                 ) -> Iterator[List[_Taken]]:
+        """
+        Reserve stock for the lines for the duration of a with block.
+
+        If the block raises, the reserved stock is given back.
+        """
+        taken = self.reserve(lines)
+        try:
+            yield taken
+        except BaseException:
+            self.release(taken)
+            raise
+
+    def checkout(self, trans: Transaction, d_d: RenameR,
+                 bundles: Optional[Sequence[Bundle]] = None) -> Transaction:
+        """
+        Return the checked out transaction, with its stock reserved first.
+
+        The stock for the whole transaction is reserved up front, then
+        checkout runs against the reserved entries only. If checkout raises
+        for any reason, the reservation is rolled back so the shared items
+        dictionary is left as it was.
+        """
+        if trans is None:
+            raise PurchaseLimitExceededException("debug transaction")
+
+        with self.reserved(trans.transaction_lines) as taken:
+            reserved_items = {item_id: entry
+                              for item_id, _, _, entry in taken}
+            return checkout(trans, reserved_items, d_d, bundles)
@@ -1,33 +1,143 @@
-from typing import List, Optional
+from typing import Dict, List, Mapping, Optional, Tuple
 from TransactionLine import TransactionLine
 from Customer import Customer
 from FulfilmentType import FulfilmentType
 from PaymentMethod import PaymentMethod
 from datetime import datetime
+from Bundle import Bundle
+from Discount import Discount
+from DiscountType import DiscountType
+
+# (item price version, discount type and value or None, final price and
+# savings per unit) a line's running totals were worked out with
+LineStamp = Tuple[int, Optional[Tuple[DiscountType, float]], float, float]
+
+
+def _discount_terms(discount: Optional[Discount]) -> Optional[Tuple[DiscountType, float]]:
+  # Compared by value, so a catalog that builds a new Discount on each lookup still matches
+  return None if discount is None else (discount.type, discount.value)
 
 
 
 class Transaction:
-  date: Optional[str] = None # format: dd/mm/YYYY e.g. 01/08/2023
-  time: Optional[str] = None # format: HH:MM:SS e.g. 12:45:00
-  transaction_lines: List[TransactionLine] = []
-  customer: Optional[Customer] = None
-  fulfilment_type: Optional[FulfilmentType] = None
-  payment_method: Optional[PaymentMethod] = None
-  amount_tendered: Optional[float] = None
-  
-  total_items_purchased: Optional[int] = None
-  all_items_subtotal: Optional[float] = None
-  fulfilment_surcharge_amount: Optional[float] = None
-  rounding_amount_applied: Optional[float] = None
-  final_total: Optional[float] = None
-  change_amount: Optional[float] = None
-  amount_saved: Optional[float] = None
-
-  finalised: bool = False
+  __slots__ = ('date', 'time', 'date_as_datetime', 'transaction_lines', 'customer', 'fulfilment_type', 'payment_method', 'amount_tendered',
+               'total_items_purchased', 'all_items_subtotal', 'fulfilment_surcharge_amount', 'rounding_amount_applied', 'final_total',
+               'change_amount', 'amount_saved', 'finalised', 'applied_bundles',
+               'item_count', 'running_subtotal', 'running_savings', 'sku_quantities', 'line_index', 'line_stamps', '_tracked_lines', '_tracked_count')
 
   def __init__(self, date: str, time: str):
-    self.date: str = date
-    self.time: str = time
+    self.date: str = date # format: dd/mm/YYYY e.g. 01/08/2023
+    self.time: str = time # format: HH:MM:SS e.g. 12:45:00
 
     self.date_as_datetime = datetime.strptime(date, "%d/%m/%Y")
+
+    # Every transaction owns its own list of lines
+    self.transaction_lines: List[TransactionLine] = []
+    self.customer: Optional[Customer] = None
+    self.fulfilment_type: Optional[FulfilmentType] = None
+    self.payment_method: Optional[PaymentMethod] = None
+    self.amount_tendered: Optional[float] = None
+
+    self.total_items_purchased: Optional[int] = None
+    self.all_items_subtotal: Optional[float] = None
+    self.fulfilment_surcharge_amount: Optional[float] = None
+    self.rounding_amount_applied: Optional[float] = None
+    self.final_total: Optional[float] = None
+    self.change_amount: Optional[float] = None
+    self.amount_saved: Optional[float] = None
+
+    self.finalised: bool = False
+    # (bundle, number of sets, amount saved per set) chosen at checkout
+    self.applied_bundles: List[Tuple[Bundle, int, float]] = []
+
+    # Running totals of the lines added through add_line and removed through
+    # remove_line, kept up to date in O(1) per change
+    self.item_count: int = 0
+    self.running_subtotal: float = 0.00
+    self.running_savings: float = 0.00
+    self.sku_quantities: Dict[str, int] = {}
+    # The one line holding each item ID, so repeat scans add to it
+    self.line_index: Dict[str, TransactionLine] = {}
+    # What each item ID's line was priced with, or None if repeat scans of
+    # it were priced differently
+    self.line_stamps: Dict[str, Optional[LineStamp]] = {}
+    self._tracked_lines: List[TransactionLine] = self.transaction_lines
+    self._tracked_count: int = 0
+
+  def totals_current(self) -> bool:
+    # False once transaction_lines has been replaced, or changed other than
+    # through add_line and remove_line
+    return self._tracked_lines is self.transaction_lines and self._tracked_count == len(self.transaction_lines)
+
+  def totals_priced(self, discounts_dict: Mapping[str, Discount]) -> bool:
+    # True while the running totals cover every line at its item's current
+    # price, under the discount discounts_dict now gives it
+    if not self.totals_current():
+      return False
+    for (item_id, stamp) in self.line_stamps.items():
+      if stamp is None or self.line_index[item_id].item.price_version != stamp[0] or _discount_terms(discounts_dict.get(item_id)) != stamp[1]:
+        return False
+    return True
+
+  def timestamp(self) -> datetime:
+    # Date and time of the transaction, which decide the discounts in effect
+    hours, minutes, seconds = (int(part) for part in self.time.split(':'))
+    return self.date_as_datetime.replace(hour=hours, minute=minutes, second=seconds)
+
+  def add_line(self, transaction_line: TransactionLine, final_price: float, savings: float, discount: Optional[Discount] = None) -> TransactionLine:
+    # final_price and savings are per unit, as calculated when the item was
+    # scanned with discount. A repeat scan of an item already in the transaction is merged
+    # into its existing line, which is returned.
+    transaction_line.final_cost = final_price * transaction_line.quantity
+    transaction_line.amount_saved = savings * transaction_line.quantity
+
+    if not self.totals_current():
+      self.transaction_lines.append(transaction_line)
+      return transaction_line
+
+    item_id = transaction_line.item.id
+    self.item_count += transaction_line.quantity
+    self.running_subtotal += transaction_line.final_cost
+    self.running_savings += transaction_line.amount_saved
+    self.sku_quantities[item_id] = self.sku_quantities.get(item_id, 0) + transaction_line.quantity
+
+    existing = self.line_index.get(item_id)
+    if existing is not None:
+      stamp = self.line_stamps[item_id]
+      if stamp is not None and (stamp[2], stamp[3]) != (final_price, savings):
+        self.line_stamps[item_id] = None
+      existing.quantity += transaction_line.quantity
+      existing.final_cost += transaction_line.final_cost
+      existing.amount_saved += transaction_line.amount_saved
+      return existing
+
+    self.line_index[item_id] = transaction_line
+    self.line_stamps[item_id] = (transaction_line.item.price_version, _discount_terms(discount), final_price, savings)
+    self._tracked_count += 1
+    self.transaction_lines.append(transaction_line)
+    return transaction_line
+
+  def remove_line(self, line_number: int) -> TransactionLine:
+    # line_number counts from 1, as shown in the item list
+    tracked = self.totals_current()
+    transaction_line = self.transaction_lines.pop(line_number - 1)
+    if not tracked:
+      return transaction_line
+
+    self._tracked_count -= 1
+    if self._tracked_count == 0:
+      # Start again from exact zeros rather than carrying rounding errors
+      self.item_count, self.running_subtotal, self.running_savings = 0, 0.00, 0.00
+      self.sku_quantities.clear()
+      self.line_index.clear()
+      self.line_stamps.clear()
+      return transaction_line
+
+    item_id = transaction_line.item.id
+    self.item_count -= transaction_line.quantity
+    self.running_subtotal -= transaction_line.final_cost
+    self.running_savings -= transaction_line.amount_saved
+    del self.sku_quantities[item_id]
+    del self.line_index[item_id]
+    del self.line_stamps[item_id]
+    return transaction_line
@@ -2,8 +2,11 @@ from typing import Optional
 from Item import Item
 
 class TransactionLine:
-  final_cost: Optional[float]
+  __slots__ = ('item', 'quantity', 'final_cost', 'amount_saved')
 
   def __init__(self, item: Item, quantity: int):
     self.item: Item = item
     self.quantity: int = quantity
+    # Price of the whole line and its discount savings, once it has been priced
+    self.final_cost: Optional[float] = None
+    self.amount_saved: Optional[float] = None
@@ -0,0 +1,2 @@
+# Usage: sh bench.sh [--compare previous.json] [--catalog-sizes 10,1000,10000000]
+python bench_megamart.py --output bench_results.json "$@"
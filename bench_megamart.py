@@ -0,0 +1,254 @@
+"""Benchmark suite for the megamart functions, checkout and receipts.
+
+Times purchase_not_allow, get_purch_quantity_limit, is_stock_suff,
+calculate_final_item_price, calculate_item_savings, cfs,
+round_off_subtotal and checkout_many over a range of catalog sizes,
+checkout and generate_receipt over a range of cart sizes, and the cold
+start of main.py. Results are written as JSON and can be compared against
+an earlier run to flag regressions; a cold start slower than the budget
+fails the run.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from Item import Item
+from Customer import Customer
+from Discount import Discount
+from DiscountType import DiscountType
+from FulfilmentType import FulfilmentType
+from PaymentMethod import PaymentMethod
+from Transaction import Transaction
+from TransactionLine import TransactionLine
+
+import megamart
+import megamart_base
+import megamart_batch
+import megamart_startup
+
+CATALOG_SIZES = [10, 1000, 100000]
+CART_SIZES = [1, 10, 100, 1000, 10000]
+# Fraction by which a result may be slower than the baseline before it is
+# reported as a regression.
+THRESHOLD = 0.20
+
+_CATEGORIES = ['Confectionery', 'Biscuits', 'Coffee', 'Drinks', 'Household',
+               'Cleaning', 'Alcohol', 'Knives', 'Cooking', 'Fruit']
+
+
+def build_catalog(size: int, seed: int = 0) -> Dict[str, Any]:
+    """Return items and discounts dictionaries with the given item count."""
+    rng = random.Random(seed)
+    items = {}
+    discounts = {}
+    for number in range(size):
+        item_id = str(number)
+        item = Item(item_id, 'Item {}'.format(number),
+                    round(rng.uniform(0.5, 50), 2),
+                    rng.sample(_CATEGORIES, rng.randint(1, 3)))
+        # Stock is effectively unlimited so repeated checkouts never run out
+        items[item_id] = (item, 10 ** 12, None)
+        if number % 4 == 0:
+            discounts[item_id] = Discount(DiscountType.PERCENTAGE,
+                                          rng.randint(1, 50), item_id)
+        elif number % 4 == 1:
+            discounts[item_id] = Discount(DiscountType.FLAT, 0.25, item_id)
+    return {'items': items, 'discounts': discounts}
+
+
+def build_transaction(catalog: Dict[str, Any], lines: int,
+                      seed: int = 0) -> Transaction:
+    """Return a finalised cash delivery transaction with the given lines."""
+    rng = random.Random(seed)
+    items = list(catalog['items'].values())
+    trans = Transaction('02/08/2023', '12:00:00')
+    trans.customer = Customer('1', 'Bench', '01/01/1990', True, 12)
+    trans.fulfilment_type = FulfilmentType.DELIVERY
+    trans.payment_method = PaymentMethod.CASH
+    trans.transaction_lines = [
+        TransactionLine(rng.choice(items)[0], rng.randint(1, 3))
+        for _ in range(lines)]
+    trans.amount_tendered = 10 ** 9
+    trans.change_amount = 0
+    trans.finalised = True
+    return trans
+
+
+def time_call(func: Callable[[], Any], min_time: float = 0.2,
+              repeat: int = 3) -> float:
+    """Return the best time per call of func, in seconds."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeat or number >= 1 << 24:
+            break
+        number *= 2
+
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def _cycle(values: List[Any]) -> Callable[[], Any]:
+    state = {'next': 0}
+
+    def take() -> Any:
+        value = values[state['next']]
+        state['next'] = (state['next'] + 1) % len(values)
+        return value
+    return take
+
+
+def catalog_benchmarks(size: int, min_time: float) -> Dict[str, float]:
+    """Return the time per call of each function for one catalog size."""
+    catalog = build_catalog(size)
+    items_dict, discounts = catalog['items'], catalog['discounts']
+    rng = random.Random(size)
+    sample = [items_dict[str(rng.randrange(size))][0] for _ in range(1024)]
+    item = _cycle(sample)
+    customer = Customer('1', 'Bench', '01/01/1990', True, 12)
+    batch = [build_transaction(catalog, 10, seed) for seed in range(100)]
+
+    cases: Dict[str, Callable[[], Any]] = {
+        'purchase_not_allow': lambda: megamart.purchase_not_allow(
+            item(), customer, '02/08/2023'),
+        'get_purch_quantity_limit': lambda: megamart.get_purch_quantity_limit(
+            item(), items_dict),
+        'is_stock_suff': lambda: megamart.is_stock_suff(item(), 2,
+                                                        items_dict),
+        'calculate_final_item_price':
+            lambda: megamart.calculate_final_item_price(item(), discounts),
+        'calculate_item_savings': lambda: megamart.calculate_item_savings(
+            item().original_price, 0.25),
+        'cfs': lambda: megamart.cfs(FulfilmentType.DELIVERY, customer),
+        'round_off_subtotal': lambda: megamart.round_off_subtotal(
+            item().original_price * 3, PaymentMethod.CASH),
+        'checkout_many':
+            lambda: megamart_batch.checkout_many(batch, items_dict,
+                                                 discounts),
+        # The same batch through checkout one transaction at a time, the
+        # baseline checkout_many is measured against
+        'checkout_loop': lambda: [megamart.checkout(trans, items_dict,
+                                                    discounts)
+                                  for trans in batch],
+    }
+    batch_name = '{}[catalog={{}},transactions=100,lines=10]'
+    names = {'checkout_many': batch_name.format('checkout_many'),
+             'checkout_loop': batch_name.format('checkout_loop')}
+    return {names.get(name, name + '[catalog={}]').format(size):
+            time_call(func, min_time) for name, func in cases.items()}
+
+
+def cart_benchmarks(lines: int, min_time: float) -> Dict[str, float]:
+    """Return the time per call of checkout and receipts for one cart size."""
+    catalog = build_catalog(1000)
+    trans = build_transaction(catalog, lines)
+    items_dict, discounts = catalog['items'], catalog['discounts']
+    megamart.checkout(trans, items_dict, discounts)
+
+    cases: Dict[str, Callable[[], Any]] = {
+        'checkout': lambda: megamart.checkout(trans, items_dict, discounts),
+        'generate_receipt': lambda: megamart_base.generate_receipt(
+            trans, discounts),
+    }
+    return {'{}[lines={}]'.format(name, lines): time_call(func, min_time)
+            for name, func in cases.items()}
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float],
+            threshold: float) -> List[str]:
+    """Return a line for every benchmark slower than the baseline allows."""
+    regressions = []
+    for name, seconds in sorted(results.items()):
+        before = baseline.get(name)
+        if before and seconds > before * (1 + threshold):
+            regressions.append('{}: {:.3g}s -> {:.3g}s ({:+.0%})'.format(
+                name, before, seconds, seconds / before - 1))
+    return regressions
+
+
+def cold_start_benchmarks(runs: int) -> Dict[str, float]:
+    """Return the fastest time for main.py to reach the main menu."""
+    return {'cold_start[main.py]': megamart_startup.measure_cold_start(runs)}
+
+
+def run(catalog_sizes: List[int], cart_sizes: List[int],
+        min_time: float, cold_starts: int = 5) -> Dict[str, Any]:
+    """Return the benchmark report for the given sizes."""
+    results: Dict[str, float] = {}
+    for size in catalog_sizes:
+        results.update(catalog_benchmarks(size, min_time))
+    for lines in cart_sizes:
+        results.update(cart_benchmarks(lines, min_time))
+    if cold_starts:
+        results.update(cold_start_benchmarks(cold_starts))
+    return {'meta': {'python': sys.version.split()[0],
+                     'platform': platform.platform(),
+                     'created': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results}
+
+
+def _sizes(text: str) -> List[int]:
+    return [int(size) for size in text.split(',') if size]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the benchmarks, save them and report any regressions."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--catalog-sizes', type=_sizes,
+                        default=CATALOG_SIZES,
+                        help='comma separated, e.g. 10,1000,10000000')
+    parser.add_argument('--cart-sizes', type=_sizes, default=CART_SIZES,
+                        help='comma separated, e.g. 1,10,10000')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='seconds to spend timing each benchmark')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--compare', help='JSON report of an earlier run')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--cold-starts', type=int, default=5,
+                        help='fresh main.py starts to time, 0 to skip')
+    parser.add_argument('--cold-start-budget', type=float,
+                        default=megamart_startup.COLD_START_BUDGET,
+                        help='seconds main.py may take to reach the menu')
+    args = parser.parse_args(argv)
+
+    report = run(args.catalog_sizes, args.cart_sizes, args.min_time,
+                 args.cold_starts)
+    for name, seconds in report['results'].items():
+        print('{:<60} {:>12.3f} us'.format(name, seconds * 1e6))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+
+    status = 0
+    cold_start = report['results'].get('cold_start[main.py]')
+    if cold_start is not None and cold_start > args.cold_start_budget:
+        print('OVER BUDGET cold_start[main.py]: {:.3f}s > {:.3f}s'.format(
+            cold_start, args.cold_start_budget))
+        status = 1
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as earlier:
+            baseline = json.load(earlier)['results']
+        regressions = compare(report['results'], baseline, args.threshold)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Contention benchmark for StockReservation with 1 to 32 checkout lanes."""
+import argparse
+import random
+import time
+from threading import Barrier, Thread
+from typing import Dict, List
+
+from Item import Item
+from Customer import Customer
+from Discount import Discount
+from DiscountType import DiscountType
+from FulfilmentType import FulfilmentType
+from PaymentMethod import PaymentMethod
+from Transaction import Transaction
+from TransactionLine import TransactionLine
+
+from StockReservation import StockReservation
+
+
+def _make_transactions(items: List[Item], count: int, lines: int,
+                       seed: int) -> List[Transaction]:
+    rng = random.Random(seed)
+    customer = Customer('1', 'Bench', '01/01/1990', True, 10)
+    transactions = []
+    for _ in range(count):
+        trans = Transaction('02/08/2023', '12:00:00')
+        trans.customer = customer
+        trans.fulfilment_type = FulfilmentType.PICKUP
+        trans.payment_method = PaymentMethod.CREDIT
+        trans.transaction_lines = [
+            TransactionLine(rng.choice(items), rng.randint(1, 3))
+            for _ in range(lines)]
+        transactions.append(trans)
+    return transactions
+
+
+def run(threads: int, skus: int, per_thread: int, lines: int,
+        stripes: int) -> Dict[str, float]:
+    """Return the checkout throughput of the given number of lanes."""
+    items = [Item(str(i), 'Item {}'.format(i), 1.0 + i % 20, ['Food'])
+             for i in range(skus)]
+    items_dict = {item.id: (item, 10 ** 9, None) for item in items}
+    discounts = {item.id: Discount(DiscountType.PERCENTAGE, 10, item.id)
+                 for item in items[::4]}
+    reservation = StockReservation(items_dict, stripes)
+    work = [_make_transactions(items, per_thread, lines, seed)
+            for seed in range(threads)]
+    barrier = Barrier(threads + 1)
+
+    def lane(transactions: List[Transaction]) -> None:
+        barrier.wait()
+        for trans in transactions:
+            reservation.checkout(trans, discounts)
+
+    workers = [Thread(target=lane, args=(transactions,))
+               for transactions in work]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    done = threads * per_thread
+    return {'threads': threads, 'transactions': done, 'seconds': elapsed,
+            'per_second': done / elapsed}
+
+
+def main() -> None:
+    """Print throughput for 1, 2, 4, 8, 16 and 32 threads."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--skus', type=int, default=1000)
+    parser.add_argument('--per-thread', type=int, default=2000)
+    parser.add_argument('--lines', type=int, default=10)
+    parser.add_argument('--stripes', type=int, default=64)
+    args = parser.parse_args()
+
+    print('{:>8} {:>14} {:>10} {:>12}'.format(
+        'threads', 'transactions', 'seconds', 'per second'))
+    for threads in (1, 2, 4, 8, 16, 32):
+        result = run(threads, args.skus, args.per_thread, args.lines,
+                     args.stripes)
+        print('{threads:>8} {transactions:>14} {seconds:>10.3f} '
+              '{per_second:>12.0f}'.format(**result))
+
+
+if __name__ == '__main__':
+    main()
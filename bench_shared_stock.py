@@ -0,0 +1,85 @@
+"""Multi-process checkout benchmark for SharedStockTable, 1 to 16 lanes."""
+import argparse
+import multiprocessing
+import time
+from typing import Any, Dict, Tuple
+
+from Item import Item
+from Discount import Discount
+from DiscountType import DiscountType
+
+from bench_reservation import _make_transactions
+from SharedStockTable import SharedStockTable
+
+
+def _lane(handle: Tuple[Any, ...], discounts: Dict[str, Discount],
+          per_lane: int, lines: int, seed: int, start: Any,
+          sold: Any) -> None:
+    table = SharedStockTable.attach(handle)
+    items = [table[item_id][0] for item_id in table]
+    transactions = _make_transactions(items, per_lane, lines, seed)
+    units = 0
+    start.wait()
+    for trans in transactions:
+        try:
+            table.checkout(trans, None, discounts)
+        except Exception:  # pylint: disable=broad-except
+            continue
+        units += trans.total_items_purchased
+    with sold.get_lock():
+        sold.value += units
+    table.close()
+
+
+def run(processes: int, skus: int, per_lane: int, lines: int,
+        stock: int) -> Dict[str, float]:
+    """Return the checkout throughput of the given number of processes."""
+    items = [Item(str(i), 'Item {}'.format(i), 1.0 + i % 20, ['Food'])
+             for i in range(skus)]
+    discounts = {item.id: Discount(DiscountType.PERCENTAGE, 10, item.id)
+                 for item in items[::4]}
+    with SharedStockTable.create(
+            {item.id: (item, stock, None) for item in items}) as table:
+        start = multiprocessing.Barrier(processes + 1)
+        sold = multiprocessing.Value('q', 0)
+        workers = [multiprocessing.Process(
+            target=_lane, args=(table.handle(), discounts, per_lane, lines,
+                                seed, start, sold))
+                   for seed in range(processes)]
+        for worker in workers:
+            worker.start()
+        start.wait()
+        began = time.perf_counter()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - began
+
+        remaining = sum(table[item_id][1] for item_id in table)
+        if remaining != skus * stock - sold.value or remaining < 0:
+            raise AssertionError('Stock levels do not match units sold.')
+
+    done = processes * per_lane
+    return {'processes': processes, 'transactions': done,
+            'seconds': elapsed, 'per_second': done / elapsed}
+
+
+def main() -> None:
+    """Print throughput for 1, 2, 4, 8 and 16 processes."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--skus', type=int, default=1000)
+    parser.add_argument('--per-lane', type=int, default=2000)
+    parser.add_argument('--lines', type=int, default=10)
+    parser.add_argument('--stock', type=int, default=10 ** 6)
+    args = parser.parse_args()
+
+    print('{:>9} {:>14} {:>10} {:>12}'.format(
+        'processes', 'transactions', 'seconds', 'per second'))
+    for processes in (1, 2, 4, 8, 16):
+        result = run(processes, args.skus, args.per_lane, args.lines,
+                     args.stock)
+        print('{processes:>9} {transactions:>14} {seconds:>10.3f} '
+              '{per_second:>12.0f}'.format(**result))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,85 @@
-import megadata  
-import megamart_base
-    
+import io
+import sys
+from megamart_startup import LazyMapping, StartupProfiler
+
+# Options handled without argparse, so a plain kiosk start never imports it
+STARTUP_FLAGS = ('--profile-startup', '--exit-after-startup')
+
+
+def megadata_mapping(name: str) -> LazyMapping:
+  # The sample catalog is only imported and built when the terminal first uses it
+  def load():
+    import megadata
+    return getattr(megadata, name)
+
+  return LazyMapping(load)
+
+
 if __name__ == "__main__":
-  megamart_base.terminal(megadata.items, megadata.discounts, megadata.customers)
+  profiler = StartupProfiler() if '--profile-startup' in sys.argv else None
+  if profiler:
+    profiler.start()
+
+  args = None
+  if any(arg not in STARTUP_FLAGS for arg in sys.argv[1:]):
+    import argparse
+    parser = argparse.ArgumentParser(description='Monash MegaMart terminal')
+    parser.add_argument('--connect', metavar='HOST:PORT', help='use a megamart_server checkout service instead of the local catalog')
+    parser.add_argument('--unix', metavar='PATH', help='use a megamart_server checkout service on a Unix socket')
+    parser.add_argument('--catalog', metavar='PATH', help='use an SQLite catalog file, created from megadata if it does not exist')
+    parser.add_argument('--journal', metavar='PATH', help='append finalised transactions and their stock changes to a journal file')
+    parser.add_argument('--profile-startup', action='store_true', help='print import times and startup phases to stderr')
+    parser.add_argument('--exit-after-startup', action='store_true', help='exit once the terminal is ready, for timing cold starts')
+    args = parser.parse_args()
+
+  if profiler:
+    profiler.mark('arguments parsed')
+
+  import megamart_base
+
+  if profiler:
+    profiler.mark('terminal imported')
+
+  checkout_func = None
+  close = None
+  if args and (args.connect or args.unix):
+    import megamart_client
+    host, _, port = (args.connect or '').rpartition(':')
+    client = megamart_client.CheckoutClient(host or '127.0.0.1', int(port or 8765), args.unix)
+    items, discounts, customers = client.items, client.discounts, client.customers
+    checkout_func, close = client.checkout, client.close
+  elif args and args.catalog:
+    import os
+    from SqliteCatalog import SqliteCatalog
+    if os.path.exists(args.catalog):
+      catalog = SqliteCatalog(args.catalog)
+    else:
+      import megadata
+      catalog = SqliteCatalog.create(args.catalog, megadata.items.values(), megadata.customers.values(), megadata.discounts.values())
+    items, discounts, customers, close = catalog.items, catalog.discounts, catalog.customers, catalog.close
+  else:
+    items, discounts, customers = megadata_mapping('items'), megadata_mapping('discounts'), megadata_mapping('customers')
+
+  journal = None
+  if args and args.journal:
+    from megamart_journal import TransactionJournal
+    journal = TransactionJournal(args.journal)
+
+  if profiler:
+    profiler.mark('catalog opened')
+    profiler.stop()
+    print(profiler.report(), file=sys.stderr)
+
+  try:
+    if '--exit-after-startup' in sys.argv:
+      # Start the terminal with no input, so it stops at the main menu's first prompt
+      sys.stdin = io.StringIO()
+    megamart_base.terminal(items, discounts, customers, checkout_func=checkout_func, journal=journal)
+  except EOFError:
+    if '--exit-after-startup' not in sys.argv:
+      raise
+  finally:
+    if journal:
+      journal.close()
+    if close:
+      close()
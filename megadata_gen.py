@@ -0,0 +1,302 @@
+"""Deterministic synthetic catalog, customer and transaction data.
+
+Generates any number of items, customers, discounts and transactions from
+a seed, streaming them to files in a dataset directory so that nothing is
+held in memory while writing:
+
+    items.csv          id, name, original_price, categories, stock, limit
+    customers.csv      membership_number, name, date_of_birth, id_verified,
+                       delivery_distance_km
+    discounts.csv      item_id, type, value
+    transactions.jsonl one transaction per line
+
+The load functions read the files back into the same dictionary shapes as
+megadata.items, megadata.customers and megadata.discounts, building each
+dictionary straight from the file rows.
+"""
+import argparse
+import csv
+import inspect
+import json
+import os
+import random
+from datetime import date, timedelta
+from typing import (Any, Callable, Dict, Iterator, List, Mapping,
+                    MutableMapping, Optional, Tuple)
+from Item import Item
+from Customer import Customer
+from Discount import Discount
+from DiscountType import DiscountType
+from FulfilmentType import FulfilmentType
+from PaymentMethod import PaymentMethod
+from Transaction import Transaction
+from TransactionLine import TransactionLine
+
+from ItemCatalog import ItemCatalog
+
+ITEMS_FILE = 'items.csv'
+CUSTOMERS_FILE = 'customers.csv'
+DISCOUNTS_FILE = 'discounts.csv'
+TRANSACTIONS_FILE = 'transactions.jsonl'
+
+# Unrestricted categories and their relative weights
+CATEGORY_MIX: Dict[str, float] = {
+    'Confectionery': 3, 'Biscuits': 2, 'Coffee': 1, 'Drinks': 4,
+    'Household': 2, 'Cleaning': 2, 'Cooking': 2, 'Fruit': 3, 'Dairy': 3,
+    'Bakery': 2,
+}
+RESTRICTED_CATEGORIES: List[str] = ['Alcohol', 'Tobacco', 'Knives']
+
+ItemEntry = Tuple[Item, int, Optional[int]]
+
+
+def generate_items(count: int, rng: random.Random,
+                   category_mix: Optional[Mapping[str, float]] = None,
+                   restricted_ratio: float = 0.05,
+                   limit_ratio: float = 0.1,
+                   max_stock: int = 500) -> Iterator[ItemEntry]:
+    """
+    Yield (item, stock level, purchase quantity limit) tuples.
+
+    Each item has one to three categories drawn from the weighted category
+    mix, plus one restricted category for restricted_ratio of the items.
+    limit_ratio of the items get a purchase quantity limit.
+    """
+    mix = category_mix or CATEGORY_MIX
+    names, weights = list(mix), list(mix.values())
+    for number in range(1, count + 1):
+        categories = list(dict.fromkeys(
+            rng.choices(names, weights, k=rng.randint(1, 3))))
+        if rng.random() < restricted_ratio:
+            categories.append(rng.choice(RESTRICTED_CATEGORIES))
+        limit = rng.randint(1, 5) if rng.random() < limit_ratio else None
+        yield (Item(str(number), '{} {}'.format(categories[0], number),
+                    round(rng.uniform(0.5, 60), 2), categories),
+               rng.randint(0, max_stock), limit)
+
+
+def generate_customers(count: int, rng: random.Random,
+                       purchase_date: date = date(2023, 8, 1),
+                       min_age: int = 12, max_age: int = 90,
+                       dob_missing_ratio: float = 0.1,
+                       unverified_ratio: float = 0.1,
+                       mean_distance_km: float = 12.0,
+                       distance_missing_ratio: float = 0.2
+                       ) -> Iterator[Customer]:
+    """
+    Yield customers with random ages, ID verification and distances.
+
+    Ages are uniform between min_age and max_age on purchase_date.
+    Delivery distances are exponentially distributed around
+    mean_distance_km.
+    """
+    for number in range(1, count + 1):
+        dob = None
+        if rng.random() >= dob_missing_ratio:
+            days = rng.randint(min_age * 365, max_age * 365)
+            dob = (purchase_date - timedelta(days=days)).strftime('%d/%m/%Y')
+        distance = None
+        if rng.random() >= distance_missing_ratio:
+            distance = round(rng.expovariate(1 / mean_distance_km) + 0.1, 1)
+        yield Customer(str(number), 'Customer {}'.format(number), dob,
+                       rng.random() >= unverified_ratio, distance)
+
+
+def generate_discounts(item_count: int, rng: random.Random,
+                       density: float = 0.2,
+                       flat_ratio: float = 0.3) -> Iterator[Discount]:
+    """
+    Yield discounts for roughly density of the items.
+
+    Flat discounts are kept small enough to be valid for any item price.
+    """
+    for number in range(1, item_count + 1):
+        if rng.random() >= density:
+            continue
+        if rng.random() < flat_ratio:
+            yield Discount(DiscountType.FLAT, round(rng.uniform(0.1, 0.5), 2),
+                           str(number))
+        else:
+            yield Discount(DiscountType.PERCENTAGE, rng.randint(1, 50),
+                           str(number))
+
+
+def generate_transactions(count: int, rng: random.Random, item_count: int,
+                          customer_count: int,
+                          start: date = date(2023, 8, 1), days: int = 30,
+                          mean_lines: int = 8, member_ratio: float = 0.7,
+                          delivery_ratio: float = 0.2
+                          ) -> Iterator[Dict[str, object]]:
+    """Yield transaction records in time order across the given days."""
+    for number in range(count):
+        seconds = (number * days * 86400) // max(count, 1)
+        when = start + timedelta(seconds=seconds)
+        clock = seconds % 86400
+        member = (str(rng.randint(1, customer_count))
+                  if customer_count and rng.random() < member_ratio
+                  else None)
+        fulfilment = (FulfilmentType.DELIVERY
+                      if member and rng.random() < delivery_ratio
+                      else FulfilmentType.PICKUP)
+        lines = [[str(rng.randint(1, item_count)), rng.randint(1, 3)]
+                 for _ in range(max(1, int(rng.expovariate(1 / mean_lines))))]
+        yield {'date': when.strftime('%d/%m/%Y'),
+               'time': '{:02d}:{:02d}:{:02d}'.format(
+                   clock // 3600, clock // 60 % 60, clock % 60),
+               'membership_number': member,
+               'fulfilment_type': fulfilment.name,
+               'payment_method': rng.choice(list(PaymentMethod)).name,
+               'lines': lines}
+
+
+def write_dataset(directory: str, items: int, customers: int, discounts: bool,
+                  transactions: int, seed: int = 0,
+                  **options: object) -> None:
+    """
+    Write a complete dataset to a directory, streaming every record.
+
+    Each kind of record uses its own random generator derived from seed,
+    so changing how many transactions are written does not change the
+    items, and so on. Extra keyword options are passed on to the
+    generate_* function that accepts them.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    def pick(func: Callable) -> Dict[str, object]:
+        accepted = inspect.signature(func).parameters
+        return {key: value for key, value in options.items()
+                if key in accepted}
+
+    with open(os.path.join(directory, ITEMS_FILE), 'w', newline='',
+              encoding='utf-8') as output:
+        writer = csv.writer(output)
+        for item, stock, limit in generate_items(
+                items, random.Random(seed * 4),
+                **pick(generate_items)):
+            writer.writerow([item.id, item.name, item.original_price,
+                             '|'.join(item.categories), stock,
+                             '' if limit is None else limit])
+
+    with open(os.path.join(directory, CUSTOMERS_FILE), 'w', newline='',
+              encoding='utf-8') as output:
+        writer = csv.writer(output)
+        for customer in generate_customers(
+                customers, random.Random(seed * 4 + 1),
+                **pick(generate_customers)):
+            writer.writerow([
+                customer.membership_number, customer.name,
+                customer.date_of_birth or '', int(customer.id_verified),
+                '' if customer.delivery_distance_km is None
+                else customer.delivery_distance_km])
+
+    with open(os.path.join(directory, DISCOUNTS_FILE), 'w', newline='',
+              encoding='utf-8') as output:
+        writer = csv.writer(output)
+        if discounts:
+            for discount in generate_discounts(
+                    items, random.Random(seed * 4 + 2),
+                    **pick(generate_discounts)):
+                writer.writerow([discount.item_id, discount.type.name,
+                                 discount.value])
+
+    with open(os.path.join(directory, TRANSACTIONS_FILE), 'w',
+              encoding='utf-8') as output:
+        for record in generate_transactions(
+                transactions, random.Random(seed * 4 + 3), items, customers,
+                **pick(generate_transactions)):
+            output.write(json.dumps(record))
+            output.write('\n')
+
+
+def _rows(directory: str, name: str) -> Iterator[List[str]]:
+    with open(os.path.join(directory, name), newline='',
+              encoding='utf-8') as source:
+        yield from csv.reader(source)
+
+
+def load_items(directory: str, columnar: bool = False
+               ) -> MutableMapping[str, ItemEntry]:
+    """
+    Return the items dictionary of a dataset.
+
+    With columnar=True the items are loaded into an ItemCatalog instead of
+    a dictionary of tuples.
+    """
+    items: MutableMapping[str, ItemEntry] = (ItemCatalog() if columnar
+                                             else {})
+    for item_id, name, price, categories, stock, limit in _rows(
+            directory, ITEMS_FILE):
+        items[item_id] = (Item(item_id, name, float(price),
+                               categories.split('|') if categories else []),
+                          int(stock), int(limit) if limit else None)
+    return items
+
+
+def load_customers(directory: str) -> Dict[str, Customer]:
+    """Return the customers dictionary of a dataset."""
+    return {number: Customer(number, name, dob or None, verified == '1',
+                             float(distance) if distance else None)
+            for number, name, dob, verified, distance
+            in _rows(directory, CUSTOMERS_FILE)}
+
+
+def load_discounts(directory: str) -> Dict[str, Discount]:
+    """Return the discounts dictionary of a dataset."""
+    return {item_id: Discount(DiscountType[kind], float(value), item_id)
+            for item_id, kind, value in _rows(directory, DISCOUNTS_FILE)}
+
+
+def transaction_from_record(record: Mapping[str, Any],
+                            items_dict: Mapping[str, ItemEntry],
+                            customers_dict: Mapping[str, Customer]
+                            ) -> Transaction:
+    """Return a transaction, ready to check out, from a transaction record."""
+    trans = Transaction(record['date'], record['time'])
+    member = record['membership_number']
+    trans.customer = None if member is None else customers_dict[member]
+    fulfilment, payment = record['fulfilment_type'], record['payment_method']
+    trans.fulfilment_type = FulfilmentType[fulfilment] if fulfilment else None
+    trans.payment_method = PaymentMethod[payment] if payment else None
+    trans.transaction_lines = [
+        TransactionLine(items_dict[item_id][0], qty)
+        for item_id, qty in record['lines']]
+    return trans
+
+
+def iter_transactions(directory: str, items_dict: Mapping[str, ItemEntry],
+                      customers_dict: Mapping[str, Customer]
+                      ) -> Iterator[Transaction]:
+    """Yield the dataset's transactions one at a time, ready to check out."""
+    with open(os.path.join(directory, TRANSACTIONS_FILE),
+              encoding='utf-8') as source:
+        for line in source:
+            yield transaction_from_record(json.loads(line), items_dict,
+                                          customers_dict)
+
+
+def main() -> None:
+    """Write a dataset from the command line."""
+    parser = argparse.ArgumentParser(description='Generate MegaMart data')
+    parser.add_argument('directory')
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--customers', type=int, default=10000)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--no-discounts', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--restricted-ratio', type=float, default=0.05)
+    parser.add_argument('--density', type=float, default=0.2,
+                        help='fraction of items with a discount')
+    parser.add_argument('--dob-missing-ratio', type=float, default=0.1)
+    parser.add_argument('--mean-distance-km', type=float, default=12.0)
+    args = parser.parse_args()
+
+    write_dataset(args.directory, args.items, args.customers,
+                  not args.no_discounts, args.transactions, args.seed,
+                  restricted_ratio=args.restricted_ratio,
+                  density=args.density,
+                  dob_missing_ratio=args.dob_missing_ratio,
+                  mean_distance_km=args.mean_distance_km)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
 """import libraries."""
 from datetime import datetime
-from typing import Dict, Tuple, Optional
-from dateutil.relativedelta import relativedelta
+from functools import lru_cache
+from typing import (Dict, Iterable, List, MutableMapping, Sequence, Tuple,
+                    Optional)
 from DiscountType import DiscountType
 from PaymentMethod import PaymentMethod
 from FulfilmentType import FulfilmentType
@@ -9,6 +10,8 @@ from Transaction import Transaction
 from Item import Item
 from Customer import Customer
 from Discount import Discount
+from Bundle import Bundle
+from PriceCache import PriceCache
 
 from RestrictedItemException import RestrictedItemException
 from PurchaseLimitExceededException import PurchaseLimitExceededException
@@ -20,12 +23,41 @@ from InsufficientFundsException import InsufficientFundsException
 # START
 
 
-def _get_eighteenth_birthday(birth_date: datetime):
-    nonleap = birth_date + relativedelta(years=18)
-    # Handle birthdays, leap year is considered 18years + 1day
-    if nonleap.day != birth_date.day:
-        return nonleap + relativedelta(days=1)
-    return nonleap
+@lru_cache(maxsize=4096)
+def _date_ordinal(date_string: str) -> int:
+    return datetime.strptime(date_string, r"%d/%m/%Y").toordinal()
+
+
+def _underage_or_unverified(customer: Customer, purch_day: int) -> bool:
+    # The 18th birthday is parsed once per customer and cached on it
+    try:
+        adult_from = customer.adult_from_ordinal()
+    except ValueError as check:
+        raise RestrictedItemException() from check
+
+    return bool(not customer.id_verified or adult_from > purch_day)
+
+
+def _cart_not_allow(trans: Transaction) -> bool:
+    # One decision covers every restricted line of a transaction
+    customer = trans.customer
+    if customer is None or customer.date_of_birth is None:
+        return True
+    return _underage_or_unverified(customer,
+                                   trans.date_as_datetime.toordinal())
+
+
+def is_restricted(item: Item) -> bool:
+    """
+    Return True if the item belongs to at least one restricted category.
+
+    The restricted categories default to alcohol, tobacco and knives
+    and can be changed with Item.set_restricted_categories.
+    Each item works out its restriction flag once, when it is created or
+    its categories are replaced, so this check does not depend on how
+    many categories the item has.
+    """
+    return item.restricted
 
 
 def purchase_not_allow(item: Item, customer: Customer, pur_date: str) -> bool:
@@ -61,15 +93,12 @@ def purchase_not_allow(item: Item, customer: Customer, pur_date: str) -> bool:
     A customer whose date of birth is 01/08/2005 is only considered
     to be age 18+ on or after 01/08/2023.
     """
-    res_cat = ["Alcohol", "Tobacco", "Knives"]
     # Check that an item object and purchase date string are actually provided.
     if item is None:
         raise RestrictedItemException()
 
     # Handle restricted items
-    if any(c1.lower() == c2.lower()
-           for c1 in item.categories
-           for c2 in res_cat):
+    if is_restricted(item):
         # Defensive Check
         if customer is None:
             return True
@@ -78,23 +107,18 @@ def purchase_not_allow(item: Item, customer: Customer, pur_date: str) -> bool:
         if pur_date is None:
             return True
         # Check for valid dates
-        cd = customer.date_of_birth
-        f = r"%d/%m/%Y"
         try:
-            cust_datetime = _get_eighteenth_birthday(datetime.strptime(cd, f))
-            purch_datetime = datetime.strptime(pur_date, f)
-
+            purch_day = _date_ordinal(pur_date)
         except ValueError as check:
             raise RestrictedItemException() from check
 
-        return bool(not customer.id_verified or
-                    (cust_datetime > purch_datetime))
+        return _underage_or_unverified(customer, purch_day)
 
     # Unrestricted items
     return False
 
 
-ChanR = Dict[str, Tuple[Item, int, Optional[int]]]
+ChanR = MutableMapping[str, Tuple[Item, int, Optional[int]]]
 
 
 def get_purch_quantity_limit(item: Item, items_dict: ChanR) -> Optional[int]:
@@ -157,6 +181,32 @@ def is_stock_suff(item: Item, purch_quantity: int, items_dict: ChanR) -> bool:
 RenameR = Dict[str, Discount]
 
 
+# Final prices are cached per item ID until the item's price or its discount
+# changes; see PriceCache.
+price_cache = PriceCache()
+
+
+def _final_item_price(item: Item, discount: Optional[Discount]) -> float:
+    rounded_original_price = round(item.original_price, 2)
+
+    if discount is not None:
+        if discount.type == DiscountType.PERCENTAGE:
+            pct = discount.value
+            if pct < 1.00 or pct > 100.00:
+                raise InsufficientStockException()
+            return round(
+                rounded_original_price -
+                (rounded_original_price * (pct/100)), 2)
+
+        if discount.type == DiscountType.FLAT:
+            rounded_price = round(rounded_original_price - discount.value, 2)
+            if rounded_price > rounded_original_price or rounded_price < 0:
+                raise InsufficientStockException()
+            return rounded_price
+
+    return rounded_original_price
+
+
 def calculate_final_item_price(item: Item, discounts_dict: RenameR) -> float:
     """
     Return item's final price may change if.
@@ -190,26 +240,12 @@ def calculate_final_item_price(item: Item, discounts_dict: RenameR) -> float:
     if item is None or discounts_dict is None:
         raise InsufficientStockException()
 
-    rounded_original_price = round(item.original_price, 2)
-
-    if item.id in discounts_dict:
-        discount = discounts_dict[item.id]
-
-    if discount.type == DiscountType.PERCENTAGE:
-        pct = discount.value
-        if pct < 1.00 or pct > 100.00:
-            raise InsufficientStockException()
-        return round(
-            rounded_original_price -
-            (rounded_original_price * (pct/100)), 2)
-
-    if discount.type == DiscountType.FLAT:
-        rounded_price = round(rounded_original_price - discount.value, 2)
-        if rounded_price > rounded_original_price or rounded_price < 0:
-            raise InsufficientStockException()
-        return rounded_price
-
-    return rounded_original_price
+    discount = discounts_dict.get(item.id)
+    price = price_cache.lookup(item, discount)
+    if price is None:
+        price = _final_item_price(item, discount)
+        price_cache.store(item, discount, price)
+    return price
 
 
 def calculate_item_savings(i_o_p: float, item_final_price: float) -> float:
@@ -252,16 +288,14 @@ def cfs(fulfilment_type: FulfilmentType, cus: Customer) -> float:
         raise FulfilmentException()
 
     if fulfilment_type is FulfilmentType.DELIVERY:
-        # Check for Customer and Customer distance if Delivery
+        # Check for Customer and Customer distance if Delivery; the
+        # surcharge is worked out whenever the customer's distance is set
         if cus is None:
             raise FulfilmentException()
-        if cus.delivery_distance_km is None:
-            raise FulfilmentException()
-        if cus.delivery_distance_km <= 0:
+        surcharge = cus.delivery_surcharge()
+        if surcharge is None:
             raise FulfilmentException()
-        default = 5
-        calculated = 0.5 * cus.delivery_distance_km
-        return round(max(default, calculated), 2)
+        return surcharge
 
     return 0
 
@@ -294,7 +328,59 @@ def round_off_subtotal(sub: float, payment_method: PaymentMethod) -> float:
     return rounded_subtotal
 
 
-def checkout(trans: Transaction, i_d: ChanR, d_d: RenameR) -> Transaction:
+def _sku_quantities(trans: Transaction) -> List[Tuple[Item, int]]:
+    # Each distinct item with its total quantity, in the order first scanned
+    if trans.totals_current():
+        return [(line.item, line.quantity)
+                for line in trans.line_index.values()]
+
+    skus: Dict[str, List] = {}
+    for line in trans.transaction_lines:
+        item = line.item
+        if item is None:
+            raise RestrictedItemException()
+        sku = skus.get(item.id)
+        if sku is None:
+            skus[item.id] = [item, line.quantity]
+        else:
+            sku[1] += line.quantity
+    return [(item, qty) for item, qty in skus.values()]
+
+
+def _check_skus(trans: Transaction, i_d: ChanR) -> List[Tuple[Item, int]]:
+    # Each distinct item with its total quantity, once it has passed the
+    # restriction, stock and purchase limit checks
+    not_allowed = None
+    skus = _sku_quantities(trans)
+    for item, qty in skus:
+        if is_restricted(item):
+            if not_allowed is None:
+                not_allowed = _cart_not_allow(trans)
+            if not_allowed:
+                raise RestrictedItemException("debug purchase not allowed")
+        if not is_stock_suff(item, qty, i_d):
+            raise InsufficientStockException("debug no stock")
+
+        limit = get_purch_quantity_limit(item, i_d)
+        if limit and qty > limit:
+            raise PurchaseLimitExceededException("debug quantity limit ")
+    return skus
+
+
+def _price_skus(skus: Iterable[Sequence], d_d: RenameR
+                ) -> Tuple[int, float, float]:
+    # Number of items, subtotal and savings of (item, quantity) pairs
+    total_items, subtotal, savings = 0, 0.00, 0.00
+    for item, qty in skus:
+        price = calculate_final_item_price(item, d_d)
+        savings += calculate_item_savings(item.original_price, price) * qty
+        total_items += qty
+        subtotal += price * qty
+    return total_items, subtotal, savings
+
+
+def checkout(trans: Transaction, i_d: ChanR, d_d: RenameR,
+             bundles: Optional[Sequence[Bundle]] = None) -> Transaction:
     """
     Return this method will need to utilise all of the seven methoChanR above.
 
@@ -329,36 +415,33 @@ def checkout(trans: Transaction, i_d: ChanR, d_d: RenameR) -> Transaction:
         raise PurchaseLimitExceededException("debug item_dict")
     if d_d is None:
         raise PurchaseLimitExceededException("debug RenameR")
-    if trans.customer is None:
-        raise PurchaseLimitExceededException("debug customer")
     if trans.date is None:
         raise PurchaseLimitExceededException("debug transaction date")
 
-    total_items, subtotal, surcharge, savings = 0, 0.00, 0.00, 0.00
-
-    for line in trans.transaction_lines:
-        item, qty = line.item, line.quantity
-    if purchase_not_allow(item, trans.customer, trans.date):
-        raise RestrictedItemException("debug purchase not allowed")
-    if not is_stock_suff(item, qty, i_d):
-        raise InsufficientStockException("debug no stock")
-
-    limit = get_purch_quantity_limit(item, i_d)
-    if limit and qty > limit:
-        raise PurchaseLimitExceededException("debug quantity limit ")
-
-    if i_d[item.id][2] is None:
-        raise InsufficientStockException("debug entry[2]")
-    first = i_d[item.id][1] - qty
-    second = i_d[item.id][2]
-    i_d[item.id] = (i_d[item.id][0],
-                    first,
-                    second - qty if second is not None and limit else second)
-
-    price = calculate_final_item_price(item, d_d)
-    savings += calculate_item_savings(item.original_price, price) * qty
-    total_items += qty
-    subtotal += price * qty
+    # Lines priced as they were scanned with d_d's discounts need no pricing
+    # again
+    priced = trans.totals_priced(d_d)
+
+    skus = _check_skus(trans, i_d)
+    if priced:
+        total_items = trans.item_count
+        subtotal = trans.running_subtotal
+        savings = trans.running_savings
+    else:
+        total_items, subtotal, savings = _price_skus(skus, d_d)
+    trans.applied_bundles = []
+    if bundles:
+        # The cheapest combination of bundles for the whole cart, on top of
+        # each item's own discount
+        from megamart_bundles import best_bundles
+        saved, applied = best_bundles(
+            {item.id: qty for item, qty in skus},
+            {item.id: round(calculate_final_item_price(item, d_d) * 100)
+             for item, _ in skus}, bundles)
+        trans.applied_bundles = [(bundle, sets, per_set / 100)
+                                 for bundle, sets, per_set in applied]
+        subtotal -= saved / 100
+        savings += saved / 100
     if trans.fulfilment_type is None:
         raise InsufficientStockException("debug fulfilment_type")
 
@@ -366,6 +449,16 @@ def checkout(trans: Transaction, i_d: ChanR, d_d: RenameR) -> Transaction:
 
     if trans.payment_method is None:
         raise InsufficientStockException()
+
+    # Stock only changes once every item has passed its checks and the
+    # whole transaction has been priced
+    for item, qty in skus:
+        first = i_d[item.id][1] - qty
+        second = i_d[item.id][2]
+        i_d[item.id] = (i_d[item.id][0],
+                        first,
+                        second - qty if second else second)
+
     temp_total = subtotal + surcharge
     trans.final_total = round_off_subtotal(temp_total, trans.payment_method)
     trans.total_items_purchased = total_items
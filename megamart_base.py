@@ -1,5 +1,6 @@
+import io
 from datetime import datetime
-from typing import Dict, Tuple, Optional
+from typing import TYPE_CHECKING, BinaryIO, Callable, Dict, Iterable, MutableMapping, Sequence, TextIO, Tuple, Optional, Union
 from PaymentMethod import PaymentMethod
 from FulfilmentType import FulfilmentType
 from TransactionLine import TransactionLine
@@ -7,11 +8,20 @@ from Transaction import Transaction
 from Item import Item
 from Customer import Customer
 from Discount import Discount
+from Bundle import Bundle
+from ReceiptLayout import ReceiptLayout
 
 from InsufficientFundsException import InsufficientFundsException
 
 from megamart import calculate_final_item_price, calculate_item_savings, checkout
 
+if TYPE_CHECKING:
+  from megamart_journal import TransactionJournal
+  from DispatchQueue import DispatchQueue
+
+# Layout used by the receipt and item list functions unless one is passed in
+receipt_layout = ReceiptLayout()
+
 
 def scan_item(items_dict: Dict[str, Tuple[Item, int, Optional[int]]]) -> TransactionLine:
   item = None
@@ -49,19 +59,55 @@ def scan_item(items_dict: Dict[str, Tuple[Item, int, Optional[int]]]) -> Transac
   return TransactionLine(item, quantity)
 
 
-def list_items(transaction: Transaction, discounts_dict: Dict[str, Discount]) -> Tuple[int, str, str]:
-  list_string = f"{'#':<5} {'ITEM NAME':<30} {'QUANTITY':<10} {'UNIT PRICE ($)':>20} {'TOTAL DISCOUNTS APPLIED ($)':>35} {'FINAL PRICE ($)':>20}\n"
+def add_scanned_line(transaction: Transaction, transaction_line: TransactionLine, discounts_dict: Dict[str, Discount]) -> TransactionLine:
+  # Price the line once as it is scanned, so previews and checkout can use the running totals.
+  # Returns the transaction's line for the item, which a repeat scan adds to.
+  final_price = calculate_final_item_price(transaction_line.item, discounts_dict)
+  return transaction.add_line(transaction_line, final_price, calculate_item_savings(transaction_line.item.original_price, final_price), discounts_dict.get(transaction_line.item.id))
+
+
+def write_item_list(transaction: Transaction, discounts_dict: Dict[str, Discount], stream: TextIO, cents: bool = False, layout: Optional[ReceiptLayout] = None) -> float:
+  layout = layout or receipt_layout
+  write, item_row = stream.write, layout.item_row
+  write(layout.item_header)
+
+  if not cents and transaction.totals_priced(discounts_dict):
+    # Every line was priced when it was scanned, with the same discounts, and no price has changed since
+    for (index, transaction_line) in enumerate(transaction.transaction_lines):
+      write(item_row % (index + 1, transaction_line.item.name, transaction_line.quantity, transaction_line.item.original_price, transaction_line.amount_saved, transaction_line.final_cost))
+    return transaction.running_subtotal
+
+  if cents:
+    # Cents mode is imported on first use, keeping it out of the terminal's startup
+    from megamart_cents import final_item_price_cents, item_savings_cents, to_cents, from_cents
 
   items_total = 0 
   for (index, transaction_line) in enumerate(transaction.transaction_lines):
-    final_price = calculate_final_item_price(transaction_line.item, discounts_dict)
-    discounts = calculate_item_savings(transaction_line.item.original_price, final_price)
-    items_total += final_price * transaction_line.quantity
-    list_string += f"{(index + 1):<5} {transaction_line.item.name :<30} {transaction_line.quantity:<10} {('{:.2f} {}'.format(transaction_line.item.original_price, 'each')):>20} {(discounts * transaction_line.quantity):>35.2f} {(final_price * transaction_line.quantity):>20.2f}\n"
+    if cents:
+      # Sum exact integer cents, converting to dollars only for display
+      final_price_cents = final_item_price_cents(transaction_line.item, discounts_dict)
+      discounts = from_cents(item_savings_cents(to_cents(transaction_line.item.original_price), final_price_cents))
+      final_price = from_cents(final_price_cents)
+      items_total += final_price_cents * transaction_line.quantity
+    else:
+      final_price = calculate_final_item_price(transaction_line.item, discounts_dict)
+      discounts = calculate_item_savings(transaction_line.item.original_price, final_price)
+      items_total += final_price * transaction_line.quantity
+    write(item_row % (index + 1, transaction_line.item.name, transaction_line.quantity, transaction_line.item.original_price, discounts * transaction_line.quantity, final_price * transaction_line.quantity))
+
+  if cents:
+    items_total = from_cents(items_total)
+
+  return items_total
+
 
-  totals_string = f"{'':<5} {'':<30} {'':<10} {'':>20} {'===============================':>35}={'====================':>20}\n"
-  totals_string += f"{'':<5} {'':<30} {'':<10} {'':>20} {'TOTAL PRICE ($)':>35} {items_total:>20.2f}\n"
-  totals_string += f"{'':<5} {'':<30} {'':<10} {'':>20} {'===============================':>35}={'====================':>20}"
+def list_items(transaction: Transaction, discounts_dict: Dict[str, Discount], cents: bool = False, layout: Optional[ReceiptLayout] = None) -> Tuple[int, str, str]:
+  layout = layout or receipt_layout
+  list_stream = io.StringIO()
+  items_total = write_item_list(transaction, discounts_dict, list_stream, cents, layout)
+  list_string = list_stream.getvalue()
+
+  totals_string = layout.totals(items_total)
 
   return items_total, list_string, totals_string
 
@@ -106,7 +152,7 @@ def remove_transaction_line(transaction: Transaction) -> Tuple[Optional[int], Op
 
     break
 
-  return line_number_to_remove, transaction.transaction_lines.pop(line_number_to_remove - 1)
+  return line_number_to_remove, transaction.remove_line(line_number_to_remove)
 
 
 def select_fulfilment_type() -> Optional[FulfilmentType]:
@@ -221,54 +267,69 @@ def tender_exact_payment(transaction: Transaction) -> Transaction:
     print('Invalid input, please try again.')
 
 
-def generate_receipt(transaction: Transaction, discounts_dict: Dict[str, Discount]) -> str:
+def _text_stream(stream: Union[TextIO, BinaryIO]) -> TextIO:
+  # Binary streams get a UTF-8 text layer that passes every write straight through
+  if isinstance(stream, (io.RawIOBase, io.BufferedIOBase)):
+    return io.TextIOWrapper(stream, encoding='utf-8', newline='', write_through=True)
+  return stream
+
+
+def write_receipt(transaction: Transaction, discounts_dict: Dict[str, Discount], stream: Union[TextIO, BinaryIO], cents: bool = False, layout: Optional[ReceiptLayout] = None) -> None:
   if not transaction.finalised:
      raise Exception('Cannot print a receipt for an unfinalised transaction.')
 
-  receipt_border = f"{'=====':<5}={'==============================':<30}={'==========':<10}={'====================':>20}={'===================================':>35}={'====================':>20}\n"
+  text_stream = _text_stream(stream)
+  try:
+    _write_receipt_body(transaction, discounts_dict, text_stream, cents, layout or receipt_layout)
+  finally:
+    # Hand a binary stream back to the caller without closing it
+    if text_stream is not stream:
+      text_stream.detach()
 
-  # Build header
-  receipt_text = receipt_border
-  receipt_text += 'MONASH MEGAMART RECEIPT\n'
-  receipt_text += receipt_border
 
-  receipt_text += 'Transaction time: {} {}\n'.format(transaction.date, transaction.time)
-  receipt_text += 'Fulfilment type: {}\n'.format(transaction.fulfilment_type.value)
+def _write_receipt_body(transaction: Transaction, discounts_dict: Dict[str, Discount], stream: TextIO, cents: bool, layout: ReceiptLayout) -> None:
+  write = stream.write
+
+  # Build header
+  write(layout.heading(date=transaction.date, time=transaction.time, fulfilment=transaction.fulfilment_type.value))
 
   if (transaction.customer):
-    receipt_text += 'Customer: {}\n'.format(transaction.customer.name)
-    receipt_text += 'Membership #: {}\n'.format(transaction.customer.membership_number)
+    write(layout.customer(name=transaction.customer.name, membership_number=transaction.customer.membership_number))
+
+  write(layout.items_heading)
+  write_item_list(transaction, discounts_dict, stream, cents, layout)
+  for bundle, sets, saved in transaction.applied_bundles:
+    write(layout.bundle_row % ('', 'Bundle: ' + bundle.name, sets, '', saved * sets, -saved * sets))
 
-  receipt_text += receipt_border
+  # Build totals and footer
+  write(layout.summary(subtotal=transaction.all_items_subtotal or 0,
+                       surcharge=transaction.fulfilment_surcharge_amount or 0,
+                       rounding=transaction.rounding_amount_applied or 0,
+                       final_total=transaction.final_total or 0,
+                       payment_method=transaction.payment_method.value,
+                       tendered=transaction.amount_tendered or 0,
+                       change=transaction.change_amount or 0,
+                       items_purchased=transaction.total_items_purchased or 0,
+                       saved=transaction.amount_saved or 0))
 
-  item_total, list_string, totals_string = list_items(transaction, discounts_dict)
 
-  receipt_text += "Purchased items:\n"
-  receipt_text += list_string
+def generate_receipt(transaction: Transaction, discounts_dict: Dict[str, Discount], cents: bool = False, layout: Optional[ReceiptLayout] = None) -> str:
+  receipt_stream = io.StringIO()
+  write_receipt(transaction, discounts_dict, receipt_stream, cents, layout)
+  return receipt_stream.getvalue()
 
-  receipt_text += "\n"
-  receipt_text += receipt_border
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'SUBTOTAL ($)':>35} {(transaction.all_items_subtotal or 0):>20.2f}\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'FULFILMENT SURCHARGE ($)':>35} {(transaction.fulfilment_surcharge_amount or 0):>20.2f}\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'ROUNDING ($)':>35} {(transaction.rounding_amount_applied or 0):>20.2f}\n\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'===============================':>35}={'====================':>20}\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'FINAL TOTAL ($)':>35} {(transaction.final_total or 0):>20.2f}\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'===============================':>35}={'====================':>20}\n\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'PAYMENT METHOD':>35} {transaction.payment_method.value:>20}\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'AMOUNT TENDERED ($)':>35} {(transaction.amount_tendered or 0):>20.2f}\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'CHANGE ($)':>35} {(transaction.change_amount or 0):>20.2f}\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'# ITEMS PURCHASED':>35} {(transaction.total_items_purchased or 0):>20}\n\n"
-  receipt_text += f"{'':<5} {'':<30} {'':<10} {'':>20} {'MONEY SAVED WITH US ($)':>35} {(transaction.amount_saved or 0):>20.2f}\n"
 
-  # Build footer
-  receipt_text += receipt_border
-  receipt_text += 'Thank you for shopping at Monash MegaMart, please come again!\n'
-  receipt_text += receipt_border
+def write_receipts(transactions: Iterable[Transaction], discounts_dict: Dict[str, Discount], path: str, cents: bool = False, buffer_size: int = 1 << 20, layout: Optional[ReceiptLayout] = None) -> int:
+  count = 0
+  with open(path, 'w', encoding='utf-8', newline='', buffering=buffer_size) as receipts_file:
+    for transaction in transactions:
+      write_receipt(transaction, discounts_dict, receipts_file, cents, layout)
+      count += 1
 
-  return receipt_text
+  return count
 
 
-def terminal(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount], customers_dict: Dict[str, Customer]) -> None:
+def terminal(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_dict: Dict[str, Discount], customers_dict: Dict[str, Customer], cents: bool = False, checkout_func: Optional[Callable[..., Transaction]] = None, layout: Optional[ReceiptLayout] = None, journal: Optional['TransactionJournal'] = None, bundles: Optional[Sequence[Bundle]] = None, dispatch: Optional['DispatchQueue'] = None) -> None:
   print("===========================")
   print("Welcome to Monash MegaMart!")
   print("===========================\n")
@@ -298,8 +359,17 @@ def terminal(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_d
           if transaction_line is None:
             break
           
-          transaction.transaction_lines.append(transaction_line)
-          print("\nItem '{}' added, adding next item...\n".format(transaction_line.item.name))
+          try:
+            merged_line = add_scanned_line(transaction, transaction_line, discounts_dict)
+          except Exception as e:
+            # The item cannot be priced, e.g. its discount is invalid, so it is not added
+            print("{}:".format(type(e).__name__), str(e))
+            continue
+
+          if merged_line is transaction_line:
+            print("\nItem '{}' added, adding next item...\n".format(transaction_line.item.name))
+          else:
+            print("\nItem '{}' added, now {} in cart, adding next item...\n".format(transaction_line.item.name, merged_line.quantity))
 
     elif option == "2":
       if len(transaction.transaction_lines) == 0:
@@ -307,7 +377,7 @@ def terminal(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_d
         continue
 
       print('Current items:\n')
-      item_total, list_string, totals_string = list_items(transaction, discounts_dict)
+      item_total, list_string, totals_string = list_items(transaction, discounts_dict, cents, layout)
 
       print("")
       print(list_string)
@@ -332,7 +402,7 @@ def terminal(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_d
         continue
 
       print('Current items:\n')
-      item_total, list_string, totals_string = list_items(transaction, discounts_dict)
+      item_total, list_string, totals_string = list_items(transaction, discounts_dict, cents, layout)
 
       print("")
       print(list_string)
@@ -353,8 +423,20 @@ def terminal(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_d
 
       transaction.payment_method = payment_method
 
+      sold = False
       try:
-        transaction = checkout(transaction, items_dict, discounts_dict)
+        if checkout_func is None and cents:
+          from megamart_cents import checkout_cents
+          checkout_func = checkout_cents
+        # Worked out before checkout changes the stock levels, to journal the sale or undo it if payment fails
+        from megamart_journal import restore_stock, sale_deltas
+        deltas = sale_deltas(transaction, items_dict)
+        if bundles:
+          # Every checkout function either applies the bundles or raises, so they are never silently dropped
+          transaction = (checkout_func or checkout)(transaction, items_dict, discounts_dict, bundles)
+        else:
+          transaction = (checkout_func or checkout)(transaction, items_dict, discounts_dict)
+        sold = True
 
         if transaction.final_total is None or transaction.final_total <= 0:
           transaction.finalised = True
@@ -365,14 +447,24 @@ def terminal(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_d
           transaction = tender_exact_payment(transaction)
 
         if transaction.finalised is False:
+          # A read-only items mapping, such as a checkout server's, keeps its stock elsewhere
+          if isinstance(items_dict, MutableMapping):
+            restore_stock(items_dict, deltas)
           print('Payment cancelled. Returning to main menu.')
           continue
 
+        if journal is not None:
+          journal.append(transaction, deltas)
+        if dispatch is not None and transaction.fulfilment_type is FulfilmentType.DELIVERY:
+          dispatch.push(transaction)
+
         print("Transaction successful! Generating receipt...\n")        
-        print(generate_receipt(transaction, discounts_dict))
+        print(generate_receipt(transaction, discounts_dict, cents, layout))
         break
 
       except Exception as e:
+        if sold and not transaction.finalised and isinstance(items_dict, MutableMapping):
+          restore_stock(items_dict, deltas)
         print("{}:".format(type(e).__name__), str(e))
         # Uncomment to print out stack trace if required for debugging
         # import traceback
@@ -385,7 +477,7 @@ def terminal(items_dict: Dict[str, Tuple[Item, int, Optional[int]]], discounts_d
         continue
 
       print('Current items:\n')
-      item_total, list_string, totals_string = list_items(transaction, discounts_dict)
+      item_total, list_string, totals_string = list_items(transaction, discounts_dict, cents, layout)
 
       print("")
       print(list_string)
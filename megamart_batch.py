@@ -0,0 +1,77 @@
+"""Batch checkout of many transactions against one shared catalog."""
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from Transaction import Transaction
+from Item import Item
+from Bundle import Bundle
+
+from PurchaseLimitExceededException import PurchaseLimitExceededException
+
+from megamart import ChanR, RenameR, checkout
+
+CheckoutResult = Union[Transaction, Exception]
+CatalogEntry = Tuple[Item, int, Optional[int]]
+
+
+def _fetch_entries(trans: Transaction, stock: Dict[str, CatalogEntry],
+                   fetched: Dict[str, CatalogEntry],
+                   items_dict: ChanR) -> None:
+    """Copy the catalog entries of a transaction's items not yet fetched."""
+    if trans is None:
+        return
+    for line in trans.transaction_lines:
+        item = line.item
+        if item is not None and item.id not in stock and item.id in items_dict:
+            stock[item.id] = fetched[item.id] = items_dict[item.id]
+
+
+def checkout_many(transactions: Iterable[Transaction], items_dict: ChanR,
+                  discounts_dict: RenameR,
+                  bundles: Optional[Sequence[Bundle]] = None
+                  ) -> List[CheckoutResult]:
+    """
+    Return the checkout result of every transaction, in the given order.
+
+    Each transaction goes through checkout itself, with the same bundles,
+    against a plain dictionary holding the catalog entries of the batch's
+    items. Each entry is read from the items dictionary once per batch and
+    each changed entry is written back once at the end, which is what
+    saves time on catalogs with costly lookups, such as SqliteCatalog.
+    Transactions are processed in the order given, so stock levels and
+    purchase limits are decremented deterministically.
+    The result list holds the checked out transaction, or the Exception
+    checkout raised for it. A failed transaction does not change any
+    stock levels.
+    Against a plain dictionary the batch is no faster than calling
+    checkout in a loop; bench_megamart times both.
+    If the items or discounts dictionary was not actually provided,
+    an Exception should be raised.
+    """
+    if items_dict is None:
+        raise PurchaseLimitExceededException("debug item_dict")
+    if discounts_dict is None:
+        raise PurchaseLimitExceededException("debug RenameR")
+
+    # The batch's working copy of the entries, and the entries as fetched;
+    # a plain dictionary is already as cheap to use as a copy of it
+    copied = type(items_dict) is not dict
+    stock: Dict[str, CatalogEntry] = {} if copied else items_dict
+    fetched: Dict[str, CatalogEntry] = {}
+    results: List[CheckoutResult] = []
+
+    try:
+        for trans in transactions:
+            try:
+                if copied:
+                    _fetch_entries(trans, stock, fetched, items_dict)
+                results.append(checkout(trans, stock, discounts_dict,
+                                        bundles))
+            except Exception as error:  # pylint: disable=broad-except
+                # A kept traceback would keep checkout's frames alive too
+                results.append(error.with_traceback(None))
+    finally:
+        # Only entries a transaction changed are written back
+        for item_id, entry in fetched.items():
+            if stock[item_id] is not entry:
+                items_dict[item_id] = stock[item_id]
+
+    return results
@@ -0,0 +1,202 @@
+"""Cart-level solver choosing the cheapest combination of bundles for a cart.
+
+Bundles (see Bundle.py) can overlap, since one item may belong to several
+of them, so the saving of each has to be weighed against the bundles it
+would use items from. The solver works in integer cents:
+
+- bundles the cart cannot fill, or that save nothing at the items' own
+  prices, are dropped;
+- the rest are split into groups that share no items, each solved alone;
+- within a group, a depth-first search decides how many sets of each
+  bundle to apply, best saving per unit first. It solves the LP
+  relaxation (a small simplex) at every state, tries the count nearest
+  the relaxation's answer first, and cuts off every branch whose
+  relaxation cannot beat the best saving found so far; as that bound is
+  concave in the count, the counts beyond the first cut off are skipped.
+  States are remembered by the quantities left of the items later
+  bundles still use, so a state already reached with as much saved is
+  not searched again.
+
+When several combinations save the same amount, the first found in this
+fixed search order is kept, so the result is deterministic.
+"""
+from typing import Dict, Iterable, List, Mapping, Sequence, Tuple
+from Bundle import Bundle
+
+# (bundle, number of sets applied, cents saved per set)
+Applied = List[Tuple[Bundle, int, int]]
+_Candidate = Tuple[Bundle, int]
+
+
+def _groups(candidates: Sequence[_Candidate]) -> List[List[_Candidate]]:
+    # Union-find over item IDs, keeping bundles in their given order
+    parent: Dict[str, str] = {}
+
+    def find(item_id: str) -> str:
+        root = item_id
+        while parent.setdefault(root, root) != root:
+            root = parent[root]
+        parent[item_id] = root
+        return root
+
+    for bundle, _ in candidates:
+        first, *others = bundle.quantities
+        for item_id in others:
+            parent[find(item_id)] = find(first)
+
+    groups: Dict[str, List[_Candidate]] = {}
+    for candidate in candidates:
+        groups.setdefault(find(next(iter(candidate[0].quantities))),
+                          []).append(candidate)
+    return list(groups.values())
+
+
+def _relaxation(needs: Sequence[Tuple[Tuple[int, int], ...]],
+                savings: Sequence[int], left: Sequence[int],
+                items: Sequence[int]) -> Tuple[float, List[float]]:
+    # Simplex solution of the LP relaxation over the given items: the most
+    # that fractional sets could save, and how many sets of each bundle
+    # that takes
+    rows, columns = len(items), len(needs) + len(items)
+    row_of = {index: row for row, index in enumerate(items)}
+    table = [[0.0] * columns + [float(left[index])] for index in items]
+    for column, need in enumerate(needs):
+        for index, quantity in need:
+            table[row_of[index]][column] = float(quantity)
+    for row in range(rows):
+        table[row][len(needs) + row] = 1.0
+    costs = [-float(saving) for saving in savings] + [0.0] * (rows + 1)
+    basis = [len(needs) + index for index in range(rows)]
+
+    while True:
+        # Bland's rule: lowest entering and leaving indexes, so no cycling
+        entering = next((column for column in range(columns)
+                         if costs[column] < -1e-9), None)
+        if entering is None:
+            sets = [0.0] * len(needs)
+            for index, column in enumerate(basis):
+                if column < len(needs):
+                    sets[column] = table[index][-1]
+            return costs[-1], sets
+        leaving, best = -1, 0.0
+        for index in range(rows):
+            coefficient = table[index][entering]
+            if coefficient > 1e-9:
+                ratio = table[index][-1] / coefficient
+                if (leaving < 0 or ratio < best - 1e-12 or
+                        (ratio <= best + 1e-12 and
+                         basis[index] < basis[leaving])):
+                    leaving, best = index, ratio
+        pivot_row = table[leaving]
+        pivot = pivot_row[entering]
+        for column in range(columns + 1):
+            pivot_row[column] /= pivot
+        for row in table:
+            factor = row[entering]
+            if row is not pivot_row and factor:
+                for column in range(columns + 1):
+                    row[column] -= factor * pivot_row[column]
+        factor = costs[entering]
+        for column in range(columns + 1):
+            costs[column] -= factor * pivot_row[column]
+        basis[leaving] = entering
+
+
+def _solve(group: Sequence[_Candidate],
+           quantities: Mapping[str, int]) -> Tuple[int, List[int]]:
+    # Return the best saving of a group and the count of each bundle
+    count = len(group)
+    # Bundles saving the most per unit are searched first
+    order = sorted(range(count), key=lambda j: -group[j][1] / sum(
+        group[j][0].quantities.values()))
+    items = list(dict.fromkeys(item_id for bundle, _ in group
+                               for item_id in bundle.quantities))
+    column = {item_id: index for index, item_id in enumerate(items)}
+    needs = [tuple((column[item_id], quantity) for item_id, quantity
+                   in group[j][0].quantities.items()) for j in order]
+    savings = [group[j][1] for j in order]
+
+    # Items still used by bundle j or a later one
+    live: List[Tuple[int, ...]] = [()] * (count + 1)
+    for j in range(count - 1, -1, -1):
+        live[j] = tuple(sorted(set(live[j + 1])
+                               | {index for index, _ in needs[j]}))
+
+    def most(j: int, left: Sequence[int]) -> int:
+        return min(left[index] // quantity for index, quantity in needs[j])
+
+    best_value, best_counts = -1, [0] * count
+    # The highest saving each remaining state has been reached with; a
+    # later visit with no more saved so far cannot do better
+    reached: Dict[tuple, int] = {}
+    chosen = [0] * count
+
+    def search(j: int, left: List[int], value: int) -> bool:
+        # Returns False if the relaxation shows this branch cannot win
+        nonlocal best_value, best_counts
+        if j == count:
+            if value > best_value:
+                best_value, best_counts = value, list(chosen)
+            return True
+        key = (j,) + tuple(left[index] for index in live[j])
+        if reached.get(key, -1) >= value:
+            return True
+        reached[key] = value
+
+        if not any(most(k, left) for k in range(j, count)):
+            chosen[j:] = [0] * (count - j)
+            return search(count, left, value)
+        relaxed, fractional = _relaxation(needs[j:], savings[j:], left,
+                                          live[j])
+        if value + int(relaxed + 1e-6) <= best_value:
+            return False
+        peak = min(int(fractional[0] + 1e-6), most(j, left))
+
+        # The relaxation's bound is concave in the number of sets of
+        # bundle j, so each direction away from its peak stops at the
+        # first count that cannot win
+        for sets_range in (range(peak, -1, -1),
+                           range(peak + 1, most(j, left) + 1)):
+            for sets in sets_range:
+                after = list(left)
+                for index, quantity in needs[j]:
+                    after[index] -= quantity * sets
+                chosen[j] = sets
+                if not search(j + 1, after, value + savings[j] * sets):
+                    break
+        chosen[j] = 0
+        return True
+
+    search(0, [quantities[item_id] for item_id in items], 0)
+    counts = [0] * count
+    for position, j in enumerate(order):
+        counts[j] = best_counts[position]
+    return best_value, counts
+
+
+def best_bundles(quantities: Mapping[str, int],
+                 unit_cents: Mapping[str, int],
+                 bundles: Iterable[Bundle]) -> Tuple[int, Applied]:
+    """
+    Return the largest saving in cents on a cart and the bundles giving it.
+
+    quantities and unit_cents map each item ID in the cart to its total
+    quantity and its price in cents after any per-item discount.
+    """
+    candidates: List[_Candidate] = []
+    for bundle in bundles:
+        if all(quantities.get(item_id, 0) >= quantity
+               for item_id, quantity in bundle.quantities.items()):
+            saving = bundle.saving_cents(unit_cents)
+            if saving > 0:
+                candidates.append((bundle, saving))
+
+    order = {id(bundle): index for index, (bundle, _) in enumerate(candidates)}
+    total, applied = 0, []
+    for group in _groups(candidates):
+        saving, counts = _solve(group, quantities)
+        total += saving
+        applied.extend((bundle, sets, per_set) for (bundle, per_set), sets
+                       in zip(group, counts) if sets)
+    applied.sort(key=lambda entry: order[id(entry[0])])
+    return total, applied
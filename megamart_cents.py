@@ -0,0 +1,180 @@
+"""Fixed-point (integer cents) versions of the megamart pricing functions."""
+from typing import Optional, Sequence
+from DiscountType import DiscountType
+from PaymentMethod import PaymentMethod
+from FulfilmentType import FulfilmentType
+from Transaction import Transaction
+from Item import Item
+from Customer import Customer
+from Bundle import Bundle
+
+from PurchaseLimitExceededException import PurchaseLimitExceededException
+from InsufficientStockException import InsufficientStockException
+from FulfilmentException import FulfilmentException
+from InsufficientFundsException import InsufficientFundsException
+
+from megamart import ChanR, RenameR, _check_skus
+
+
+def to_cents(amount: float) -> int:
+    """Return a dollar amount as a whole number of cents."""
+    return round(amount * 100)
+
+
+def from_cents(cents: int) -> float:
+    """Return a whole number of cents as a dollar amount."""
+    return cents / 100
+
+
+def final_item_price_cents(item: Item, discounts_dict: RenameR) -> int:
+    """
+    Return the item's final price in cents.
+
+    Follows the same rules and raises the same Exceptions as
+    calculate_final_item_price. Percentage discounts are applied in
+    hundredths of a percent and rounded half up to the nearest cent.
+    """
+    if item is None or discounts_dict is None:
+        raise InsufficientStockException()
+
+    price = to_cents(item.original_price)
+    discount = discounts_dict.get(item.id)
+    if discount is None:
+        return price
+
+    if discount.type == DiscountType.PERCENTAGE:
+        pct = discount.value
+        if pct < 1.00 or pct > 100.00:
+            raise InsufficientStockException()
+        return (price * (10000 - round(pct * 100)) + 5000) // 10000
+
+    if discount.type == DiscountType.FLAT:
+        discounted = price - to_cents(discount.value)
+        if discounted > price or discounted < 0:
+            raise InsufficientStockException()
+        return discounted
+
+    return price
+
+
+def item_savings_cents(original_cents: int, final_cents: int) -> int:
+    """
+    Return the savings on an item in cents.
+
+    Raises the same Exceptions as calculate_item_savings.
+    """
+    if original_cents is None or final_cents is None:
+        raise FulfilmentException()
+    if final_cents > original_cents:
+        raise FulfilmentException()
+
+    return original_cents - final_cents
+
+
+def fulfilment_surcharge_cents(fulfilment_type: FulfilmentType,
+                               cus: Customer) -> int:
+    """
+    Return the fulfilment surcharge in cents.
+
+    Deliveries cost 500 cents or 50 cents per kilometre, whichever is
+    greater. Raises the same Exceptions as cfs.
+    """
+    if fulfilment_type is None:
+        raise FulfilmentException()
+
+    if fulfilment_type is FulfilmentType.DELIVERY:
+        if cus is None:
+            raise FulfilmentException()
+        if cus.delivery_distance_km is None:
+            raise FulfilmentException()
+        if cus.delivery_distance_km <= 0:
+            raise FulfilmentException()
+        return max(500, round(50 * cus.delivery_distance_km))
+
+    return 0
+
+
+def round_off_subtotal_cents(sub: int, payment_method: PaymentMethod) -> int:
+    """
+    Return the subtotal in cents, rounded to 5 cents when paying by cash.
+
+    Cent amounts ending in 1 - 2 or 6 - 7 are rounded down and amounts
+    ending in 3 - 4 or 8 - 9 are rounded up.
+    Raises the same Exceptions as round_off_subtotal.
+    """
+    if sub is None or payment_method is None:
+        raise InsufficientFundsException()
+
+    if payment_method is PaymentMethod.CASH:
+        remainder = sub % 5
+        return sub - remainder if remainder <= 2 else sub + 5 - remainder
+
+    return sub
+
+
+def checkout_cents(trans: Transaction, i_d: ChanR, d_d: RenameR,
+                   bundles: Optional[Sequence[Bundle]] = None
+                   ) -> Transaction:
+    """
+    Return the checked out transaction, calculated in integer cents.
+
+    Applies the same checks, stock updates and Exceptions as checkout,
+    but every amount is kept as a whole number of cents until the
+    totals are stored on the transaction, so no intermediate rounding
+    is needed and totals are exact. Bundles are applied as checkout
+    applies them.
+    """
+    if trans is None:
+        raise PurchaseLimitExceededException("debug transaction")
+    if i_d is None:
+        raise PurchaseLimitExceededException("debug item_dict")
+    if d_d is None:
+        raise PurchaseLimitExceededException("debug RenameR")
+    if trans.date is None:
+        raise PurchaseLimitExceededException("debug transaction date")
+
+    total_items, subtotal, savings = 0, 0, 0
+    skus = _check_skus(trans, i_d)
+    for item, qty in skus:
+        price = final_item_price_cents(item, d_d)
+        savings += item_savings_cents(to_cents(item.original_price),
+                                      price) * qty
+        total_items += qty
+        subtotal += price * qty
+    trans.applied_bundles = []
+    if bundles:
+        from megamart_bundles import best_bundles
+        saved, applied = best_bundles(
+            {item.id: qty for item, qty in skus},
+            {item.id: final_item_price_cents(item, d_d) for item, _ in skus},
+            bundles)
+        trans.applied_bundles = [(bundle, sets, from_cents(per_set))
+                                 for bundle, sets, per_set in applied]
+        subtotal -= saved
+        savings += saved
+
+    if trans.fulfilment_type is None:
+        raise InsufficientStockException("debug fulfilment_type")
+    surcharge = fulfilment_surcharge_cents(trans.fulfilment_type,
+                                           trans.customer)
+
+    if trans.payment_method is None:
+        raise InsufficientStockException()
+    final_total = round_off_subtotal_cents(subtotal + surcharge,
+                                           trans.payment_method)
+
+    # Stock only changes once the whole transaction has passed
+    for item, qty in skus:
+        entry = i_d[item.id]
+        i_d[item.id] = (entry[0], entry[1] - qty,
+                        entry[2] - qty if entry[2] else entry[2])
+
+    trans.final_total = from_cents(final_total)
+    trans.total_items_purchased = total_items
+    trans.all_items_subtotal = from_cents(subtotal)
+    trans.fulfilment_surcharge_amount = from_cents(surcharge)
+    trans.amount_saved = from_cents(savings)
+    trans.rounding_amount_applied = from_cents(
+        final_total - subtotal - surcharge)
+
+    return trans
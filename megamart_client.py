@@ -0,0 +1,209 @@
+"""Thin terminal client for the megamart_server checkout service."""
+import abc
+import json
+import socket
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+from Item import Item
+from Customer import Customer
+from Discount import Discount
+from DiscountType import DiscountType
+from Transaction import Transaction
+
+from RestrictedItemException import RestrictedItemException
+from PurchaseLimitExceededException import PurchaseLimitExceededException
+from InsufficientStockException import InsufficientStockException
+from FulfilmentException import FulfilmentException
+from InsufficientFundsException import InsufficientFundsException
+
+import megamart_base
+from megamart_server import PIPELINE_DEPTH
+
+Response = Dict[str, Any]
+
+_ERRORS = {error.__name__: error for error in (
+    RestrictedItemException, PurchaseLimitExceededException,
+    InsufficientStockException, FulfilmentException,
+    InsufficientFundsException, KeyError, ValueError)}
+
+
+class CheckoutClient:
+    """
+    Connection to a checkout server.
+
+    The items, discounts and customers attributes are read-only mappings
+    backed by the server, so they can be handed to terminal() in place of
+    the in-process dictionaries. Items, discounts and customers are fetched
+    once per transaction: every checkout, successful or not, forgets them,
+    so the next transaction sees the stock and discounts the server holds
+    by then. refresh() forgets them at any other time.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765,
+                 path: Optional[str] = None):
+        """Connect to a server over TCP, or over a Unix socket path."""
+        if path is not None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(path)
+        else:
+            self._socket = socket.create_connection((host, port))
+        self._file = self._socket.makefile('rwb')
+        self._next_id = 0
+        self.items = _RemoteItems(self)
+        self.discounts = _RemoteDiscounts(self)
+        self.customers = _RemoteCustomers(self)
+
+    def pipeline(self, requests: List[Dict[str, Any]]) -> List[Response]:
+        """
+        Return the responses to requests sent without waiting for each.
+
+        Requests go out in groups of at most the server's PIPELINE_DEPTH,
+        and each group's responses are read before the next is sent, so
+        neither side can block on a full socket buffer.
+        """
+        responses: List[Response] = []
+        for start in range(0, len(requests), PIPELINE_DEPTH):
+            group = requests[start:start + PIPELINE_DEPTH]
+            for request in group:
+                request['id'] = self._next_id
+                self._next_id += 1
+                self._file.write(json.dumps(request).encode() + b'\n')
+            self._file.flush()
+            responses.extend(json.loads(self._file.readline())
+                             for _ in group)
+        return responses
+
+    def request(self, op: str, **fields: Any) -> Response:
+        """Return the server's response, raising any error it reports."""
+        response = self.pipeline([dict(fields, op=op)])[0]
+        if 'error' in response:
+            raise _ERRORS.get(response['error'], Exception)(
+                response['message'])
+        return response
+
+    def checkout(self, trans: Transaction, items_dict: Any = None,
+                 discounts_dict: Any = None, bundles: Any = None
+                 ) -> Transaction:
+        """
+        Return the transaction, checked out by the server.
+
+        Takes the same arguments as megamart.checkout so it can be used in
+        its place, but the dictionaries are ignored: the server checks out
+        against its own catalog and the totals are copied back. The server
+        has no bundles, so passing any raises ValueError rather than
+        checking out without them.
+        """
+        if bundles:
+            raise ValueError('Bundles cannot be applied by a remote '
+                             'checkout service.')
+        customer = trans.customer
+        try:
+            response = self.request(
+                'checkout', date=trans.date, time=trans.time,
+                lines=[[line.item.id, line.quantity]
+                       for line in trans.transaction_lines],
+                membership_number=(None if customer is None
+                                   else customer.membership_number),
+                fulfilment_type=(trans.fulfilment_type.name
+                                 if trans.fulfilment_type else None),
+                payment_method=(trans.payment_method.name
+                                if trans.payment_method else None))
+        finally:
+            # The next transaction must see the stock this one left
+            self.refresh()
+        trans.total_items_purchased = response['total_items_purchased']
+        trans.all_items_subtotal = response['all_items_subtotal']
+        trans.fulfilment_surcharge_amount = (
+            response['fulfilment_surcharge_amount'])
+        trans.rounding_amount_applied = response['rounding_amount_applied']
+        trans.final_total = response['final_total']
+        trans.amount_saved = response['amount_saved']
+        return trans
+
+    def refresh(self) -> None:
+        """Forget every fetched item, discount and customer."""
+        for mapping in (self.items, self.discounts, self.customers):
+            mapping.clear()
+
+    def close(self) -> None:
+        """Close the connection."""
+        self._file.close()
+        self._socket.close()
+
+
+class _RemoteMapping(Mapping):
+    """Read-only mapping that fetches missing keys from the server."""
+
+    def __init__(self, client: CheckoutClient):
+        self._client = client
+        self._cache: Dict[str, Any] = {}
+
+    @abc.abstractmethod
+    def _fetch(self, key: str) -> Any:
+        """Return the value the server holds for a key."""
+
+    def clear(self) -> None:
+        """Forget every fetched value, so each is fetched again."""
+        self._cache.clear()
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._cache:
+            self._cache[key] = self._fetch(key)
+        if self._cache[key] is None:
+            raise KeyError(key)
+        return self._cache[key]
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            self[key]  # pylint: disable=pointless-statement
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(key for key, value in self._cache.items()
+                    if value is not None)
+
+    def __len__(self) -> int:
+        return sum(value is not None for value in self._cache.values())
+
+
+class _RemoteItems(_RemoteMapping):
+    def _fetch(self, key: str) -> Optional[Tuple[Item, int, Optional[int]]]:
+        try:
+            found = self._client.request('scan', item_id=key)
+        except KeyError:
+            return None
+        return (Item(found['id'], found['name'], found['original_price'],
+                     found['categories']), found['stock'], found['limit'])
+
+
+class _RemoteDiscounts(_RemoteMapping):
+    def _fetch(self, key: str) -> Optional[Discount]:
+        found = self._client.request('discount', item_id=key)['discount']
+        if found is None:
+            return None
+        return Discount(DiscountType[found['type']], found['value'], key)
+
+
+class _RemoteCustomers(_RemoteMapping):
+    def _fetch(self, key: str) -> Optional[Customer]:
+        try:
+            found = self._client.request('link_member',
+                                         membership_number=key)
+        except KeyError:
+            return None
+        return Customer(found['membership_number'], found['name'],
+                        found['date_of_birth'], found['id_verified'],
+                        found['delivery_distance_km'])
+
+
+def remote_terminal(host: str = '127.0.0.1', port: int = 8765,
+                    path: Optional[str] = None) -> None:
+    """Run a terminal session against a checkout server."""
+    client = CheckoutClient(host, port, path)
+    try:
+        megamart_base.terminal(client.items, client.discounts,
+                               client.customers,
+                               checkout_func=client.checkout)
+    finally:
+        client.close()
@@ -0,0 +1,410 @@
+"""Append-only binary journal of finalised transactions and stock changes.
+
+A journal file starts with the 4 byte magic b'MMJ1' and is followed by
+records of
+
+    uint32 payload length, uint32 CRC-32 of the payload, payload
+
+all little-endian. Each payload holds the stock deltas first, so replay can
+skip the rest of the record, then the transaction itself:
+
+    uint32 delta count, then per delta:
+        string item ID, int64 stock delta, int64 limit delta
+    string date, string time, string membership number ('' if none),
+    string fulfilment type, string payment method,
+    int64 items purchased, 7 doubles (subtotal, surcharge, rounding, final
+    total, amount tendered, change, amount saved; NaN if unset),
+    uint32 line count, then per line: string item ID, int64 quantity
+
+where a string is a uint16 byte length followed by UTF-8 bytes. A torn
+record at the end of the file, as left by a crash, is ignored by replay
+and cut off when the journal is next opened for appending.
+
+Records are written to the OS as they are appended and made durable in
+groups: a background thread calls fsync once for every record appended
+within max_delay of each other, or once max_batch are waiting, and every
+appender waiting on that group is released together.
+
+Replay rebuilds stock levels from a snapshot plus the journal:
+
+    python megamart_journal.py snapshot-replay SNAPSHOT JOURNAL -o NEW
+    python megamart_journal.py dump JOURNAL
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import struct
+import threading
+import zlib
+from typing import (Dict, Iterable, Iterator, List, Mapping, MutableMapping,
+                    Optional, Tuple)
+from Item import Item
+from Transaction import Transaction
+
+MAGIC = b'MMJ1'
+
+# item ID, stock delta, purchase quantity limit delta
+StockDelta = Tuple[str, int, int]
+# item ID -> [stock level, purchase quantity limit or None]
+StockLevels = Dict[str, List[Optional[int]]]
+
+_FRAME = struct.Struct('<II')
+_COUNT = struct.Struct('<I')
+_LENGTH = struct.Struct('<H')
+_DELTA = struct.Struct('<qq')
+_TOTALS = struct.Struct('<q7d')
+_QUANTITY = struct.Struct('<q')
+
+
+def sale_deltas(trans: Transaction,
+                items_dict: Mapping[str, Tuple[Item, int, Optional[int]]]
+                ) -> List[StockDelta]:
+    """
+    Return the stock changes checkout will make for a transaction.
+
+    Call before checkout: a purchase quantity limit is only reduced when
+    the item has one, as checkout does.
+    """
+    quantities: Dict[str, int] = {}
+    for line in trans.transaction_lines:
+        quantities[line.item.id] = (quantities.get(line.item.id, 0)
+                                    + line.quantity)
+    deltas = []
+    for item_id, qty in quantities.items():
+        entry = items_dict.get(item_id)
+        limited = entry is not None and entry[2]
+        deltas.append((item_id, -qty, -qty if limited else 0))
+    return deltas
+
+
+def restore_stock(items_dict: MutableMapping[
+        str, Tuple[Item, int, Optional[int]]],
+        deltas: Iterable[StockDelta]) -> None:
+    """Undo the stock changes of a checkout that was never paid for."""
+    for item_id, stock_delta, limit_delta in deltas:
+        item, level, limit = items_dict[item_id]
+        items_dict[item_id] = (item, level - stock_delta,
+                               None if limit is None
+                               else limit - limit_delta)
+
+
+def _put_str(parts: List[bytes], text: str) -> None:
+    data = text.encode('utf-8')
+    parts.append(_LENGTH.pack(len(data)))
+    parts.append(data)
+
+
+def _number(value: Optional[float]) -> float:
+    return math.nan if value is None else value
+
+
+def encode_record(trans: Transaction, deltas: Iterable[StockDelta]) -> bytes:
+    """Return the framed journal record of a transaction."""
+    deltas = list(deltas)
+    parts = [_COUNT.pack(len(deltas))]
+    for item_id, stock_delta, limit_delta in deltas:
+        _put_str(parts, item_id)
+        parts.append(_DELTA.pack(stock_delta, limit_delta))
+
+    customer = trans.customer
+    for text in (trans.date, trans.time,
+                 customer.membership_number if customer else '',
+                 trans.fulfilment_type.name if trans.fulfilment_type else '',
+                 trans.payment_method.name if trans.payment_method else ''):
+        _put_str(parts, text)
+    parts.append(_TOTALS.pack(
+        trans.total_items_purchased or 0,
+        _number(trans.all_items_subtotal),
+        _number(trans.fulfilment_surcharge_amount),
+        _number(trans.rounding_amount_applied), _number(trans.final_total),
+        _number(trans.amount_tendered), _number(trans.change_amount),
+        _number(trans.amount_saved)))
+
+    parts.append(_COUNT.pack(len(trans.transaction_lines)))
+    for line in trans.transaction_lines:
+        _put_str(parts, line.item.id)
+        parts.append(_QUANTITY.pack(line.quantity))
+
+    payload = b''.join(parts)
+    return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+class TransactionJournal:
+    """
+    Journal file that finalised transactions are appended to.
+
+    append() returns once the record is durable, unless wait=False is
+    given; either way fsync is shared by every record in the same group.
+    """
+
+    def __init__(self, path: str, max_delay: float = 0.005,
+                 max_batch: int = 256):
+        """
+        Open a journal for appending, creating it if needed.
+
+        A torn record at the end of the file is truncated, so new records
+        follow the last complete one. Raises ValueError if the file is not
+        a journal.
+        """
+        self.path = path
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._file = open(path, 'a+b')
+        try:
+            self._file.truncate(_valid_end(path))
+        except ValueError:
+            self._file.close()
+            raise
+        if self._file.seek(0, os.SEEK_END) == 0:
+            self._file.write(MAGIC)
+        self._lock = threading.Lock()
+        self._pending = threading.Condition(self._lock)
+        self._synced = threading.Condition(self._lock)
+        self._appended = 0
+        self._durable = 0
+        self._closed = False
+        self.syncs = 0
+        self._flusher = threading.Thread(target=self._run, daemon=True)
+        self._flusher.start()
+
+    def append(self, trans: Transaction, deltas: Iterable[StockDelta],
+               wait: bool = True) -> int:
+        """Append a finalised transaction, returning its sequence number."""
+        record = encode_record(trans, deltas)
+        with self._lock:
+            if self._closed:
+                raise ValueError('The journal is closed.')
+            self._file.write(record)
+            self._appended += 1
+            sequence = self._appended
+            if sequence - self._durable in (1, self.max_batch):
+                self._pending.notify()
+            while wait and self._durable < sequence:
+                self._synced.wait()
+        return sequence
+
+    def sync(self) -> None:
+        """Wait until every record appended so far is durable."""
+        with self._lock:
+            sequence = self._appended
+            self._pending.notify()
+            while self._durable < sequence:
+                self._synced.wait()
+
+    def position(self) -> int:
+        """Return the journal's length in bytes once everything is synced."""
+        self.sync()
+        with self._lock:
+            return self._file.tell()
+
+    def _run(self) -> None:
+        with self._lock:
+            while True:
+                while not self._closed and self._appended == self._durable:
+                    self._pending.wait()
+                if self._appended == self._durable:
+                    return
+                # Give other appenders a chance to join this group
+                if (not self._closed and
+                        self._appended - self._durable < self.max_batch):
+                    self._pending.wait(self.max_delay)
+                target = self._appended
+                self._file.flush()
+                descriptor = self._file.fileno()
+                self._lock.release()
+                try:
+                    os.fsync(descriptor)
+                finally:
+                    self._lock.acquire()
+                self.syncs += 1
+                self._durable = target
+                self._synced.notify_all()
+
+    def close(self) -> None:
+        """Make every record durable and close the journal."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._pending.notify()
+        self._flusher.join()
+        self._file.close()
+
+    def __enter__(self) -> 'TransactionJournal':
+        """Return the journal."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close the journal."""
+        self.close()
+
+
+def _records(data: bytes, offset: int) -> Iterator[Tuple[int, memoryview]]:
+    # Yield (offset after the record, payload) up to the first torn record
+    view = memoryview(data)
+    if offset < len(MAGIC):
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError('Not a MegaMart journal.')
+        offset = len(MAGIC)
+    end = len(data)
+    while offset + _FRAME.size <= end:
+        length, checksum = _FRAME.unpack_from(data, offset)
+        start = offset + _FRAME.size
+        if start + length > end:
+            break
+        payload = view[start:start + length]
+        if zlib.crc32(payload) != checksum:
+            break
+        offset = start + length
+        yield offset, payload
+
+
+def _valid_end(path: str) -> int:
+    # Return the offset after the last complete record, so a torn tail
+    # left by a crash is cut off before anything is appended after it
+    with open(path, 'rb') as source:
+        data = source.read()
+    if MAGIC.startswith(data):
+        return 0
+    end = len(MAGIC)
+    for end, _ in _records(data, 0):
+        pass
+    return end
+
+
+def _get_str(data: memoryview, offset: int) -> Tuple[str, int]:
+    (length,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    return str(data[offset:offset + length], 'utf-8'), offset + length
+
+
+def _deltas(payload: memoryview) -> Tuple[List[StockDelta], int]:
+    (count,) = _COUNT.unpack_from(payload, 0)
+    offset = _COUNT.size
+    deltas = []
+    for _ in range(count):
+        item_id, offset = _get_str(payload, offset)
+        stock_delta, limit_delta = _DELTA.unpack_from(payload, offset)
+        offset += _DELTA.size
+        deltas.append((item_id, stock_delta, limit_delta))
+    return deltas, offset
+
+
+def read_journal(path: str, offset: int = 0) -> Iterator[Dict[str, object]]:
+    """Yield every complete journal record as a dictionary."""
+    with open(path, 'rb') as source:
+        data = source.read()
+    for _, payload in _records(data, offset):
+        deltas, position = _deltas(payload)
+        texts = []
+        for _ in range(5):
+            text, position = _get_str(payload, position)
+            texts.append(text)
+        totals = _TOTALS.unpack_from(payload, position)
+        position += _TOTALS.size
+        (count,) = _COUNT.unpack_from(payload, position)
+        position += _COUNT.size
+        lines = []
+        for _ in range(count):
+            item_id, position = _get_str(payload, position)
+            (qty,) = _QUANTITY.unpack_from(payload, position)
+            position += _QUANTITY.size
+            lines.append([item_id, qty])
+        yield {'date': texts[0], 'time': texts[1],
+               'membership_number': texts[2] or None,
+               'fulfilment_type': texts[3], 'payment_method': texts[4],
+               'total_items_purchased': totals[0],
+               'all_items_subtotal': totals[1],
+               'fulfilment_surcharge_amount': totals[2],
+               'rounding_amount_applied': totals[3],
+               'final_total': totals[4], 'amount_tendered': totals[5],
+               'change_amount': totals[6], 'amount_saved': totals[7],
+               'lines': lines,
+               'deltas': [list(delta) for delta in deltas]}
+
+
+def replay(stock: StockLevels, path: str, offset: int = 0) -> Tuple[int, int]:
+    """
+    Apply the journal's stock deltas to stock levels, in place.
+
+    Starts from the byte offset a snapshot was taken at, and returns the
+    number of records applied and the offset replay stopped at.
+    """
+    with open(path, 'rb') as source:
+        data = source.read()
+    applied = 0
+    end = max(offset, len(MAGIC))
+    for end, payload in _records(data, offset):
+        for item_id, stock_delta, limit_delta in _deltas(payload)[0]:
+            levels = stock.get(item_id)
+            if levels is None:
+                continue
+            levels[0] += stock_delta
+            if levels[1] is not None:
+                levels[1] += limit_delta
+        applied += 1
+    return applied, end
+
+
+def stock_levels(items_dict: Mapping[str, Tuple[Item, int, Optional[int]]]
+                 ) -> StockLevels:
+    """Return the stock levels of an items dictionary."""
+    return {item_id: [entry[1], entry[2]]
+            for item_id, entry in items_dict.items()}
+
+
+def apply_stock_levels(items_dict: MutableMapping[
+        str, Tuple[Item, int, Optional[int]]], stock: StockLevels) -> None:
+    """Write stock levels back into an items dictionary."""
+    for item_id, (level, limit) in stock.items():
+        if item_id in items_dict:
+            items_dict[item_id] = (items_dict[item_id][0], level, limit)
+
+
+def write_snapshot(path: str, stock: StockLevels, offset: int) -> None:
+    """Write stock levels, taken at a journal byte offset, to a file."""
+    with open(path, 'w', newline='', encoding='utf-8') as output:
+        writer = csv.writer(output)
+        writer.writerow(['journal_offset', offset])
+        writer.writerows([item_id, level, '' if limit is None else limit]
+                         for item_id, (level, limit) in stock.items())
+
+
+def load_snapshot(path: str) -> Tuple[StockLevels, int]:
+    """Return the stock levels in a snapshot and its journal offset."""
+    with open(path, newline='', encoding='utf-8') as source:
+        reader = csv.reader(source)
+        offset = int(next(reader)[1])
+        return ({item_id: [int(level), int(limit) if limit else None]
+                 for item_id, level, limit in reader}, offset)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Replay or dump a journal from the command line."""
+    parser = argparse.ArgumentParser(description='MegaMart journal tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+    rebuild = commands.add_parser(
+        'snapshot-replay', help='apply a journal to a stock snapshot')
+    rebuild.add_argument('snapshot')
+    rebuild.add_argument('journal')
+    rebuild.add_argument('-o', '--output', required=True,
+                         help='snapshot file to write the result to')
+    dump = commands.add_parser('dump', help='print records as JSON lines')
+    dump.add_argument('journal')
+    args = parser.parse_args(argv)
+
+    if args.command == 'dump':
+        for record in read_journal(args.journal):
+            print(json.dumps(record))
+        return
+
+    stock, offset = load_snapshot(args.snapshot)
+    applied, end = replay(stock, args.journal, offset)
+    write_snapshot(args.output, stock, end)
+    print('Applied {} records up to byte {}.'.format(applied, end))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""Vectorised NumPy versions of the megamart pricing functions.
+
+Each kernel takes whole arrays of inputs and returns an array of results
+together with a boolean mask of the rows for which the scalar function
+would have raised; those rows hold NaN. Valid rows match the scalar
+functions bit for bit, including Python's round(x, 2): the exact value of
+x * 100 is rounded half to even, rather than the float product that
+numpy.round rounds.
+
+Discount types, fulfilment types and payment methods are passed as small
+integer codes made by encode(), with NO_CODE standing for None. Missing
+amounts, such as a customer without a delivery distance, are NaN.
+
+Needs numpy, which the rest of megamart does not import.
+"""
+from enum import Enum
+from typing import (Any, Dict, Iterable, List, Mapping, Optional, Tuple,
+                    Type)
+import numpy as np
+from DiscountType import DiscountType
+from PaymentMethod import PaymentMethod
+from FulfilmentType import FulfilmentType
+from Item import Item
+from Discount import Discount
+
+Kernel = Tuple[np.ndarray, np.ndarray]
+
+NO_CODE = 0
+
+
+def code(member: Optional[Enum]) -> int:
+    """Return the integer code of an enum member, or NO_CODE for None."""
+    if member is None:
+        return NO_CODE
+    return list(type(member)).index(member) + 1
+
+
+def encode(members: Iterable[Optional[Enum]],
+           enum: Type[Enum]) -> np.ndarray:
+    """Return the integer codes of a sequence of enum members as an array."""
+    codes: Dict[Optional[Enum], int] = {member: code(member)
+                                        for member in enum}
+    codes[None] = NO_CODE
+    return np.fromiter((codes[member] for member in members), np.int8)
+
+
+_PERCENTAGE = code(DiscountType.PERCENTAGE)
+_FLAT = code(DiscountType.FLAT)
+_DELIVERY = code(FulfilmentType.DELIVERY)
+_CASH = code(PaymentMethod.CASH)
+
+# Splits a float into two halves of at most 26 significant bits each
+_SPLITTER = 134217729.0
+# Below this many cents every step of round2 is exact
+_EXACT_CENTS = 2.0 ** 51
+
+
+def round2(values: Any) -> np.ndarray:
+    """Return round(value, 2) of every value, exactly as Python rounds."""
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(over='ignore', invalid='ignore'):
+        cents = values * 100
+        # The exact product is cents + error (Dekker's two-product; both
+        # halves times 100 fit in a float, so no step below rounds)
+        split = values * _SPLITTER
+        high = split - (split - values)
+        low = values - high
+        error = (high * 100 - cents) + low * 100
+
+        nearest = np.rint(cents)
+        offset = cents - nearest
+        # The sign of each sum is exact, so exact ties keep nearest, which
+        # rint already made even
+        rounded = (nearest + ((offset - 0.5) + error > 0)
+                   - ((offset + 0.5) + error < 0))
+        result = np.copysign(rounded / 100, values)
+
+    fallback = ~(np.abs(cents) < _EXACT_CENTS)
+    if fallback.any():
+        result[fallback] = [round(value, 2)
+                            for value in values[fallback].tolist()]
+    return result
+
+
+def final_item_prices(prices: Any, discount_types: Any,
+                      discount_values: Any) -> Kernel:
+    """
+    Return final prices as calculate_final_item_price works them out.
+
+    prices are the items' original prices; discount_types the codes of
+    their discounts' types, NO_CODE if an item has no discount. The mask
+    marks the rows for which calculate_final_item_price raises
+    InsufficientStockException: percentages outside 1 to 100, and flat
+    discounts giving a negative price or a price above the original.
+    """
+    rounded = round2(prices)
+    types = np.asarray(discount_types)
+    values = np.asarray(discount_values, dtype=np.float64)
+    percentage = types == _PERCENTAGE
+    flat = types == _FLAT
+
+    with np.errstate(invalid='ignore'):
+        reduced = round2(np.where(percentage,
+                                  rounded - rounded * (values / 100),
+                                  rounded - values))
+        invalid = ((percentage & ((values < 1.00) | (values > 100.00))) |
+                   (flat & ((reduced > rounded) | (reduced < 0))))
+    result = np.where(percentage | flat, reduced, rounded)
+    result[invalid] = np.nan
+    return result, invalid
+
+
+def item_savings(original_prices: Any, final_prices: Any) -> Kernel:
+    """
+    Return the savings on items as calculate_item_savings works them out.
+
+    The mask marks the rows for which calculate_item_savings raises
+    FulfilmentException: a final price above the original price.
+    """
+    original = np.asarray(original_prices, dtype=np.float64)
+    final = np.asarray(final_prices, dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        invalid = final > original
+    result = round2(round2(original) - round2(final))
+    result[invalid] = np.nan
+    return result, invalid
+
+
+def fulfilment_surcharges(fulfilment_types: Any, distances: Any) -> Kernel:
+    """
+    Return fulfilment surcharges as cfs works them out.
+
+    distances are the customers' delivery distances in kilometres, NaN
+    for no customer or no distance. The mask marks the rows for which cfs
+    raises FulfilmentException: no fulfilment type, and deliveries
+    without a positive distance.
+    """
+    types = np.asarray(fulfilment_types)
+    distances = np.asarray(distances, dtype=np.float64)
+    delivery = types == _DELIVERY
+    with np.errstate(invalid='ignore'):
+        calculated = 0.5 * distances
+        invalid = ((types == NO_CODE) |
+                   (delivery & ~(distances > 0)))
+        result = np.where(delivery,
+                          round2(np.where(calculated > 5, calculated, 5.0)),
+                          0.0)
+    result[invalid] = np.nan
+    return result, invalid
+
+
+def round_off_subtotals(subtotals: Any, payment_methods: Any) -> Kernel:
+    """
+    Return subtotals rounded as round_off_subtotal rounds them.
+
+    Cash payments are rounded to 5 cents from the subtotal's whole cents,
+    as round_off_subtotal does. The mask marks the rows for which
+    round_off_subtotal raises InsufficientFundsException: no payment
+    method.
+    """
+    methods = np.asarray(payment_methods)
+    rounded = round2(subtotals)
+    with np.errstate(invalid='ignore'):
+        cash = round2(5 * np.rint(np.trunc(rounded * 100) / 5) / 100)
+    invalid = methods == NO_CODE
+    result = np.where(methods == _CASH, cash, rounded)
+    result[invalid] = np.nan
+    return result, invalid
+
+
+def price_arrays(items: Iterable[Item],
+                 discounts_dict: Mapping[str, Discount]
+                 ) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Return the item IDs, prices and discounts of items as kernel inputs.
+
+    Items without a discount get NO_CODE and a discount value of 0.
+    """
+    ids: List[str] = []
+    prices: List[float] = []
+    types: List[Optional[Enum]] = []
+    values: List[float] = []
+    for item in items:
+        discount = discounts_dict.get(item.id)
+        ids.append(item.id)
+        prices.append(item.original_price)
+        types.append(discount.type if discount is not None else None)
+        values.append(discount.value if discount is not None else 0.0)
+    return (ids, np.array(prices, dtype=np.float64),
+            encode(types, DiscountType), np.array(values, dtype=np.float64))
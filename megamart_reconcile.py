@@ -0,0 +1,283 @@
+"""Offline end-of-day reconciliation of a day's transactions.
+
+Re-runs a transaction file through the checkout rules, starting from a
+dataset's catalog, and reports every transaction whose recomputed final
+total differs from the one recorded for it:
+
+    python megamart_reconcile.py DATASET [TRANSACTIONS] --workers 8
+
+DATASET is a megadata_gen dataset directory holding the start of day
+catalog. TRANSACTIONS is a file of JSON transaction records in the
+megadata_gen format (the dataset's own transactions.jsonl by default) or
+a megamart_journal file. JSON records without a final_total are re-run but
+not compared.
+
+Pricing does not depend on stock levels, so it is spread over a process
+pool: each worker loads the catalog once, then works out the per-item
+quantities, restriction checks and totals of a chunk of records at a time.
+The coordinator takes the results back in file order and applies the
+stock checks and decrements exactly as checkout would, so the report and
+the closing stock levels are the same for any number of workers.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from itertools import islice
+from typing import (Any, Dict, Iterable, Iterator, List, Mapping,
+                    MutableMapping, Optional, Tuple)
+from Item import Item
+from Customer import Customer
+from Discount import Discount
+
+from InsufficientStockException import InsufficientStockException
+
+import megadata_gen
+from megamart import (cfs, get_purch_quantity_limit, is_restricted,
+                      is_stock_suff, purchase_not_allow, round_off_subtotal,
+                      _price_skus)
+
+ItemEntry = Tuple[Item, int, Optional[int]]
+Record = Mapping[str, Any]
+# items purchased, subtotal, surcharge, rounding, final total, amount saved
+Totals = Tuple[int, float, float, float, float, float]
+# (item ID, quantity) per item, the index of the item whose checks fail
+# (AFTER_STOCK if checkout only fails once stock is checked), the name of
+# the exception checkout raises, the totals and the recorded final total.
+# The quantities are None if checkout fails before any item is checked.
+Priced = Tuple[Optional[List[Tuple[str, int]]], Optional[int],
+               Optional[str], Optional[Totals], Optional[float]]
+
+AFTER_STOCK = -1
+
+# Each worker's copy of the catalog: items, customers, discounts
+_catalog: Optional[Tuple[Mapping[str, ItemEntry], Mapping[str, Customer],
+                         Mapping[str, Discount]]] = None
+
+
+class ReconcileReport:
+    """Outcome of re-running a transaction file."""
+
+    def __init__(self, items_dict: MutableMapping[str, ItemEntry]):
+        """Start an empty report over the start of day items dictionary."""
+        self.items_dict = items_dict
+        self.transactions = 0
+        self.checked_out = 0
+        self.compared = 0
+        self.takings = 0.00
+        self.rejected: Dict[str, int] = {}
+        # (record number from 1, recorded final total, recomputed total)
+        self.mismatches: List[Tuple[int, float, float]] = []
+
+    def summary(self, show: int = 20) -> str:
+        """Return the report as printable lines."""
+        lines = ['Transactions:  {}'.format(self.transactions),
+                 'Checked out:   {}'.format(self.checked_out),
+                 'Takings:       {:.2f}'.format(self.takings),
+                 'Compared:      {}'.format(self.compared),
+                 'Mismatches:    {}'.format(len(self.mismatches))]
+        for name, count in sorted(self.rejected.items()):
+            lines.append('Rejected:      {} {}'.format(count, name))
+        for number, recorded, total in self.mismatches[:show]:
+            lines.append('  record {}: recorded {:.2f}, recomputed {:.2f}'
+                         .format(number, recorded, total))
+        return '\n'.join(lines)
+
+
+def read_records(path: str) -> Iterator[Record]:
+    """Yield the transaction records of a JSON lines or journal file."""
+    import megamart_journal
+    with open(path, 'rb') as source:
+        journal = source.read(len(megamart_journal.MAGIC))
+    if journal == megamart_journal.MAGIC:
+        yield from megamart_journal.read_journal(path)
+        return
+    with open(path, encoding='utf-8') as source:
+        for line in source:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _load_catalog(directory: str) -> None:
+    global _catalog  # pylint: disable=global-statement
+    _catalog = (megadata_gen.load_items(directory),
+                megadata_gen.load_customers(directory),
+                megadata_gen.load_discounts(directory))
+
+
+def price_record(record: Record, items_dict: Mapping[str, ItemEntry],
+                 customers_dict: Mapping[str, Customer],
+                 discounts_dict: Mapping[str, Discount]) -> Priced:
+    """
+    Return everything about a transaction record that stock does not affect.
+
+    Items are checked and priced in the order checkout uses, so the totals
+    match checkout to the last bit.
+    """
+    recorded = record.get('final_total')
+    try:
+        trans = megadata_gen.transaction_from_record(record, items_dict,
+                                                     customers_dict)
+    except Exception as error:  # pylint: disable=broad-except
+        return None, None, type(error).__name__, None, recorded
+
+    skus: Dict[str, List] = {}
+    for line in trans.transaction_lines:
+        sku = skus.get(line.item.id)
+        if sku is None:
+            skus[line.item.id] = [line.item, line.quantity]
+        else:
+            sku[1] += line.quantity
+    quantities = [(item_id, sku[1]) for item_id, sku in skus.items()]
+
+    # One decision covers every restricted item, as in checkout
+    not_allowed = None
+    for index, (item, _) in enumerate(skus.values()):
+        if not is_restricted(item):
+            continue
+        try:
+            if not_allowed is None:
+                not_allowed = purchase_not_allow(item, trans.customer,
+                                                 trans.date)
+        except Exception as error:  # pylint: disable=broad-except
+            return quantities, index, type(error).__name__, None, recorded
+        if not_allowed:
+            return (quantities, index, 'RestrictedItemException', None,
+                    recorded)
+
+    try:
+        total_items, subtotal, savings = _price_skus(skus.values(),
+                                                     discounts_dict)
+        if trans.fulfilment_type is None:
+            raise InsufficientStockException("debug fulfilment_type")
+        surcharge = cfs(trans.fulfilment_type, trans.customer)
+        if trans.payment_method is None:
+            raise InsufficientStockException()
+        temp_total = subtotal + surcharge
+        final_total = round_off_subtotal(temp_total, trans.payment_method)
+    except Exception as error:  # pylint: disable=broad-except
+        return (quantities, AFTER_STOCK, type(error).__name__, None,
+                recorded)
+
+    return quantities, None, None, (
+        total_items, round(subtotal, 2), round(surcharge, 2),
+        round(final_total - temp_total, 2), final_total,
+        round(savings, 2)), recorded
+
+
+def _price_chunk(records: List[Record]) -> List[Priced]:
+    assert _catalog is not None
+    items_dict, customers_dict, discounts_dict = _catalog
+    return [price_record(record, items_dict, customers_dict, discounts_dict)
+            for record in records]
+
+
+def _chunks(records: Iterable[Record], size: int) -> Iterator[List[Record]]:
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _stock_failure(items_dict: MutableMapping[str, ItemEntry],
+                   quantities: List[Tuple[str, int]], blocked: Optional[int],
+                   error: Optional[str]) -> Optional[str]:
+    # The exception checkout raises while checking items, if any
+    for index, (item_id, qty) in enumerate(quantities):
+        if index == blocked:
+            return error
+        item = items_dict[item_id][0]
+        try:
+            if not is_stock_suff(item, qty, items_dict):
+                return 'InsufficientStockException'
+        except InsufficientStockException:
+            return 'InsufficientStockException'
+        limit = get_purch_quantity_limit(item, items_dict)
+        if limit and qty > limit:
+            return 'PurchaseLimitExceededException'
+    return None
+
+
+def apply_priced(report: ReconcileReport, priced: Priced,
+                 tolerance: float = 0.005) -> None:
+    """Check and apply the next priced record's stock, in file order."""
+    quantities, blocked, error, totals, recorded = priced
+    report.transactions += 1
+    if quantities is not None:
+        failure = _stock_failure(report.items_dict, quantities, blocked,
+                                 error)
+        # Checkout only takes stock once the whole transaction is priced
+        if failure is None and error is None:
+            items_dict = report.items_dict
+            for item_id, qty in quantities:
+                item, stock, limit = items_dict[item_id]
+                items_dict[item_id] = (item, stock - qty,
+                                       limit - qty if limit else limit)
+        error = failure or error
+    if error is not None or totals is None:
+        report.rejected[error or ''] = report.rejected.get(error or '', 0) + 1
+        return
+
+    report.checked_out += 1
+    report.takings += totals[4]
+    if recorded is not None:
+        report.compared += 1
+        if abs(recorded - totals[4]) > tolerance:
+            report.mismatches.append((report.transactions, recorded,
+                                      totals[4]))
+
+
+def reconcile(directory: str, path: Optional[str] = None,
+              workers: Optional[int] = None, chunk_size: int = 256,
+              tolerance: float = 0.005) -> ReconcileReport:
+    """
+    Return the reconciliation report of a transaction file.
+
+    workers defaults to one per CPU; with one worker everything runs in
+    this process. The report's items dictionary holds the closing stock.
+    """
+    if path is None:
+        path = os.path.join(directory, megadata_gen.TRANSACTIONS_FILE)
+    report = ReconcileReport(megadata_gen.load_items(directory))
+    chunks = _chunks(read_records(path), chunk_size)
+
+    workers = workers or multiprocessing.cpu_count()
+    if workers == 1:
+        _load_catalog(directory)
+        for chunk in chunks:
+            for priced in _price_chunk(chunk):
+                apply_priced(report, priced, tolerance)
+        return report
+
+    with multiprocessing.Pool(workers, _load_catalog, (directory,)) as pool:
+        # imap returns chunks in submission order whatever finishes first
+        for results in pool.imap(_price_chunk, chunks):
+            for priced in results:
+                apply_priced(report, priced, tolerance)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Reconcile a transaction file from the command line."""
+    parser = argparse.ArgumentParser(description='MegaMart reconciliation')
+    parser.add_argument('dataset', help='megadata_gen dataset directory')
+    parser.add_argument('transactions', nargs='?',
+                        help='JSON lines or journal file of transactions')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--show', type=int, default=20,
+                        help='number of mismatches to print')
+    args = parser.parse_args(argv)
+
+    report = reconcile(args.dataset, args.transactions, args.workers,
+                       args.chunk_size)
+    print(report.summary(args.show))
+    if report.mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Asyncio checkout service that owns one catalog for many terminals.
+
+Terminals talk to the service over TCP or a Unix socket using one JSON
+object per line. Every request carries an "op" and an optional "id" that
+is echoed back, so clients may pipeline many requests before reading the
+responses. Responses on one connection are sent in request order.
+
+Ops:
+    scan         {"item_id"} -> item details and current stock
+    price        {"item_id"} -> final price and savings per unit
+    discount     {"item_id"} -> the item's discount, or null
+    link_member  {"membership_number"} -> customer details
+    checkout     {"date", "time", "lines": [[item_id, qty], ...],
+                  "membership_number", "fulfilment_type",
+                  "payment_method"} -> checkout totals
+Errors are returned as {"error": <exception type>, "message": <text>}.
+"""
+import argparse
+import asyncio
+import json
+from typing import Any, Callable, Dict, Optional
+from Customer import Customer
+from Discount import Discount
+from FulfilmentType import FulfilmentType
+from PaymentMethod import PaymentMethod
+from Transaction import Transaction
+from TransactionLine import TransactionLine
+
+from megamart import (ChanR, RenameR, calculate_final_item_price,
+                      calculate_item_savings, checkout)
+
+Request = Dict[str, Any]
+Response = Dict[str, Any]
+
+# Requests read ahead of the one being answered, per connection. Once full,
+# the server stops reading and the socket buffers push back on the client.
+PIPELINE_DEPTH = 64
+
+
+class CheckoutServer:
+    """Serve scan, price, link member and checkout requests for a catalog."""
+
+    def __init__(self, items_dict: ChanR, discounts_dict: RenameR,
+                 customers_dict: Dict[str, Customer]):
+        """Serve the given items, discounts and customers dictionaries."""
+        self.items_dict: ChanR = items_dict
+        self.discounts_dict: RenameR = discounts_dict
+        self.customers_dict: Dict[str, Customer] = customers_dict
+        self._ops: Dict[str, Callable[[Request], Response]] = {
+            'scan': self.scan,
+            'price': self.price,
+            'discount': self.discount,
+            'link_member': self.link_member,
+            'checkout': self.checkout,
+        }
+
+    def scan(self, request: Request) -> Response:
+        """Return an item's details and stock level."""
+        item, stock, limit = self.items_dict[request['item_id']]
+        return {'id': item.id, 'name': item.name,
+                'original_price': item.original_price,
+                'categories': item.categories, 'stock': stock,
+                'limit': limit}
+
+    def price(self, request: Request) -> Response:
+        """Return an item's final price and savings per unit."""
+        item = self.items_dict[request['item_id']][0]
+        final_price = calculate_final_item_price(item, self.discounts_dict)
+        return {'final_price': final_price,
+                'savings': calculate_item_savings(item.original_price,
+                                                  final_price)}
+
+    def discount(self, request: Request) -> Response:
+        """Return an item's discount, if it has one."""
+        discount: Optional[Discount] = self.discounts_dict.get(
+            request['item_id'])
+        if discount is None:
+            return {'discount': None}
+        return {'discount': {'type': discount.type.name,
+                             'value': discount.value}}
+
+    def link_member(self, request: Request) -> Response:
+        """Return a customer's details."""
+        customer = self.customers_dict[request['membership_number']]
+        return {'membership_number': customer.membership_number,
+                'name': customer.name,
+                'date_of_birth': customer.date_of_birth,
+                'id_verified': customer.id_verified,
+                'delivery_distance_km': customer.delivery_distance_km}
+
+    def checkout(self, request: Request) -> Response:
+        """Check out a transaction against the shared catalog."""
+        trans = Transaction(request['date'], request['time'])
+        trans.transaction_lines = [
+            TransactionLine(self.items_dict[item_id][0], qty)
+            for item_id, qty in request['lines']]
+        member = request.get('membership_number')
+        trans.customer = (None if member is None
+                          else self.customers_dict[member])
+        trans.fulfilment_type = FulfilmentType[request['fulfilment_type']]
+        trans.payment_method = PaymentMethod[request['payment_method']]
+
+        # Runs without yielding to the event loop, so every checkout sees
+        # and leaves one consistent view of the stock levels.
+        checkout(trans, self.items_dict, self.discounts_dict)
+        return {'total_items_purchased': trans.total_items_purchased,
+                'all_items_subtotal': trans.all_items_subtotal,
+                'fulfilment_surcharge_amount':
+                    trans.fulfilment_surcharge_amount,
+                'rounding_amount_applied': trans.rounding_amount_applied,
+                'final_total': trans.final_total,
+                'amount_saved': trans.amount_saved}
+
+    def handle(self, request: Request) -> Response:
+        """Return the response to one request, or the error it raised."""
+        try:
+            response = self._ops[request['op']](request)
+        except Exception as error:  # pylint: disable=broad-except
+            response = {'error': type(error).__name__, 'message': str(error)}
+        if 'id' in request:
+            response['req'] = request['id']
+        return response
+
+    async def serve_connection(self, reader: asyncio.StreamReader,
+                               writer: asyncio.StreamWriter) -> None:
+        """Answer pipelined requests on one connection until it closes."""
+        queue: 'asyncio.Queue[Optional[bytes]]' = asyncio.Queue(
+            PIPELINE_DEPTH)
+
+        async def read() -> None:
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    await queue.put(line)
+            finally:
+                await queue.put(None)
+
+        reading = asyncio.ensure_future(read())
+        try:
+            while True:
+                line = await queue.get()
+                if line is None:
+                    break
+                try:
+                    response = self.handle(json.loads(line))
+                except ValueError as error:
+                    response = {'error': type(error).__name__,
+                                'message': str(error)}
+                writer.write(json.dumps(response).encode() + b'\n')
+                # Only drain once the pipeline is empty, to batch writes
+                if queue.empty():
+                    await writer.drain()
+        finally:
+            reading.cancel()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765,
+                    path: Optional[str] = None) -> asyncio.AbstractServer:
+        """Start listening on a TCP port, or on a Unix socket path."""
+        if path is not None:
+            return await asyncio.start_unix_server(self.serve_connection,
+                                                   path)
+        return await asyncio.start_server(self.serve_connection, host, port)
+
+
+async def _serve_forever(server: CheckoutServer, host: str, port: int,
+                         path: Optional[str]) -> None:
+    listener = await server.start(host, port, path)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main() -> None:
+    """Serve the megadata catalog until interrupted."""
+    parser = argparse.ArgumentParser(description='MegaMart checkout server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='listen on a Unix socket path')
+    args = parser.parse_args()
+
+    import megadata  # pylint: disable=import-outside-toplevel
+    server = CheckoutServer(megadata.items, megadata.discounts,
+                            megadata.customers)
+    try:
+        asyncio.run(_serve_forever(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Startup helpers for the terminal: deferred catalogs and a profiler.
+
+StartupProfiler times every module imported while it is running, and the
+phases marked by the caller, and prints them as a report:
+
+    python main.py --profile-startup
+
+measure_cold_start runs main.py in a fresh interpreter until the terminal
+has shown its main menu, which the benchmark suite holds to
+COLD_START_BUDGET.
+"""
+import builtins
+import os
+import sys
+import time
+from typing import (Any, Callable, Dict, Iterator, List, MutableMapping,
+                    Optional, Tuple)
+
+# Seconds a fresh `python main.py` may take to reach the main menu.
+COLD_START_BUDGET = 0.25
+
+_MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+class LazyMapping(MutableMapping):
+    """
+    Mapping that is only built the first time it is used.
+
+    Lets the terminal start before a catalog is imported or loaded; the
+    loader is called once, on the first lookup, and the mapping it
+    returns is used from then on.
+    """
+
+    def __init__(self, loader: Callable[[], MutableMapping]):
+        """Defer building the mapping until it is first needed."""
+        self._loader: Optional[Callable[[], MutableMapping]] = loader
+        self._mapping: Optional[MutableMapping] = None
+
+    @property
+    def loaded(self) -> bool:
+        """Return True once the mapping has been built."""
+        return self._mapping is not None
+
+    def _load(self) -> MutableMapping:
+        if self._mapping is None:
+            self._mapping = self._loader()
+            self._loader = None
+        return self._mapping
+
+    def __getitem__(self, key: Any) -> Any:
+        """Return the value for a key."""
+        return self._load()[key]
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        """Store the value for a key."""
+        self._load()[key] = value
+
+    def __delitem__(self, key: Any) -> None:
+        """Remove a key."""
+        del self._load()[key]
+
+    def __contains__(self, key: object) -> bool:
+        """Return True if the key is present."""
+        return key in self._load()
+
+    def __iter__(self) -> Iterator[Any]:
+        """Iterate over the keys."""
+        return iter(self._load())
+
+    def __len__(self) -> int:
+        """Return the number of keys."""
+        return len(self._load())
+
+
+class StartupProfiler:
+    """Record import times and named startup phases."""
+
+    def __init__(self) -> None:
+        """Start the clock for the phases."""
+        self._started = time.perf_counter()
+        self._original: Optional[Callable[..., Any]] = None
+        # Time spent in nested imports of each import in progress
+        self._nested: List[float] = []
+        # Module name -> (own seconds, seconds including nested imports)
+        self.imports: Dict[str, Tuple[float, float]] = {}
+        self.phases: List[Tuple[str, float]] = []
+
+    def start(self) -> None:
+        """Begin timing imports."""
+        if self._original is None:
+            self._original = builtins.__import__
+            builtins.__import__ = self._import
+
+    def stop(self) -> None:
+        """Stop timing imports."""
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name: str, globals_: Any = None, locals_: Any = None,
+                fromlist: Any = (), level: int = 0) -> Any:
+        assert self._original is not None
+        if level or name in sys.modules:
+            return self._original(name, globals_, locals_, fromlist, level)
+
+        self._nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original(name, globals_, locals_, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._nested.pop()
+            self.imports.setdefault(name, (elapsed - nested, elapsed))
+            if self._nested:
+                self._nested[-1] += elapsed
+
+    def mark(self, phase: str) -> None:
+        """Record the time at which a startup phase finished."""
+        self.phases.append((phase, time.perf_counter() - self._started))
+
+    def report(self, top: int = 15) -> str:
+        """Return the phases and slowest imports as a printable table."""
+        lines = ['Startup phases (ms since profiling started):']
+        for phase, seconds in self.phases:
+            lines.append('  {:<40} {:>9.1f}'.format(phase, seconds * 1e3))
+        lines.append('Slowest imports (ms, own / including nested):')
+        slowest = sorted(self.imports.items(), key=lambda entry: entry[1][1],
+                         reverse=True)[:top]
+        for name, (own, total) in slowest:
+            lines.append('  {:<40} {:>9.1f} {:>9.1f}'.format(
+                name, own * 1e3, total * 1e3))
+        return '\n'.join(lines)
+
+
+def measure_cold_start(runs: int = 5,
+                       args: Tuple[str, ...] = ()) -> float:
+    """Return the fastest of several fresh main.py starts, in seconds."""
+    # Only the benchmark suite spawns interpreters, so a terminal's startup
+    # never pays for importing subprocess
+    import subprocess
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, _MAIN, '--exit-after-startup']
+                       + list(args), check=True, stdin=subprocess.DEVNULL,
+                       stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
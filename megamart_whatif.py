@@ -0,0 +1,394 @@
+"""What-if pricing of historical carts under candidate discounts.
+
+Answers questions like "what would last month's takings have been with 25%
+instead of 20% off item 1?" without checking anything out: carts are
+priced with the megamart_numpy kernels and no items dictionary, stock
+level or transaction is changed.
+
+    python megamart_whatif.py DATASET SCENARIO.csv [SCENARIO.csv ...]
+
+DATASET is a megadata_gen dataset directory; its discounts are the
+baseline and its transactions.jsonl the carts (or --transactions, a JSON
+lines or journal file). Each scenario file is a full discounts file in
+the dataset's discounts.csv format.
+
+The carts are flattened once into arrays of lines, each item ID's
+quantities added together per cart as checkout does, and the baseline is
+priced once over every line. A scenario only reprices the carts holding
+an item whose final price it changes, and the totals of those carts are
+swapped for the baseline's, so dozens of scenarios that each change a
+few prices take little more than the baseline itself.
+
+Carts are priced as checkout prices them, to the cent and with the same
+5 cent cash rounding, from the items' prices, the customer's delivery
+distance and the payment method. Restrictions, stock levels, purchase
+limits and bundles are not checked; a cart is rejected only if checkout
+would raise for its discounts, fulfilment or payment, or it names an
+item or customer that is not known.
+"""
+import argparse
+import csv
+import os
+from typing import (Any, Dict, Iterable, List, Mapping, Optional, Sequence,
+                    Tuple)
+import numpy as np
+from Item import Item
+from Customer import Customer
+from Discount import Discount
+from DiscountType import DiscountType
+from FulfilmentType import FulfilmentType
+from PaymentMethod import PaymentMethod
+from Transaction import Transaction
+
+import megadata_gen
+import megamart_numpy
+from megamart_reconcile import read_records
+
+ItemEntry = Tuple[Item, int, Optional[int]]
+# Final price and savings of each item in cents, and whether checkout
+# would raise for its discount
+_Pricing = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+# Positions in a totals vector, all amounts in cents
+(_CHECKED_OUT, _REJECTED, _SUBTOTAL, _SURCHARGE, _ROUNDING, _FINAL,
+ _SAVED) = range(7)
+# Rows of a per-item matrix, amounts in cents
+_UNITS, _REVENUE, _SAVINGS = range(3)
+
+
+def _cents(amounts: np.ndarray) -> np.ndarray:
+    return np.rint(np.nan_to_num(amounts) * 100).astype(np.int64)
+
+
+class ScenarioOutcome:
+    """Totals of the carts under one discounts mapping."""
+
+    def __init__(self, name: str, item_ids: Sequence[str],
+                 totals: np.ndarray, per_item: np.ndarray):
+        """Hold totals and per-item sums, given in cents."""
+        self.name = name
+        self.item_ids = item_ids
+        self.checked_out = int(totals[_CHECKED_OUT])
+        self.rejected = int(totals[_REJECTED])
+        self.subtotal = int(totals[_SUBTOTAL]) / 100
+        self.surcharge = int(totals[_SURCHARGE]) / 100
+        self.rounding = int(totals[_ROUNDING]) / 100
+        self.revenue = int(totals[_FINAL]) / 100
+        self.amount_saved = int(totals[_SAVED]) / 100
+        # Units sold, revenue and savings of each item, in item_ids order
+        self.units = per_item[_UNITS]
+        self.item_revenue = per_item[_REVENUE] / 100
+        self.item_savings = per_item[_SAVINGS] / 100
+
+    def item_deltas(self, baseline: 'ScenarioOutcome'
+                    ) -> List[Tuple[str, int, float, float]]:
+        """
+        Return (item ID, units, revenue, savings) changes from a baseline.
+
+        Only items that changed are listed, largest revenue change first.
+        """
+        units = self.units - baseline.units
+        revenue = np.rint((self.item_revenue - baseline.item_revenue) * 100)
+        savings = np.rint((self.item_savings - baseline.item_savings) * 100)
+        changed = np.flatnonzero(units | revenue.astype(np.int64)
+                                 | savings.astype(np.int64))
+        changed = changed[np.argsort(-np.abs(revenue[changed]),
+                                     kind='stable')]
+        return [(self.item_ids[index], int(units[index]),
+                 float(revenue[index]) / 100, float(savings[index]) / 100)
+                for index in changed]
+
+
+class WhatIfReport:
+    """A baseline outcome and the outcomes of the scenarios against it."""
+
+    def __init__(self, baseline: ScenarioOutcome,
+                 scenarios: List[ScenarioOutcome]):
+        """Collect the outcomes of one simulation."""
+        self.baseline = baseline
+        self.scenarios = scenarios
+
+    def summary(self, show: int = 10) -> str:
+        """Return the outcomes and each scenario's changes as lines."""
+        lines = ['{:<20} {:>10} {:>9} {:>14} {:>12} {:>10}'.format(
+            'scenario', 'carts', 'rejected', 'revenue', 'saved',
+            'rounding')]
+        for outcome in [self.baseline] + self.scenarios:
+            lines.append(
+                '{:<20} {:>10} {:>9} {:>14.2f} {:>12.2f} {:>10.2f}'.format(
+                    outcome.name[:20], outcome.checked_out,
+                    outcome.rejected, outcome.revenue,
+                    outcome.amount_saved, outcome.rounding))
+        for outcome in self.scenarios:
+            lines.append('{}: revenue {:+.2f}, saved {:+.2f}'.format(
+                outcome.name, outcome.revenue - self.baseline.revenue,
+                outcome.amount_saved - self.baseline.amount_saved))
+            for item_id, units, revenue, savings in outcome.item_deltas(
+                    self.baseline)[:show]:
+                lines.append('  item {}: units {:+d}, revenue {:+.2f}, '
+                             'saved {:+.2f}'.format(item_id, units, revenue,
+                                                    savings))
+        return '\n'.join(lines)
+
+
+class CartSet:
+    """
+    Historical carts flattened into arrays, ready to price in bulk.
+
+    Build one with from_transactions() or from_records().
+    """
+
+    def __init__(self, items: Sequence[Item], carts: Iterable[Tuple[
+            Optional[FulfilmentType], float, Optional[PaymentMethod],
+            Optional[List[Tuple[int, int]]]]]):
+        """
+        Flatten carts given as (fulfilment, distance, payment, lines).
+
+        Lines are (index into items, quantity) pairs, or None for a cart
+        that names an unknown item or customer. Distances are NaN for no
+        customer or no distance. items is only read once every cart has
+        been, so the carts may add to it as they go.
+        """
+        fulfilment: List[Optional[FulfilmentType]] = []
+        payment: List[Optional[PaymentMethod]] = []
+        distances: List[float] = []
+        unknown: List[bool] = []
+        starts = [0]
+        skus: List[int] = []
+        quantities: List[int] = []
+        for fulfilment_type, distance, payment_method, lines in carts:
+            fulfilment.append(fulfilment_type)
+            payment.append(payment_method)
+            distances.append(distance)
+            unknown.append(lines is None)
+            coalesced: Dict[int, int] = {}
+            for sku, qty in lines or ():
+                coalesced[sku] = coalesced.get(sku, 0) + qty
+            skus.extend(coalesced)
+            quantities.extend(coalesced.values())
+            starts.append(len(skus))
+
+        self.starts = np.array(starts, dtype=np.int64)
+        self.sku = np.array(skus, dtype=np.int64)
+        self.quantity = np.array(quantities, dtype=np.int64)
+        self.cart = np.repeat(np.arange(len(unknown)), np.diff(self.starts))
+        self.items = list(items)
+        self.item_ids = [item.id for item in self.items]
+        self._index = {item_id: row
+                       for row, item_id in enumerate(self.item_ids)}
+        self.original = np.array([item.original_price for item in self.items],
+                                 dtype=np.float64)
+
+        surcharge, bad_fulfilment = megamart_numpy.fulfilment_surcharges(
+            megamart_numpy.encode(fulfilment, FulfilmentType), distances)
+        self.payment = megamart_numpy.encode(payment, PaymentMethod)
+        self.surcharge = np.where(bad_fulfilment, 0.0, surcharge)
+        # Carts checkout rejects whatever the discounts
+        self.unpriceable = (np.array(unknown, dtype=bool) | bad_fulfilment
+                            | (self.payment == megamart_numpy.NO_CODE))
+
+    @classmethod
+    def from_transactions(cls, transactions: Iterable[Transaction]
+                          ) -> 'CartSet':
+        """Return the carts of transactions, as entered at checkout."""
+        index: Dict[str, int] = {}
+        items: List[Item] = []
+
+        def carts() -> Iterable[Tuple[Any, float, Any, Any]]:
+            for trans in transactions:
+                lines: Optional[List[Tuple[int, int]]] = []
+                for line in trans.transaction_lines:
+                    if line.item is None:
+                        lines = None
+                        break
+                    if line.item.id not in index:
+                        index[line.item.id] = len(items)
+                        items.append(line.item)
+                    lines.append((index[line.item.id], line.quantity))
+                customer = trans.customer
+                distance = (customer.delivery_distance_km
+                            if customer is not None else None)
+                yield (trans.fulfilment_type,
+                       np.nan if distance is None else distance,
+                       trans.payment_method, lines)
+
+        return cls(items, carts())
+
+    @classmethod
+    def from_records(cls, records: Iterable[Mapping[str, Any]],
+                     items_dict: Mapping[str, ItemEntry],
+                     customers_dict: Mapping[str, Customer]) -> 'CartSet':
+        """Return the carts of megadata_gen transaction records."""
+        item_ids = list(items_dict)
+        index = {item_id: number for number, item_id in enumerate(item_ids)}
+
+        def carts() -> Iterable[Tuple[Any, float, Any, Any]]:
+            for record in records:
+                fulfilment = record['fulfilment_type']
+                payment = record['payment_method']
+                member = record['membership_number']
+                customer = (customers_dict.get(member) if member is not None
+                            else None)
+                distance = (customer.delivery_distance_km
+                            if customer is not None else None)
+                known = (all(item_id in index
+                             for item_id, _ in record['lines']) and
+                         (member is None or customer is not None))
+                yield (FulfilmentType[fulfilment] if fulfilment else None,
+                       np.nan if distance is None else distance,
+                       PaymentMethod[payment] if payment else None,
+                       [(index[item_id], qty)
+                        for item_id, qty in record['lines']]
+                       if known else None)
+
+        return cls([items_dict[item_id][0] for item_id in item_ids],
+                   carts())
+
+    def __len__(self) -> int:
+        """Return the number of carts."""
+        return len(self.payment)
+
+    def pricing(self, discounts_dict: Mapping[str, Discount],
+                rows: Optional[np.ndarray] = None) -> _Pricing:
+        """
+        Return the items' final prices and savings under discounts.
+
+        rows picks the items to price, by index; all of them by default.
+        """
+        if rows is None:
+            rows = np.arange(len(self.items))
+        _, prices, types, values = megamart_numpy.price_arrays(
+            [self.items[row] for row in rows.tolist()], discounts_dict)
+        final, invalid = megamart_numpy.final_item_prices(prices, types,
+                                                          values)
+        savings, bad_savings = megamart_numpy.item_savings(
+            self.original[rows], final)
+        return _cents(final), _cents(savings), invalid | bad_savings
+
+    def _reprice(self, base_pricing: _Pricing,
+                 baseline: Mapping[str, Discount],
+                 discounts_dict: Mapping[str, Discount]) -> _Pricing:
+        # Only the items whose discount differs from the baseline's are
+        # priced again
+        differ = [item_id for item_id, discount in discounts_dict.items()
+                  if baseline.get(item_id) is not discount]
+        differ.extend(item_id for item_id in baseline
+                      if item_id not in discounts_dict)
+        index = self._index
+        rows = np.array(sorted(index[item_id] for item_id in differ
+                               if item_id in index), dtype=np.int64)
+        pricing = tuple(column.copy() for column in base_pricing)
+        for column, repriced in zip(pricing,
+                                    self.pricing(discounts_dict, rows)):
+            column[rows] = repriced
+        return pricing  # type: ignore[return-value]
+
+    def _totals(self, pricing: _Pricing, carts: Optional[np.ndarray] = None
+                ) -> Tuple[np.ndarray, np.ndarray]:
+        # The totals vector and per-item matrix of some carts (all of them
+        # by default) under a pricing
+        prices, savings, invalid = pricing
+        if carts is None:
+            count, lines, segment = len(self), slice(None), self.cart
+            unpriceable, surcharge = self.unpriceable, self.surcharge
+            payment = self.payment
+        else:
+            count = len(carts)
+            begin = self.starts[carts]
+            lengths = self.starts[carts + 1] - begin
+            offsets = np.cumsum(lengths) - lengths
+            lines = (np.arange(lengths.sum())
+                     + np.repeat(begin - offsets, lengths))
+            segment = np.repeat(np.arange(count), lengths)
+            unpriceable, surcharge = (self.unpriceable[carts],
+                                      self.surcharge[carts])
+            payment = self.payment[carts]
+
+        sku, quantity = self.sku[lines], self.quantity[lines]
+        subtotal = np.bincount(segment, prices[sku] * quantity, count)
+        saved = np.bincount(segment, savings[sku] * quantity, count)
+        rejected = (unpriceable |
+                    (np.bincount(segment, invalid[sku], count) > 0))
+        final, _ = megamart_numpy.round_off_subtotals(
+            subtotal / 100 + surcharge, payment)
+
+        accepted = ~rejected
+        subtotal = subtotal.astype(np.int64)[accepted]
+        surcharge_cents = _cents(surcharge[accepted])
+        final_cents = _cents(final[accepted])
+        totals = np.array([
+            accepted.sum(), rejected.sum(), subtotal.sum(),
+            surcharge_cents.sum(),
+            (final_cents - subtotal - surcharge_cents).sum(),
+            final_cents.sum(), saved[accepted].sum()], dtype=np.int64)
+
+        kept = accepted[segment]
+        sku, quantity = sku[kept], quantity[kept]
+        per_item = np.zeros((3, len(self.items)), dtype=np.int64)
+        per_item[_UNITS] = np.bincount(sku, quantity, len(self.items))
+        per_item[_REVENUE] = np.bincount(sku, prices[sku] * quantity,
+                                         len(self.items))
+        per_item[_SAVINGS] = np.bincount(sku, savings[sku] * quantity,
+                                         len(self.items))
+        return totals, per_item
+
+    def simulate(self, baseline: Mapping[str, Discount],
+                 scenarios: Mapping[str, Mapping[str, Discount]],
+                 baseline_name: str = 'baseline') -> WhatIfReport:
+        """
+        Return the outcome of the carts under a baseline and each scenario.
+
+        Each discounts mapping is complete, as given to checkout, not a set
+        of changes to the baseline.
+        """
+        base_pricing = self.pricing(baseline)
+        base_totals, base_items = self._totals(base_pricing)
+        report = WhatIfReport(ScenarioOutcome(
+            baseline_name, self.item_ids, base_totals, base_items), [])
+
+        for name, discounts_dict in scenarios.items():
+            pricing = self._reprice(base_pricing, baseline, discounts_dict)
+            changed = ((pricing[0] != base_pricing[0])
+                       | (pricing[2] != base_pricing[2]))
+            carts = np.unique(self.cart[changed[self.sku]])
+            before = self._totals(base_pricing, carts)
+            after = self._totals(pricing, carts)
+            report.scenarios.append(ScenarioOutcome(
+                name, self.item_ids, base_totals - before[0] + after[0],
+                base_items - before[1] + after[1]))
+        return report
+
+
+def read_discounts(path: str) -> Dict[str, Discount]:
+    """Return a discounts dictionary from a file in discounts.csv format."""
+    with open(path, newline='', encoding='utf-8') as source:
+        return {item_id: Discount(DiscountType[kind], float(value), item_id)
+                for item_id, kind, value in csv.reader(source)}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Compare discount scenarios over a dataset's carts."""
+    parser = argparse.ArgumentParser(description='MegaMart what-if pricing')
+    parser.add_argument('dataset', help='megadata_gen dataset directory')
+    parser.add_argument('scenarios', nargs='+',
+                        help='discounts files in discounts.csv format')
+    parser.add_argument('--transactions',
+                        help='JSON lines or journal file of transactions')
+    parser.add_argument('--show', type=int, default=10,
+                        help='number of item changes to print per scenario')
+    args = parser.parse_args(argv)
+
+    carts = CartSet.from_records(
+        read_records(args.transactions or os.path.join(
+            args.dataset, megadata_gen.TRANSACTIONS_FILE)),
+        megadata_gen.load_items(args.dataset),
+        megadata_gen.load_customers(args.dataset))
+    report = carts.simulate(
+        megadata_gen.load_discounts(args.dataset),
+        {os.path.basename(path): read_discounts(path)
+         for path in args.scenarios})
+    print(report.summary(args.show))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,44 @@
 import unittest
 import megamart
 
-from megamart import Item, Customer, Discount, DiscountType, FulfilmentType, PaymentMethod, Transaction, TransactionLine
+from megamart import Item, Customer, Discount, DiscountType, FulfilmentType, PaymentMethod, Transaction
+from TransactionLine import TransactionLine
 
 from RestrictedItemException import RestrictedItemException
 from PurchaseLimitExceededException import PurchaseLimitExceededException
 from InsufficientStockException import InsufficientStockException
 from FulfilmentException import FulfilmentException
 
+from megamart_batch import checkout_many
+from ItemCatalog import ItemCatalog
+from Item import set_restricted_categories, get_restricted_categories, FrozenItem
+from Discount import FrozenDiscount
+import megamart_cents
+from StockReservation import StockReservation
+from megamart_server import CheckoutServer
+import bench_megamart
+import megadata_gen
+import megamart_base
+from ReceiptLayout import ReceiptLayout
+from SqliteCatalog import SqliteCatalog
+from megamart_startup import LazyMapping, StartupProfiler
+import megamart_journal
+import bench_shared_stock
+from SharedStockTable import SharedStockTable
+import megamart_reconcile
+from DiscountRule import DiscountRule
+from DiscountSchedule import DiscountSchedule
+from Bundle import Bundle
+import megamart_bundles
+from DispatchQueue import DispatchQueue
+from PriceCache import PriceCache
+try:
+  import megamart_numpy
+except ImportError:
+  megamart_numpy = None
+else:
+  import megamart_whatif
+
 
 class TestMegaMart(unittest.TestCase):
   def test_checkout_public_sample(self):
@@ -22,7 +53,7 @@ class TestMegaMart(unittest.TestCase):
     transaction = megamart.Transaction('02/08/2023', '12:00:00')
 
     transaction.transaction_lines = [
-      megamart.TransactionLine(item1[0], 2),
+      TransactionLine(item1[0], 2),
     ]
 
     transaction.payment_method = megamart.PaymentMethod.CASH
@@ -33,14 +64,14 @@ class TestMegaMart(unittest.TestCase):
 
   # My Tests
 
-  ## is_not_allowed_to_purchase_item() tests:
+  ## purchase_not_allow() tests:
 
   def test_allowed_underage_restricted(self):
     category = "Alcohol"
     item = Item('1', "Whiskey", 50.00, [category])
     cust = Customer("12345", "John Doe", "02/08/2005", True, 5.0)
     purch_date = "01/08/2023"
-    self.assertTrue(megamart.is_not_allowed_to_purchase_item(item, cust, purch_date),
+    self.assertTrue(megamart.purchase_not_allow(item, cust, purch_date),
                     f"Underage customer should not be able to purchase restricted item with category: {category}.")
     
   def test_allowed_underageleap_restricted(self):
@@ -48,7 +79,7 @@ class TestMegaMart(unittest.TestCase):
     item = Item('1', "Whiskey", 50.00, [category])
     cust = Customer("12345", "John Doe", "29/02/2004", True, 5.0)
     purch_date = "28/02/2022"
-    self.assertTrue(megamart.is_not_allowed_to_purchase_item(item, cust, purch_date),
+    self.assertTrue(megamart.purchase_not_allow(item, cust, purch_date),
                     f"Underage customer should not be able to purchase restricted item with category: {category}.")
 
   def test_allowed_underage_restricted_case(self):
@@ -56,7 +87,7 @@ class TestMegaMart(unittest.TestCase):
     item = Item('1', "Whiskey", 50.00, [category])
     cust = Customer("12345", "John Doe", "02/08/2005", True, 5.0)
     purch_date = "01/08/2023"
-    self.assertTrue(megamart.is_not_allowed_to_purchase_item(item, cust, purch_date),
+    self.assertTrue(megamart.purchase_not_allow(item, cust, purch_date),
                     f"Underage customer should not be able to purchase restricted item with category: {category}.")
     
   def test_allowed_underage_restricted_multicategory(self):
@@ -64,7 +95,7 @@ class TestMegaMart(unittest.TestCase):
     item = Item('1', "Cider", 50.00, categories)
     cust = Customer("12345", "John Doe", "02/08/2005", True, 5.0)
     purch_date = "01/08/2023"
-    self.assertTrue(megamart.is_not_allowed_to_purchase_item(item, cust, purch_date),
+    self.assertTrue(megamart.purchase_not_allow(item, cust, purch_date),
                     f"Underage customer should not be able to purchase restricted item with categories: {categories}.")
 
   def test_allowed_adult_noid_restricted(self):
@@ -72,7 +103,7 @@ class TestMegaMart(unittest.TestCase):
     item = Item('1', "Whiskey", 50.00, [category])
     cust = Customer("12346", "Jane Doe", "02/08/2000", False, 5.0)
     purch_date = "02/08/2023"
-    self.assertTrue(megamart.is_not_allowed_to_purchase_item(item, cust, purch_date),
+    self.assertTrue(megamart.purchase_not_allow(item, cust, purch_date),
                     f"Adult without ID verification should not be able to purchase restricted item with category: {category}.")
   
   def test_allowed_nodate_restricted(self):
@@ -80,7 +111,7 @@ class TestMegaMart(unittest.TestCase):
     item = Item('1', "Whiskey", 50.00, [category])
     cust = Customer("12346", "Jane Doe", None, False, 5.0)
     purch_date = "02/08/2023"
-    self.assertTrue(megamart.is_not_allowed_to_purchase_item(item, cust, purch_date),
+    self.assertTrue(megamart.purchase_not_allow(item, cust, purch_date),
                     f"Customer without associated date of birth should not be able to purchase restricted item with category: {category}.")
 
   def test_allowed_adult_id_restricted(self):
@@ -88,7 +119,7 @@ class TestMegaMart(unittest.TestCase):
     item = Item('1', "Whiskey", 50.00, [category])
     cust = Customer("12347", "Jim Brown", "02/08/2000", True, 5.0)
     purch_date = "02/08/2023"
-    self.assertFalse(megamart.is_not_allowed_to_purchase_item(item, cust, purch_date),
+    self.assertFalse(megamart.purchase_not_allow(item, cust, purch_date),
                     f"Adult with ID verification should be able to purchase restricted item with category: {category}.")
 
   def test_allowed_underage_unrestricted(self):
@@ -96,7 +127,7 @@ class TestMegaMart(unittest.TestCase):
     item = Item('2', "Juice", 5.00, [category])
     cust = Customer("12345", "John Doe", "02/08/2005", True, 5.0)
     purch_date = "02/08/2023"
-    self.assertFalse(megamart.is_not_allowed_to_purchase_item(item, cust, purch_date),
+    self.assertFalse(megamart.purchase_not_allow(item, cust, purch_date),
                      f"Underage customer should be able to purchase unrestricted item with category: {category}.")
 
   def test_allowed_noitem_exception(self):
@@ -104,7 +135,7 @@ class TestMegaMart(unittest.TestCase):
     cust = Customer("12347", "Jim Brown", "02/08/2000", True, 5.0)
     purch_date = "02/08/2023"
     with self.assertRaises(Exception, msg="Exception should be raised on None item object."):
-      megamart.is_not_allowed_to_purchase_item(item, cust, purch_date)
+      megamart.purchase_not_allow(item, cust, purch_date)
   
   def test_allowed_invalidpurchdate_exception(self):
     category = "Alcohol"
@@ -112,7 +143,7 @@ class TestMegaMart(unittest.TestCase):
     cust = Customer("12347", "Jim Brown", "02/08/2000", True, 5.0)
     purch_date = "123/456/789"
     with self.assertRaises(Exception, msg="Exception should be raised on invalid purchase date format."):
-      megamart.is_not_allowed_to_purchase_item(item, cust, purch_date)
+      megamart.purchase_not_allow(item, cust, purch_date)
 
   def test_allowed_invalidDOB_exception(self):
     category = "Alcohol"
@@ -120,23 +151,62 @@ class TestMegaMart(unittest.TestCase):
     cust = Customer("12347", "Jim Brown", "123/456/789", True, 5.0)
     purch_date = "02/08/2023"
     with self.assertRaises(Exception, msg="Exception should be raised on invalid Date of Birth format."):
-      megamart.is_not_allowed_to_purchase_item(item, cust, purch_date)
+      megamart.purchase_not_allow(item, cust, purch_date)
+
+  def test_allowed_recategorised_restricted(self):
+    item = Item('1', "Juice", 5.00, ["Beverage"])
+    item.categories = ["Beverage", "Alcohol"]
+    cust = Customer("12345", "John Doe", "02/08/2005", True, 5.0)
+    purch_date = "01/08/2023"
+    self.assertTrue(megamart.purchase_not_allow(item, cust, purch_date),
+                    "Item given a restricted category after creation should become restricted.")
+
+  def test_allowed_configured_restricted(self):
+    item = Item('1', "Lottery Ticket", 5.00, ["LOTTERY"])
+    cust = Customer("12345", "John Doe", "02/08/2005", True, 5.0)
+    purch_date = "01/08/2023"
+    previous = get_restricted_categories()
+    set_restricted_categories(previous | {"Lottery"})
+    try:
+      self.assertTrue(megamart.purchase_not_allow(item, cust, purch_date),
+                      "Configured restricted categories should be checked case-insensitively.")
+    finally:
+      set_restricted_categories(previous)
+    self.assertFalse(megamart.purchase_not_allow(item, cust, purch_date),
+                     "Removing a restricted category should lift the restriction.")
+
+  def test_allowed_dob_changed_restricted(self):
+    item = Item('1', "Whiskey", 50.00, ["Alcohol"])
+    cust = Customer("12345", "John Doe", "02/08/2000", True, 5.0)
+    purch_date = "01/08/2023"
+    self.assertFalse(megamart.purchase_not_allow(item, cust, purch_date),
+                     "Adult customer should be able to purchase restricted item.")
+    cust.date_of_birth = "02/08/2005"
+    self.assertTrue(megamart.purchase_not_allow(item, cust, purch_date),
+                    "Changing the date of birth should update the age check.")
+
+  def test_allowed_leap_adult_restricted(self):
+    item = Item('1', "Whiskey", 50.00, ["Alcohol"])
+    cust = Customer("12345", "John Doe", "29/02/2004", True, 5.0)
+    purch_date = "01/03/2022"
+    self.assertFalse(megamart.purchase_not_allow(item, cust, purch_date),
+                     "Customer born on 29 February should be 18+ on 1 March in a non-leap year.")
 
-  ## get_item_purchase_quantity_limit() tests:
+  ## get_purch_quantity_limit() tests:
 
   def test_qtylimit_haslimit(self):
     item1 = Item('1', "Whiskey", 50.00, ["Alcohol"])  # Test Item
     item2 = Item('2', "Juice", 5.00, ["Beverage"])
     limit = 2
     items_dict = { '1' : (item1, 10, limit), '2' : (item2, 20, None) }
-    self.assertEqual(megamart.get_item_purchase_quantity_limit(item1, items_dict), limit,
+    self.assertEqual(megamart.get_purch_quantity_limit(item1, items_dict), limit,
                      f"Item that has limit should return the limit of {limit} provided in items_dict.")
 
   def test_qtylimit_nolimit_indict(self):
     item1 = Item('1', "Whiskey", 50.00, ["Alcohol"])
     item2 = Item('2', "Juice", 5.00, ["Beverage"])  # Test Item
     items_dict = { '1' : (item1, 10, 2), '2' : (item2, 20, None) }
-    self.assertIsNone(megamart.get_item_purchase_quantity_limit(item2, items_dict),
+    self.assertIsNone(megamart.get_purch_quantity_limit(item2, items_dict),
                       "Item in items_dict with no limit should return None limit.")
 
   def test_qtylimit_nolimit_notindict(self):
@@ -144,7 +214,7 @@ class TestMegaMart(unittest.TestCase):
     item2 = Item('2', "Juice", 5.00, ["Beverage"])
     item3 = Item('3', "Soda", 2.00, ["Beverage"]) # Test Item
     items_dict = { '1' : (item1, 10, 2), '2' : (item2, 20, None) }
-    self.assertIsNone(megamart.get_item_purchase_quantity_limit(item3, items_dict),
+    self.assertIsNone(megamart.get_purch_quantity_limit(item3, items_dict),
                       "Item not in items_dict should return None limit.")
 
   def test_qtylimit_noitem_exception(self):
@@ -152,15 +222,15 @@ class TestMegaMart(unittest.TestCase):
     item1 = Item('1', "Whiskey", 50.00, ["Alcohol"])
     items_dict = { '1' : (item1, 5, None) }
     with self.assertRaises(Exception, msg="Exception should be raised on None item provided."):
-      megamart.get_item_purchase_quantity_limit(itemNone, items_dict)
+      megamart.get_purch_quantity_limit(itemNone, items_dict)
 
   def test_qtylimit_nodict_exception(self):
     item1 = Item('1', "Tim Tam - Chocolate", 4.50, ["Confectionary", "Biscuits"])
     items_dict = None
     with self.assertRaises(Exception, msg="Exception should be raised on None items dictionary provided."):
-      megamart.get_item_purchase_quantity_limit(item1, items_dict)
+      megamart.get_purch_quantity_limit(item1, items_dict)
 
-  ## is_item_sufficiently_stocked() tests:
+  ## is_stock_suff() tests:
 
   def test_stocked_sufficient(self):
     item1 = Item('1', "Apple", 0.50, ["Fruit"]) # Test Item
@@ -168,7 +238,7 @@ class TestMegaMart(unittest.TestCase):
     qty = 5
     stock = 10
     items_dict = { '1' : (item1, stock, None), '2' : (item2, 5, 3) }
-    self.assertTrue(megamart.is_item_sufficiently_stocked(item1, qty, items_dict),
+    self.assertTrue(megamart.is_stock_suff(item1, qty, items_dict),
                     f"Item with stock {stock} should be sufficiently stocked when bought at quantity {qty}.")
 
   def test_stocked_insufficient(self):
@@ -177,14 +247,14 @@ class TestMegaMart(unittest.TestCase):
     qty = 15
     stock = 10
     items_dict = { '1' : (item1, stock, None), '2' : (item2, 5, 3) }
-    self.assertFalse(megamart.is_item_sufficiently_stocked(item1, qty, items_dict),
+    self.assertFalse(megamart.is_stock_suff(item1, qty, items_dict),
                     f"Item with stock {stock} should not be sufficiently stocked when bought at quantity {qty}.")
 
   def test_stocked_notindict(self):
     item1 = Item('2', "Banana", 0.30, ["Fruit"])
     qty = 3
     items_dict = { '1' : (item1, 10, None) }
-    self.assertFalse(megamart.is_item_sufficiently_stocked(item1, qty, items_dict),
+    self.assertFalse(megamart.is_stock_suff(item1, qty, items_dict),
                      "Item not in item_dict should not be considered sufficiently stocked.")
     
   def test_stocked_noitem_exception(self):
@@ -194,7 +264,7 @@ class TestMegaMart(unittest.TestCase):
     qty = 2
     items_dict = { '1' : (item1, 10, None), '2' : (item2, 5, 3) }
     with self.assertRaises(Exception, msg="Exception should be raised on None item object provided."):
-      megamart.is_item_sufficiently_stocked(itemNone, qty, items_dict)
+      megamart.is_stock_suff(itemNone, qty, items_dict)
 
   def test_stocked_noqty_exception(self):
     item1 = Item('1', "Apple", 0.50, ["Fruit"]) 
@@ -202,14 +272,14 @@ class TestMegaMart(unittest.TestCase):
     qty = None
     items_dict = { '1' : (item1, 10, None), '2' : (item2, 5, 3) }
     with self.assertRaises(Exception, msg="Exception should be raised on None quantity provided."):
-      megamart.is_item_sufficiently_stocked(item1, qty, items_dict)
+      megamart.is_stock_suff(item1, qty, items_dict)
 
   def test_stocked_nodict_exception(self):
     item1 = Item('1', "Apple", 0.50, ["Fruit"]) 
     qty = 3
     items_dict = None
     with self.assertRaises(Exception, msg="Exception should be raised on None dictionary provided."):
-      megamart.is_item_sufficiently_stocked(item1, qty, items_dict)
+      megamart.is_stock_suff(item1, qty, items_dict)
 
   def test_stocked_invalidqty_exception(self):
     item1 = Item('1', "Apple", 0.50, ["Fruit"]) # Test Item
@@ -217,7 +287,7 @@ class TestMegaMart(unittest.TestCase):
     qty = 0
     items_dict = { '1' : (item1, 10, None), '2' : (item2, 5, 3) }
     with self.assertRaises(Exception, msg="Exception should be raised on quantity <1."):
-      megamart.is_item_sufficiently_stocked(item1, qty, items_dict)
+      megamart.is_stock_suff(item1, qty, items_dict)
 
   def test_stocked_invalidstock_exception(self):
     item1 = Item('1', "Apple", 0.50, ["Fruit"]) # Test Item
@@ -225,7 +295,7 @@ class TestMegaMart(unittest.TestCase):
     qty = 3
     items_dict = { '1' : (item1, -1, None), '2' : (item2, 5, 3) }
     with self.assertRaises(Exception, msg="Exception should be raised when checking item with negative stock value."):
-      megamart.is_item_sufficiently_stocked(item1, qty, items_dict)
+      megamart.is_stock_suff(item1, qty, items_dict)
 
   ## calculate_final_item_price() tests:
 
@@ -284,6 +354,39 @@ class TestMegaMart(unittest.TestCase):
     with self.assertRaises(Exception, msg="Item with flat discount should raise exception if discount causes price to be negative."):
       megamart.calculate_final_item_price(item, discounts_dict)
 
+  def test_itemprice_cache_hit(self):
+    item = Item('1', "Tim Tams", 4.50, ["Chocolate"])
+    discounts_dict = { '1' : Discount(DiscountType.PERCENTAGE, 20, '1') }
+    megamart.calculate_final_item_price(item, discounts_dict)
+    hits = megamart.price_cache.hits
+    self.assertAlmostEqual(megamart.calculate_final_item_price(item, discounts_dict), 3.6, 2,
+                           "Cached price should match the calculated price.")
+    self.assertEqual(megamart.price_cache.hits, hits + 1,
+                     "Repeated pricing of an unchanged item should hit the cache.")
+
+  def test_itemprice_cache_invalidated(self):
+    item = Item('1', "Tim Tams", 4.50, ["Chocolate"])
+    discount = Discount(DiscountType.PERCENTAGE, 20, '1')
+    discounts_dict = { '1' : discount }
+    megamart.calculate_final_item_price(item, discounts_dict)
+    discount.value = 50
+    self.assertAlmostEqual(megamart.calculate_final_item_price(item, discounts_dict), 2.25, 2,
+                           "Changing a discount should invalidate the cached price.")
+    item.original_price = 10.00
+    self.assertAlmostEqual(megamart.calculate_final_item_price(item, discounts_dict), 5.00, 2,
+                           "Changing an item's price should invalidate the cached price.")
+    self.assertAlmostEqual(megamart.calculate_final_item_price(item, {}), 10.00, 2,
+                           "Removing a discount should invalidate the cached price.")
+
+  def test_itemprice_cache_bounded(self):
+    cache = PriceCache(max_entries=2)
+    items = [Item(str(number), "Tim Tams", 4.50, ["Chocolate"]) for number in range(3)]
+    for item in items:
+      cache.store(item, None, 4.50)
+    self.assertEqual(cache.stats()['entries'], 2, "The cache should not hold more than max_entries prices.")
+    self.assertIsNone(cache.lookup(items[0], None), "The oldest price should be dropped to make room.")
+    self.assertEqual(cache.lookup(items[2], None), 4.50, "The newest price should be kept.")
+
   ## calculate_item_savings() tests:
 
   def test_savings_valid(self):
@@ -310,34 +413,34 @@ class TestMegaMart(unittest.TestCase):
     with self.assertRaises(Exception, msg="Exception should be raised when final price > original price."):
       megamart.calculate_item_savings(original_price, final_price)
 
-  ## calculate_fulfilment_surcharge() tests:
+  ## cfs() tests:
 
   def test_fulfilment_deliver_low(self):
     type = FulfilmentType.DELIVERY
     distance = 3  # Km
     cust = Customer('1', "John Doe", "19/05/1990", True, distance)
-    self.assertAlmostEqual(megamart.calculate_fulfilment_surcharge(type, cust), 5, 2,
+    self.assertAlmostEqual(megamart.cfs(type, cust), 5, 2,
                      f"Low distance of {distance}km should result in defaulting to price of $5.")
     
   def test_fulfilment_deliver_boundary(self):
     type = FulfilmentType.DELIVERY
     distance = 10  # Km
     cust = Customer('1', "John Doe", "19/05/1990", True, distance)
-    self.assertAlmostEqual(megamart.calculate_fulfilment_surcharge(type, cust), 5, 2,
+    self.assertAlmostEqual(megamart.cfs(type, cust), 5, 2,
                      f"Boundary distance of {distance}km should result in price of $5.")
 
   def test_fulfilment_deliver_high(self):
     type = FulfilmentType.DELIVERY
     distance = 19.55  # Km
     cust = Customer('1', "John Doe", "19/05/1990", True, distance)
-    self.assertAlmostEqual(megamart.calculate_fulfilment_surcharge(type, cust), 9.78, 2,
+    self.assertAlmostEqual(megamart.cfs(type, cust), 9.78, 2,
                      f"Higher distance of {distance}km should result in price of $9.78 (rounded) for 50c per km.")
 
   def test_fulfilment_pickup(self):
     type = FulfilmentType.PICKUP
     distance = 0  # Km
     cust = Customer('1', "John Doe", "19/05/1990", True, distance)
-    self.assertAlmostEqual(megamart.calculate_fulfilment_surcharge(type, cust), 0, 2,
+    self.assertAlmostEqual(megamart.cfs(type, cust), 0, 2,
                      f"Pickup order should result in no fulfilment surcharge.")
 
   def test_fulfilment_notype_exception(self):
@@ -345,14 +448,14 @@ class TestMegaMart(unittest.TestCase):
     distance = 0  # Km
     cust = Customer('1', "John Doe", "19/05/1990", True, distance)
     with self.assertRaises(Exception):
-      megamart.calculate_fulfilment_surcharge(type, cust)
+      megamart.cfs(type, cust)
 
   def test_fulfilment_nodistance_exception(self):
     type = FulfilmentType.DELIVERY
     distance = None  
     cust = Customer('1', "John Doe", "19/05/1990", True, distance)
     with self.assertRaises(FulfilmentException):
-      megamart.calculate_fulfilment_surcharge(type, cust)
+      megamart.cfs(type, cust)
 
   ## round_off_subtotal() tests:
 
@@ -655,4 +758,888 @@ class TestMegaMart(unittest.TestCase):
     with self.assertRaises(Exception, msg="The checkout function should pass the fourth example given in the specification."):
         checkout = megamart.checkout(transaction, items_dict, discounts_dict)
 
-unittest.main()
+  ## checkout_many() tests:
+
+  def test_checkoutmany_matches_checkout(self):
+    item1 = Item('1', "Tim Tams", 4.50, ["Chocolate"])
+    item2 = Item('2', "Coffee Powder", 16.00, ["Coffee"])
+    discounts_dict = { '1' : Discount(DiscountType.PERCENTAGE, 20, '1'), '2' : Discount(DiscountType.FLAT, 1.5, '2') }
+    transactions = []
+    for method in [PaymentMethod.CASH, PaymentMethod.CREDIT]:
+      transaction = Transaction("23/08/2023", "09:48:00")
+      transaction.transaction_lines = [ TransactionLine(item1, 2), TransactionLine(item2, 1) ]
+      transaction.fulfilment_type = FulfilmentType.PICKUP
+      transaction.payment_method = method
+      transactions.append(transaction)
+    items_dict = { '1' : (item1, 20, None), '2' : (item2, 12, 2) }
+
+    results = checkout_many(transactions, items_dict, discounts_dict)
+    self.assertEqual([r.final_total for r in results], [21.70, 21.70],
+                     "Batch checkout should price every transaction like checkout.")
+    self.assertEqual(items_dict['1'][1], 16,
+                     "Batch checkout should decrement stock for every transaction.")
+
+  def test_checkoutmany_failure_isolated(self):
+    item = Item('2', "Whiskey", 50.00, ["Alcohol"])
+    transactions = []
+    for dob in ["10/09/2007", "10/09/1996"]:
+      transaction = Transaction("20/08/2023", "02:24:00")
+      transaction.customer = Customer('1', "John Doe", dob, True, None)
+      transaction.fulfilment_type = FulfilmentType.PICKUP
+      transaction.payment_method = PaymentMethod.CASH
+      transaction.transaction_lines = [TransactionLine(item, 1)]
+      transactions.append(transaction)
+    items_dict = { '2' : (item, 20, None) }
+
+    results = checkout_many(transactions, items_dict, {})
+    self.assertIsInstance(results[0], RestrictedItemException,
+                          "Underage transaction in a batch should return its exception.")
+    self.assertEqual(results[1].final_total, 50.00,
+                     "Later transactions in a batch should still be checked out.")
+    self.assertEqual(items_dict['2'][1], 19,
+                     "Failed transactions in a batch should not change stock.")
+
+  def test_checkoutmany_applies_bundles_and_writes_back_once(self):
+    item1 = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks'])
+    bundles = [Bundle(DiscountType.MULTI_BUY, 10.00, { '1' : 3 }, '3 for $10')]
+    transactions = []
+    for _ in range(2):
+      transaction = Transaction("23/08/2023", "09:48:00")
+      transaction.transaction_lines = [TransactionLine(item1, 4), TransactionLine(item2, 1)]
+      transaction.fulfilment_type = FulfilmentType.PICKUP
+      transaction.payment_method = PaymentMethod.CREDIT
+      transactions.append(transaction)
+    catalog = ItemCatalog([(item1, 20, None), (item2, 1, None)])
+
+    results = checkout_many(transactions, catalog, {}, bundles)
+    self.assertEqual(results[0].final_total, 30.50, "Batch checkout should apply bundles like checkout.")
+    self.assertIsInstance(results[1], InsufficientStockException, "Stock taken earlier in a batch should be seen by later transactions.")
+    self.assertEqual((catalog['1'][1], catalog['2'][1]), (16, 0), "Batch checkout should write stock back to the catalog.")
+
+  ## ItemCatalog tests:
+
+  def test_catalog_mapping_entries(self):
+    item = Item('4', "Beer", 5.00, ["Alcohol", "Drinks"])
+    catalog = ItemCatalog([(item, 7, None), (Item('2', "Coffee Powder", 16.00, ["Coffee"]), 12, 2)])
+    self.assertEqual(catalog['4'], (item, 7, None),
+                     "Catalog should return the stored (item, stock, limit) entry.")
+    self.assertEqual(megamart.get_purch_quantity_limit(catalog['2'][0], catalog), 2,
+                     "Catalog should be usable as an items dictionary.")
+    self.assertEqual(catalog.categories('4'), ["Alcohol", "Drinks"],
+                     "Catalog should keep item categories in order.")
+
+  def test_catalog_checkout_updates_stock(self):
+    transaction = Transaction("20/08/2023", "02:24:00")
+    transaction.fulfilment_type = FulfilmentType.PICKUP
+    transaction.payment_method = PaymentMethod.CREDIT
+    catalog = ItemCatalog([(Item('3', "Coffee Powder", 16.00, ["Coffee", "Drinks"]), 50, 2)])
+    transaction.transaction_lines = [TransactionLine(catalog['3'][0], 2)]
+
+    checkout = megamart.checkout(transaction, catalog, {})
+    self.assertEqual(checkout.final_total, 32.00,
+                     "Checkout should price items read from a catalog.")
+    self.assertEqual(catalog.stock('3'), 48,
+                     "Checkout should update catalog stock in place.")
+
+  def test_catalog_delete_keeps_rows(self):
+    catalog = ItemCatalog([(Item(str(i), "Item", 1.00, []), i, None) for i in range(3)])
+    del catalog['0']
+    self.assertEqual(sorted(catalog), ['1', '2'],
+                     "Deleting an item should remove only that item.")
+    self.assertEqual(catalog.stock('2'), 2,
+                     "Deleting an item should not change other items' stock.")
+
+  def test_catalog_price_change_survives_collected_item(self):
+    import gc
+    catalog = ItemCatalog([(Item('5', "Milk", 2.00, ["Dairy"]), 10, 3)])
+    catalog['5'][0].original_price = 2.50
+    gc.collect()
+    self.assertEqual(catalog['5'][0].original_price, 2.50,
+                     "A price set on a catalog item should be kept after the item is collected.")
+    self.assertEqual((catalog['5'][1], catalog['5'][2], len(catalog._live)), (10, 3, 0),
+                     "Reading an entry's stock and limit should not build an item.")
+
+  ## megamart_cents tests:
+
+  def test_cents_roundsubtotal_cash(self):
+    method = PaymentMethod.CASH
+    for subtotal, expected in [(1021, 1020), (1022, 1020), (1023, 1025), (1027, 1025), (1028, 1030), (15673, 15675)]:
+      with self.subTest(subtotal=subtotal):
+        self.assertEqual(megamart_cents.round_off_subtotal_cents(subtotal, method), expected,
+                         "Cash subtotal in cents should round to the nearest 5 cents.")
+
+  def test_cents_itemprice_pctdiscount(self):
+    item = Item('1', "Tim Tams", 4.50, ["Chocolate"])
+    discounts_dict = { '1' : Discount(DiscountType.PERCENTAGE, 20, '1') }
+    self.assertEqual(megamart_cents.final_item_price_cents(item, discounts_dict), 360,
+                     "Percentage discount should be applied in whole cents.")
+
+  def test_cents_checkout_example1(self):
+    transaction = Transaction("23/08/2023", "09:48:00")
+    item1 = Item('1', "Tim Tams", 4.50, ["Chocolate"])
+    item2 = Item('2', "Coffee Powder", 16.00, ["Coffee"])
+    item3 = Item('3', "Item 3", 9.98, [])
+    transaction.transaction_lines = [ TransactionLine(item1, 2), TransactionLine(item2, 1), TransactionLine(item3, 1) ]
+    transaction.fulfilment_type = FulfilmentType.PICKUP
+    transaction.payment_method = PaymentMethod.CASH
+    items_dict = { '1' : (item1, 20, None), '2' : (item2, 12, 2), '3' : (item3, 1000, None) }
+    discounts_dict = { '1' : Discount(DiscountType.PERCENTAGE, 20, '1'), '2' : Discount(DiscountType.FLAT, 1.5, '2') }
+    checkout = megamart_cents.checkout_cents(transaction, items_dict, discounts_dict)
+    self.assertEqual(checkout.final_total, 31.70,
+                     "Checkout in cents should match the first example given in the specification.")
+    self.assertEqual(checkout.amount_saved, 3.30,
+                     "Checkout in cents should match the first example given in the specification.")
+
+  ## StockReservation tests:
+
+  def test_reservation_rollback_on_failure(self):
+    transaction = Transaction("20/08/2023", "02:24:00")
+    transaction.customer = Customer('1', "John Doe", "10/09/2007", True, None)
+    transaction.fulfilment_type = FulfilmentType.PICKUP
+    transaction.payment_method = PaymentMethod.CASH
+    item1 = Item('1', "Tim Tams", 4.50, ["Chocolate"])
+    item2 = Item('2', "Whiskey", 50.00, ["Alcohol"])
+    transaction.transaction_lines = [TransactionLine(item1, 2), TransactionLine(item2, 1)]
+    items_dict = { '1' : (item1, 20, None), '2' : (item2, 5, 3) }
+    reservation = StockReservation(items_dict)
+
+    with self.assertRaises(RestrictedItemException, msg="Reserved checkout should raise checkout's exceptions."):
+      reservation.checkout(transaction, {})
+    self.assertEqual(items_dict, { '1' : (item1, 20, None), '2' : (item2, 5, 3) },
+                     "A failed reserved checkout should give back all reserved stock.")
+
+  def test_reservation_all_or_nothing(self):
+    item1 = Item('1', "Tim Tams", 4.50, ["Chocolate"])
+    item2 = Item('2', "Coffee Powder", 16.00, ["Coffee"])
+    items_dict = { '1' : (item1, 20, None), '2' : (item2, 1, None) }
+    reservation = StockReservation(items_dict)
+
+    with self.assertRaises(InsufficientStockException, msg="Reserving more than the stock should raise."):
+      reservation.reserve([TransactionLine(item1, 2), TransactionLine(item2, 1), TransactionLine(item2, 1)])
+    self.assertEqual(items_dict['1'][1], 20,
+                     "No stock should be taken when any line cannot be reserved.")
+
+  def test_reservation_concurrent_no_oversell(self):
+    import threading
+    item = Item('1', "Tim Tams", 4.50, ["Chocolate"])
+    items_dict = { '1' : (item, 100, None) }
+    reservation = StockReservation(items_dict, 4)
+    sold = []
+
+    def lane():
+      for _ in range(50):
+        try:
+          reservation.reserve([TransactionLine(item, 1)])
+          sold.append(1)
+        except InsufficientStockException:
+          pass
+
+    lanes = [threading.Thread(target=lane) for _ in range(8)]
+    for thread in lanes:
+      thread.start()
+    for thread in lanes:
+      thread.join()
+    self.assertEqual((len(sold), items_dict['1'][1]), (100, 0),
+                     "Concurrent lanes should never sell more than the available stock.")
+
+  ## CheckoutServer tests:
+
+  def test_server_checkout_updates_catalog(self):
+    item = Item('1', "Tim Tams", 4.50, ["Chocolate"])
+    items_dict = { '1' : (item, 20, None) }
+    server = CheckoutServer(items_dict, { '1' : Discount(DiscountType.PERCENTAGE, 20, '1') }, {})
+    response = server.handle({'op': 'checkout', 'id': 7, 'date': "23/08/2023", 'time': "09:48:00",
+                              'lines': [['1', 2]], 'fulfilment_type': 'PICKUP', 'payment_method': 'CASH'})
+    self.assertEqual((response['final_total'], response['req']), (7.20, 7),
+                     "Server checkout should return the totals for the request.")
+    self.assertEqual(items_dict['1'][1], 18,
+                     "Server checkout should update the shared catalog.")
+
+  def test_server_error_response(self):
+    item = Item('2', "Whiskey", 50.00, ["Alcohol"])
+    server = CheckoutServer({ '2' : (item, 20, None) }, {}, {})
+    response = server.handle({'op': 'checkout', 'date': "23/08/2023", 'time': "09:48:00",
+                              'lines': [['2', 1]], 'fulfilment_type': 'PICKUP', 'payment_method': 'CASH'})
+    self.assertEqual(response['error'], 'RestrictedItemException',
+                     "Server should report the exception raised by checkout.")
+
+  def test_client_pipelines_past_depth_and_refetches_after_checkout(self):
+    import asyncio, threading
+    import megamart_client
+    from megamart_server import PIPELINE_DEPTH
+    items_dict = { '1' : (Item('1', "Tim Tams", 4.50, ["Chocolate"]), 20, None) }
+    loop = asyncio.new_event_loop()
+    listener = loop.run_until_complete(CheckoutServer(items_dict, {}, {}).start('127.0.0.1', 0))
+    serving = threading.Thread(target=loop.run_forever)
+    serving.start()
+    try:
+      client = megamart_client.CheckoutClient('127.0.0.1', listener.sockets[0].getsockname()[1])
+      try:
+        responses = client.pipeline([{'op': 'scan', 'item_id': '1'} for _ in range(PIPELINE_DEPTH * 3 + 1)])
+        self.assertEqual(([response['req'] for response in responses], responses[-1]['stock']),
+                         (list(range(PIPELINE_DEPTH * 3 + 1)), 20),
+                         "A pipeline longer than the server's depth should return every response in order.")
+        self.assertEqual(client.items['1'][1], 20,
+                         "The client should fetch an item's stock from the server.")
+        trans = Transaction("23/08/2023", "09:48:00")
+        trans.transaction_lines = [TransactionLine(client.items['1'][0], 3)]
+        trans.fulfilment_type = FulfilmentType.PICKUP
+        trans.payment_method = PaymentMethod.CASH
+        client.checkout(trans)
+        self.assertEqual(client.items['1'][1], 17,
+                         "After a checkout the client should fetch the stock the server now holds.")
+      finally:
+        client.close()
+    finally:
+      loop.call_soon_threadsafe(loop.stop)
+      serving.join()
+      listener.close()
+      loop.run_until_complete(listener.wait_closed())
+      loop.close()
+
+  ## bench_megamart tests:
+
+  def test_bench_compare_flags_regression(self):
+    baseline = { 'checkout[lines=10]' : 1.0, 'cfs[catalog=10]' : 1.0 }
+    results = { 'checkout[lines=10]' : 1.5, 'cfs[catalog=10]' : 1.1, 'new[lines=1]' : 9.0 }
+    regressions = bench_megamart.compare(results, baseline, 0.2)
+    self.assertEqual(len(regressions), 1,
+                     "Only results slower than the threshold allows should be flagged.")
+    self.assertTrue(regressions[0].startswith('checkout[lines=10]'),
+                    "The regression report should name the slower benchmark.")
+
+  ## megadata_gen tests:
+
+  def test_datagen_deterministic_roundtrip(self):
+    import tempfile
+    with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+      for directory in (first, second):
+        megadata_gen.write_dataset(directory, 50, 20, True, 30, seed=7, restricted_ratio=0.5)
+      items_dict = megadata_gen.load_items(first)
+      customers_dict = megadata_gen.load_customers(first)
+      discounts_dict = megadata_gen.load_discounts(first)
+      transactions = list(megadata_gen.iter_transactions(first, items_dict, customers_dict))
+      with open(first + '/items.csv') as a, open(second + '/items.csv') as b:
+        self.assertEqual(a.read(), b.read(), "The same seed should generate the same items.")
+
+    self.assertEqual((len(items_dict), len(customers_dict), len(transactions)), (50, 20, 30),
+                     "Loading a dataset should return every generated record.")
+    self.assertTrue(all(item_id in items_dict for item_id in discounts_dict),
+                    "Generated discounts should refer to generated items.")
+    self.assertGreater(sum(entry[0].restricted for entry in items_dict.values()), 10,
+                       "The restricted item ratio should be applied.")
+
+  ## write_receipt() tests:
+
+  def _finalised_transaction(self):
+    item = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    discounts_dict = { '1' : Discount(DiscountType.PERCENTAGE, 10, '1') }
+    transaction = Transaction("23/08/2023", "09:48:00")
+    transaction.transaction_lines = [TransactionLine(item, 2)]
+    transaction.fulfilment_type = FulfilmentType.PICKUP
+    transaction.payment_method = PaymentMethod.CREDIT
+    megamart.checkout(transaction, { '1' : (item, 20, None) }, discounts_dict)
+    transaction.amount_tendered = transaction.final_total
+    transaction.change_amount = 0
+    transaction.finalised = True
+    return transaction, discounts_dict
+
+  def test_writereceipt_binary_stream(self):
+    import io
+    transaction, discounts_dict = self._finalised_transaction()
+    stream = io.BytesIO()
+    megamart_base.write_receipt(transaction, discounts_dict, stream)
+    self.assertFalse(stream.closed, "Writing a receipt should leave the caller's stream open.")
+    self.assertEqual(stream.getvalue().decode('utf-8'), megamart_base.generate_receipt(transaction, discounts_dict),
+                     "A receipt written to a binary stream should match the generated receipt.")
+
+  def test_writereceipts_batch_file(self):
+    import os, tempfile
+    transaction, discounts_dict = self._finalised_transaction()
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'receipts.txt')
+      count = megamart_base.write_receipts([transaction] * 3, discounts_dict, path)
+      with open(path, encoding='utf-8', newline='') as receipts:
+        contents = receipts.read()
+    self.assertEqual(count, 3, "write_receipts should return the number of receipts written.")
+    self.assertEqual(contents, megamart_base.generate_receipt(transaction, discounts_dict) * 3,
+                     "Batch receipts should be written back to back in order.")
+
+  ## ReceiptLayout tests:
+
+  def test_layout_custom_store_name(self):
+    transaction, discounts_dict = self._finalised_transaction()
+    receipt = megamart_base.generate_receipt(transaction, discounts_dict, layout=ReceiptLayout('Caulfield {Express}'))
+    self.assertIn('CAULFIELD {EXPRESS} RECEIPT\n', receipt, "The receipt title should use the layout's store name.")
+    self.assertIn('Thank you for shopping at Caulfield {Express}, please come again!', receipt,
+                  "The receipt footer should use the layout's store name.")
+    self.assertNotIn('MONASH', receipt, "The default store name should not appear on a custom layout.")
+
+  def test_layout_custom_widths(self):
+    transaction, discounts_dict = self._finalised_transaction()
+    layout = ReceiptLayout(widths=(3, 20, 5, 15, 30, 12))
+    item_total, list_string, totals_string = megamart_base.list_items(transaction, discounts_dict, layout=layout)
+    width = 3 + 20 + 5 + 15 + 30 + 12 + 5
+    self.assertEqual(len(layout.border), width + 1, "The border should span every column.")
+    self.assertTrue(all(len(line) == width for line in list_string.splitlines()[1:] + totals_string.splitlines()),
+                    "Item rows and totals should be as wide as the layout.")
+    self.assertAlmostEqual(item_total, 8.10, 2, "The layout should not change the item total.")
+
+  ## Model class tests:
+
+  def test_transactions_own_lines(self):
+    first = Transaction("23/08/2023", "09:48:00")
+    second = Transaction("23/08/2023", "09:49:00")
+    first.transaction_lines.append(TransactionLine(Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery']), 1))
+    self.assertEqual(len(second.transaction_lines), 0, "Transactions should not share their lines.")
+    with self.assertRaises(AttributeError, msg="Slotted models should reject unknown attributes."):
+      first.notes = 'gift'
+
+  def test_frozen_models_hashable(self):
+    item = FrozenItem('2', 'Whiskey', 50.00, ['Alcohol'])
+    discount = Discount(DiscountType.PERCENTAGE, 10, '2').freeze()
+    cache = { (item, discount) : 45.00 }
+    self.assertEqual(cache[(Item('2', 'Whiskey', 50.00, ['Alcohol']).freeze(), FrozenDiscount(DiscountType.PERCENTAGE, 10, '2'))], 45.00,
+                     "Equal frozen items and discounts should find the same cache entry.")
+    self.assertTrue(item.restricted, "Frozen items should still report restricted categories.")
+    with self.assertRaises(AttributeError, msg="Frozen items should not be changed."):
+      item.original_price = 1.00
+    with self.assertRaises(AttributeError, msg="Frozen discounts should not be changed."):
+      discount.value = 50
+
+  ## Running totals tests:
+
+  def test_running_totals_add_remove(self):
+    item1 = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = Item('2', 'Coke - 1.25L', 3.35, ['Drinks'])
+    items_dict = { '1' : (item1, 20, None), '2' : (item2, 20, None) }
+    discounts_dict = { '1' : Discount(DiscountType.PERCENTAGE, 10, '1') }
+    transaction = Transaction("23/08/2023", "09:48:00")
+    for item, quantity in ((item1, 2), (item2, 1), (item1, 3)):
+      megamart_base.add_scanned_line(transaction, TransactionLine(item, quantity), discounts_dict)
+    transaction.remove_line(2)
+
+    self.assertEqual(transaction.item_count, 5, "The running item count should follow added and removed lines.")
+    self.assertEqual(transaction.sku_quantities, { '1' : 5 }, "Removed items should leave the per-SKU quantities.")
+    self.assertAlmostEqual(transaction.running_subtotal, 20.25, 2, "The running subtotal should follow added and removed lines.")
+    self.assertAlmostEqual(transaction.running_savings, 2.25, 2, "The running savings should follow added and removed lines.")
+    self.assertEqual(megamart_base.list_items(transaction, discounts_dict)[0], transaction.running_subtotal,
+                     "The item list should use the running subtotal.")
+
+    transaction.fulfilment_type = FulfilmentType.PICKUP
+    transaction.payment_method = PaymentMethod.CREDIT
+    megamart.checkout(transaction, items_dict, discounts_dict)
+    self.assertEqual((transaction.total_items_purchased, transaction.all_items_subtotal, transaction.amount_saved), (5, 20.25, 2.25),
+                     "Checkout should match the running totals.")
+
+  def test_running_totals_stale_prices(self):
+    item = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    discount = Discount(DiscountType.PERCENTAGE, 10, '1')
+    transaction = Transaction("23/08/2023", "09:48:00")
+    megamart_base.add_scanned_line(transaction, TransactionLine(item, 2), { '1' : discount })
+    discount.value = 50
+    self.assertFalse(transaction.totals_priced({ '1' : discount }), "Running totals should be stale once a discount changes.")
+
+    transaction.fulfilment_type = FulfilmentType.PICKUP
+    transaction.payment_method = PaymentMethod.CREDIT
+    megamart.checkout(transaction, { '1' : (item, 20, None) }, { '1' : discount })
+    self.assertEqual(transaction.all_items_subtotal, 4.50, "Checkout should price stale lines again.")
+
+  def test_running_totals_other_discounts(self):
+    item = Item('1', 'Tim Tam - Chocolate', 10.00, ['Confectionery', 'Biscuits'])
+    discounts_dict = { '1' : Discount(DiscountType.PERCENTAGE, 50, '1') }
+    transaction = Transaction("23/08/2023", "09:48:00")
+    megamart_base.add_scanned_line(transaction, TransactionLine(item, 1), discounts_dict)
+    self.assertTrue(transaction.totals_priced(discounts_dict), "Running totals should be used with the discounts they were priced under.")
+    self.assertFalse(transaction.totals_priced({}), "Running totals should not be used with other discounts.")
+    self.assertEqual(megamart_base.list_items(transaction, {})[0], 10.00, "The item list should price lines with the discounts it is given.")
+
+    transaction.fulfilment_type = FulfilmentType.PICKUP
+    transaction.payment_method = PaymentMethod.CREDIT
+    megamart.checkout(transaction, { '1' : (item, 20, None) }, {})
+    self.assertEqual(transaction.all_items_subtotal, 10.00, "Checkout should price lines with the discounts it is given.")
+
+  def test_running_totals_survive_new_item_objects(self):
+    import os, tempfile
+    item1 = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks'])
+    transaction = Transaction("23/08/2023", "09:48:00")
+    megamart_base.add_scanned_line(transaction, TransactionLine(item1, 1), {})
+    Item('3', 'Coke - 1.25L', 3.35, ['Drinks'])
+    Discount(DiscountType.FLAT, 1.00, '3')
+    megamart_base.add_scanned_line(transaction, TransactionLine(item2, 1), {})
+    self.assertTrue(transaction.totals_priced({}), "Items and discounts made elsewhere should not invalidate the running totals.")
+
+    with tempfile.TemporaryDirectory() as directory:
+      with SqliteCatalog.create(os.path.join(directory, 'catalog.db'), [(item1, 20, None), (item2, 12, None)], [],
+                                [Discount(DiscountType.PERCENTAGE, 10, '1')], cache_size=1) as catalog:
+        transaction = Transaction("23/08/2023", "09:48:00")
+        for item_id in ('1', '2', '1'):
+          megamart_base.add_scanned_line(transaction, TransactionLine(catalog.items[item_id][0], 1), catalog.discounts)
+        self.assertTrue(transaction.totals_priced(catalog.discounts), "Lines scanned from a catalog that builds new items should stay priced.")
+        self.assertFalse(transaction.totals_priced({ '1' : Discount(DiscountType.PERCENTAGE, 50, '1') }),
+                         "A different discount for a line should invalidate the running totals.")
+
+  def test_terminal_survives_invalid_discount_at_scan(self):
+    import contextlib, io
+    from unittest import mock
+    item1 = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = Item('2', 'Coke - 1.25L', 3.35, ['Drinks'])
+    items_dict = { '1' : (item1, 20, None), '2' : (item2, 20, None) }
+    discounts_dict = { '1' : Discount(DiscountType.PERCENTAGE, 150, '1') }
+    answers = iter(['1', '1', '1', '2', '2', 'quit', '2', '6'])
+    output = io.StringIO()
+    with mock.patch('builtins.input', lambda prompt='': next(answers)), contextlib.redirect_stdout(output):
+      megamart_base.terminal(items_dict, discounts_dict, {})
+
+    self.assertIn('InsufficientStockException:', output.getvalue(), "An item that cannot be priced should be reported.")
+    self.assertIn('Transaction cancelled.', output.getvalue(), "The terminal should keep running after a scan fails.")
+    self.assertIn("Item '{}' added".format(item2.name), output.getvalue(), "Scanning should continue after a scan fails.")
+
+  def test_terminal_restores_stock_when_payment_fails_or_is_cancelled(self):
+    import contextlib, io
+    from unittest import mock
+    item = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    items_dict = { '1' : (item, 20, 5) }
+    # Tender too little in cash, then cancel a credit payment, then cancel the transaction
+    answers = iter(['1', '1', '3', 'quit', '4', '1', '1', '1.00', '4', '1', '3', 'n', '6'])
+    output = io.StringIO()
+    with mock.patch('builtins.input', lambda prompt='': next(answers)), contextlib.redirect_stdout(output):
+      megamart_base.terminal(items_dict, {}, {})
+
+    self.assertIn('InsufficientFundsException:', output.getvalue(), "Tendering too little should be reported.")
+    self.assertIn('Payment cancelled.', output.getvalue(), "A cancelled payment should be reported.")
+    self.assertEqual(items_dict['1'][1:], (20, 5), "Stock taken by an unpaid checkout should be put back.")
+
+  ## Line coalescing tests:
+
+  def test_repeat_scans_merge(self):
+    item = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    transaction = Transaction("23/08/2023", "09:48:00")
+    for _ in range(3):
+      line = megamart_base.add_scanned_line(transaction, TransactionLine(item, 1), {})
+    self.assertEqual(len(transaction.transaction_lines), 1, "Repeat scans should be merged into one line.")
+    self.assertEqual(line.quantity, 3, "The merged line should hold every scanned unit.")
+    self.assertEqual(transaction.line_index['1'], line, "The line index should point at the merged line.")
+
+  def test_split_lines_validated_per_sku(self):
+    item = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    items_dict = { '1' : (item, 20, 5) }
+    transaction = Transaction("23/08/2023", "09:48:00")
+    transaction.transaction_lines = [TransactionLine(item, 3), TransactionLine(item, 3)]
+    transaction.fulfilment_type = FulfilmentType.PICKUP
+    transaction.payment_method = PaymentMethod.CREDIT
+    with self.assertRaises(PurchaseLimitExceededException, msg="Split lines should count towards one purchase limit."):
+      megamart.checkout(transaction, items_dict, {})
+    self.assertEqual(items_dict['1'][1], 20, "A failed checkout should not change the stock level.")
+
+  def test_split_lines_validated_per_sku_in_cents_and_batches(self):
+    item = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    def split_transaction():
+      transaction = Transaction("23/08/2023", "09:48:00")
+      transaction.transaction_lines = [TransactionLine(item, 2), TransactionLine(item, 2)]
+      transaction.fulfilment_type = FulfilmentType.PICKUP
+      transaction.payment_method = PaymentMethod.CREDIT
+      return transaction
+
+    items_dict = { '1' : (item, 10, 2) }
+    with self.assertRaises(PurchaseLimitExceededException, msg="Split lines should count towards one purchase limit in cents."):
+      megamart_cents.checkout_cents(split_transaction(), items_dict, {})
+    self.assertEqual(items_dict['1'], (item, 10, 2), "A failed checkout in cents should not change the stock level.")
+
+    results = checkout_many([split_transaction()], items_dict, {})
+    self.assertIsInstance(results[0], PurchaseLimitExceededException, "Split lines should count towards one purchase limit in a batch.")
+    self.assertEqual(items_dict['1'], (item, 10, 2), "A failed batch checkout should not change the stock level.")
+
+  def test_pricing_failure_leaves_stock_unchanged(self):
+    item1 = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = Item('2', 'Dish Soap', 5.00, ['Cleaning'])
+    items_dict = { '1' : (item1, 10, None), '2' : (item2, 10, None) }
+    transaction = Transaction("23/08/2023", "09:48:00")
+    transaction.transaction_lines = [TransactionLine(item1, 1), TransactionLine(item2, 1)]
+    transaction.fulfilment_type = FulfilmentType.PICKUP
+    transaction.payment_method = PaymentMethod.CREDIT
+    with self.assertRaises(InsufficientStockException, msg="An invalid discount should fail checkout."):
+      megamart.checkout(transaction, items_dict, { '2' : Discount(DiscountType.FLAT, 50, '2') })
+    self.assertEqual((items_dict['1'][1], items_dict['2'][1]), (10, 10), "A pricing failure should not change any stock level.")
+
+    transaction.fulfilment_type = FulfilmentType.DELIVERY
+    with self.assertRaises(FulfilmentException, msg="A delivery without a customer should fail checkout."):
+      megamart.checkout(transaction, items_dict, {})
+    self.assertEqual((items_dict['1'][1], items_dict['2'][1]), (10, 10), "A surcharge failure should not change any stock level.")
+
+  ## SqliteCatalog tests:
+
+  def test_sqlite_checkout_writes_back(self):
+    import os, tempfile
+    item = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    customer = Customer('123', 'Alice', '01/08/2005', True, None)
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'catalog.db')
+      with SqliteCatalog.create(path, [(item, 20, None)], [customer], [Discount(DiscountType.PERCENTAGE, 10, '1')], cache_size=1) as catalog:
+        transaction = Transaction("23/08/2023", "09:48:00")
+        transaction.transaction_lines = [TransactionLine(catalog.items['1'][0], 2)]
+        transaction.customer = catalog.customers['123']
+        transaction.fulfilment_type = FulfilmentType.PICKUP
+        transaction.payment_method = PaymentMethod.CREDIT
+        megamart.checkout(transaction, catalog.items, catalog.discounts)
+        self.assertEqual(transaction.final_total, 8.10, "Checkout should price items from the SQLite catalog.")
+        self.assertNotIn('2', catalog.items, "Unknown item IDs should not be found.")
+        self.assertEqual(catalog.items['1'][1], 18, "Pending stock changes should be visible before they are written.")
+
+      with SqliteCatalog(path) as catalog:
+        self.assertEqual(catalog.items['1'][1], 18, "Stock changes should be written back when the catalog closes.")
+        self.assertEqual(catalog.items['1'][0].categories, ['Confectionery', 'Biscuits'], "Item categories should be stored.")
+        self.assertEqual(len(catalog.customers), 1, "Customers should be stored.")
+
+  ## megamart_startup tests:
+
+  def test_lazy_mapping_loads_on_first_use(self):
+    loads = []
+    items_dict = LazyMapping(lambda: loads.append(1) or { '1' : (Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery']), 20, None) })
+    self.assertFalse(items_dict.loaded, "The mapping should not be built before it is used.")
+    self.assertIn('1', items_dict, "The built mapping's keys should be found.")
+    items_dict['1'] = (items_dict['1'][0], 18, None)
+    self.assertEqual((len(loads), items_dict['1'][1]), (1, 18), "The mapping should be built once and then reused.")
+
+  def test_startup_profiler_records_imports(self):
+    import sys
+    sys.modules.pop('megamart_client', None)
+    profiler = StartupProfiler()
+    profiler.start()
+    try:
+      import megamart_client
+    finally:
+      profiler.stop()
+    profiler.mark('done')
+    self.assertIn('megamart_client', profiler.imports, "New imports should be timed.")
+    self.assertIn('done', profiler.report(), "The report should list the marked phases.")
+
+  ## megamart_journal tests:
+
+  def test_journal_replay_rebuilds_stock(self):
+    import os, tempfile
+    item1 = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks'])
+    items_dict = { '1' : (item1, 20, None), '2' : (item2, 12, 4) }
+    with tempfile.TemporaryDirectory() as directory:
+      journal_path = os.path.join(directory, 'journal.bin')
+      snapshot_path = os.path.join(directory, 'snapshot.csv')
+      with megamart_journal.TransactionJournal(journal_path) as journal:
+        megamart_journal.write_snapshot(snapshot_path, megamart_journal.stock_levels(items_dict), journal.position())
+        for quantities in ((2, 1), (1, 3)):
+          transaction = Transaction("23/08/2023", "09:48:00")
+          transaction.transaction_lines = [TransactionLine(item1, quantities[0]), TransactionLine(item2, quantities[1])]
+          transaction.fulfilment_type = FulfilmentType.PICKUP
+          transaction.payment_method = PaymentMethod.CREDIT
+          deltas = megamart_journal.sale_deltas(transaction, items_dict)
+          megamart.checkout(transaction, items_dict, {})
+          journal.append(transaction, deltas)
+      with open(journal_path, 'ab') as torn:
+        torn.write(b'\x40\x00\x00\x00torn')
+
+      stock, offset = megamart_journal.load_snapshot(snapshot_path)
+      applied, end = megamart_journal.replay(stock, journal_path, offset)
+      records = list(megamart_journal.read_journal(journal_path))
+
+    self.assertEqual(applied, 2, "Replay should apply every complete record and ignore a torn tail.")
+    self.assertEqual(stock, { '1' : [17, None], '2' : [8, 0] }, "Replay should rebuild the stock levels checkout left.")
+    self.assertEqual(stock['2'], [items_dict['2'][1], items_dict['2'][2]], "Replayed limits should match the catalog.")
+    self.assertEqual(records[1]['lines'], [['1', 1], ['2', 3]], "Journal records should keep the transaction lines.")
+
+  def test_journal_reopen_truncates_torn_tail(self):
+    import os, tempfile
+    item1 = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    stock = { '1' : [20, None] }
+    with tempfile.TemporaryDirectory() as directory:
+      journal_path = os.path.join(directory, 'journal.bin')
+      transaction = Transaction("23/08/2023", "09:48:00")
+      transaction.transaction_lines = [TransactionLine(item1, 1)]
+      with megamart_journal.TransactionJournal(journal_path) as journal:
+        journal.append(transaction, [('1', -1, 0)])
+        complete = journal.position()
+      with open(journal_path, 'ab') as torn:
+        torn.write(b'\x40\x00\x00\x00torn')
+      with megamart_journal.TransactionJournal(journal_path) as journal:
+        self.assertEqual(journal.position(), complete, "Reopening a journal should cut off a torn tail.")
+        journal.append(transaction, [('1', -2, 0)])
+        journal.append(transaction, [('1', -3, 0)])
+      applied, end = megamart_journal.replay(stock, journal_path)
+      self.assertEqual(end, os.path.getsize(journal_path), "Replay should reach the end of a reopened journal.")
+      with open(journal_path, 'wb') as other:
+        other.write(b'not a journal')
+      with self.assertRaises(ValueError, msg="Only journals should be opened for appending."):
+        megamart_journal.TransactionJournal(journal_path)
+
+    self.assertEqual(applied, 3, "Records appended after a torn tail should be replayed.")
+    self.assertEqual(stock, { '1' : [14, None] }, "Replay should apply every record appended after reopening.")
+
+  ## SharedStockTable tests:
+
+  def test_shared_stock_table_checkout(self):
+    item1 = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks'])
+    with SharedStockTable.create({ '1' : (item1, 20, None), '2' : (item2, 12, 4) }, stripes=4) as table:
+      lane = SharedStockTable.attach(table.handle())
+      transaction = Transaction("23/08/2023", "09:48:00")
+      transaction.transaction_lines = [TransactionLine(item1, 2), TransactionLine(item2, 3)]
+      transaction.fulfilment_type = FulfilmentType.PICKUP
+      transaction.payment_method = PaymentMethod.CREDIT
+      lane.checkout(transaction, None, {})
+      self.assertEqual(table['1'][1:], (18, None), "Stock sold in one lane should be seen by every lane.")
+      self.assertEqual(table['2'][1:], (9, 1), "Purchase limits should be updated in the shared table.")
+      self.assertFalse(table.compare_and_swap('1', (20, None), (0, None)), "A stale compare and swap should be refused.")
+      self.assertTrue(table.compare_and_swap('1', (18, None), (5, None)), "A current compare and swap should be applied.")
+      self.assertEqual(lane.read('1'), (5, None), "Compare and swap writes should be seen by every lane.")
+      lane.close()
+
+  def test_shared_stock_table_nested_calls_do_not_deadlock(self):
+    item = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    with SharedStockTable.create({ '1' : (item, 20, None) }, stripes=1) as table:
+      transaction = Transaction("23/08/2023", "09:48:00")
+      transaction.transaction_lines = [TransactionLine(item, 2)]
+      transaction.fulfilment_type = FulfilmentType.PICKUP
+      transaction.payment_method = PaymentMethod.CREDIT
+      # Hold the stripe the way checkout does while it runs
+      with table._locks[0]:
+        table._held_stripes().add(0)
+        try:
+          self.assertTrue(table.compare_and_swap('1', (20, None), (10, None)),
+                          "Compare and swap inside a checkout should use the stripe already held.")
+          with self.assertRaises(RuntimeError, msg="A nested checkout should be refused rather than deadlock."):
+            table.checkout(transaction, None, {})
+        finally:
+          table._held_stripes().clear()
+      self.assertEqual(table.read('1'), (10, None), "A refused nested checkout should not change stock.")
+
+  def test_shared_stock_table_processes_do_not_oversell(self):
+    result = bench_shared_stock.run(4, 10, 100, 5, 200)
+    self.assertEqual(result['transactions'], 400, "Every lane should run its transactions.")
+
+  ## megamart_reconcile tests:
+
+  def test_reconcile_matches_checkout_for_any_worker_count(self):
+    import json, os, tempfile
+    with tempfile.TemporaryDirectory() as directory:
+      megadata_gen.write_dataset(directory, 40, 20, True, 200, seed=5, restricted_ratio=0.3, max_stock=20)
+      items_dict = megadata_gen.load_items(directory)
+      customers_dict = megadata_gen.load_customers(directory)
+      discounts_dict = megadata_gen.load_discounts(directory)
+      path = os.path.join(directory, 'recorded.jsonl')
+      checked_out = 0
+      with open(os.path.join(directory, 'transactions.jsonl')) as source, open(path, 'w') as output:
+        for line in source:
+          record = json.loads(line)
+          try:
+            record['final_total'] = megamart.checkout(megadata_gen.transaction_from_record(record, items_dict, customers_dict),
+                                                      items_dict, discounts_dict).final_total
+            checked_out += 1
+            if checked_out == 3:
+              record['final_total'] += 1.00
+          except Exception:
+            pass
+          output.write(json.dumps(record) + '\n')
+      reports = [megamart_reconcile.reconcile(directory, path, workers, chunk_size=16) for workers in (1, 3)]
+
+    for report in reports:
+      self.assertEqual(report.checked_out, checked_out, "Reconciliation should accept what checkout accepted.")
+      self.assertEqual(len(report.mismatches), 1, "A wrong recorded total should be reported.")
+      self.assertEqual({ item_id : entry[1:] for item_id, entry in report.items_dict.items() },
+                       { item_id : entry[1:] for item_id, entry in items_dict.items() },
+                       "Closing stock should match checking out in order.")
+    self.assertEqual(reports[0].summary(), reports[1].summary(), "The report should not depend on the worker count.")
+
+  ## DiscountSchedule tests:
+
+  def test_discount_schedule_resolves_by_time_and_priority(self):
+    from datetime import datetime
+    item1 = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks'])
+    schedule = DiscountSchedule([
+      DiscountRule(DiscountType.PERCENTAGE, 10, category='biscuits'),
+      DiscountRule(DiscountType.FLAT, 1.50, item_id='1', start=datetime(2023, 8, 23, 9), end=datetime(2023, 8, 23, 12)),
+      DiscountRule(DiscountType.PERCENTAGE, 50, start=datetime(2023, 8, 23, 11), end=datetime(2023, 8, 24), priority=1),
+    ], { '2' : Discount(DiscountType.FLAT, 1.00, '2') })
+
+    self.assertEqual(schedule.discount_for(item1, datetime(2023, 8, 23, 8)).value, 10, "A category rule should apply to the category's items.")
+    self.assertEqual(schedule.discount_for(item1, datetime(2023, 8, 23, 9)).value, 1.50, "An item rule should beat a category rule of the same priority.")
+    self.assertEqual(schedule.discount_for(item1, datetime(2023, 8, 23, 11)).value, 50, "A higher priority rule should win while it is in effect.")
+    self.assertEqual(schedule.discount_for(item2, datetime(2023, 8, 24)).value, 1.00, "Rules should stop applying at their end time.")
+
+    items_dict = { '1' : (item1, 20, None), '2' : (item2, 12, None) }
+    transaction = Transaction("23/08/2023", "09:48:00")
+    transaction.transaction_lines = [TransactionLine(item1, 2), TransactionLine(item2, 1)]
+    transaction.fulfilment_type = FulfilmentType.PICKUP
+    transaction.payment_method = PaymentMethod.CREDIT
+    megamart.checkout(transaction, items_dict, schedule.for_transaction(transaction, items_dict))
+    self.assertEqual(transaction.final_total, 21.00, "Checkout should use the discounts in effect at the transaction's time.")
+
+  ## Bundle tests:
+
+  def test_bundle_solver_picks_cheapest_combination(self):
+    bundles = [Bundle(DiscountType.MULTI_BUY, 10.00, { '1' : 3 }, '3 for $10'),
+               Bundle(DiscountType.BUNDLE, 2.50, { '1' : 1, '2' : 1 }, 'Tim Tam and coffee'),
+               Bundle(DiscountType.BUNDLE, 4.00, { '1' : 2, '2' : 1 }, 'Morning tea')]
+    saved, applied = megamart_bundles.best_bundles({ '1' : 4, '2' : 2 }, { '1' : 450, '2' : 1600 }, bundles)
+    self.assertEqual(saved, 800, "Overlapping bundles should be combined to save the most.")
+    self.assertEqual([(bundle.name, sets) for bundle, sets, _ in applied], [('Morning tea', 2)],
+                     "The applied bundles should be reported in the order given.")
+
+  def test_checkout_applies_bundles_to_totals_and_receipt(self):
+    item1 = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks'])
+    items_dict = { '1' : (item1, 20, None), '2' : (item2, 12, None) }
+    transaction = Transaction("23/08/2023", "09:48:00")
+    transaction.transaction_lines = [TransactionLine(item1, 4), TransactionLine(item2, 1)]
+    transaction.fulfilment_type = FulfilmentType.PICKUP
+    transaction.payment_method = PaymentMethod.CREDIT
+    megamart.checkout(transaction, items_dict, {}, [Bundle(DiscountType.MULTI_BUY, 10.00, { '1' : 3 }, '3 for $10'),
+                                                    Bundle(DiscountType.BUNDLE, 2.00, { '1' : 1, '2' : 1 }, 'Tim Tam and coffee')])
+
+    self.assertEqual(transaction.final_total, 28.50, "Bundle savings should come off the final total.")
+    self.assertEqual(transaction.amount_saved, 5.50, "Bundle savings should be added to the amount saved.")
+    transaction.amount_tendered, transaction.change_amount, transaction.finalised = 28.50, 0, True
+    self.assertIn('Bundle: 3 for $10', megamart_base.generate_receipt(transaction, {}), "Applied bundles should be listed on the receipt.")
+
+  def test_bundles_applied_by_every_checkout_function(self):
+    item1 = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks'])
+    bundles = [Bundle(DiscountType.MULTI_BUY, 10.00, { '1' : 3 }, '3 for $10'),
+               Bundle(DiscountType.BUNDLE, 2.00, { '1' : 1, '2' : 1 }, 'Tim Tam and coffee')]
+
+    def cart():
+      transaction = Transaction("23/08/2023", "09:48:00")
+      transaction.transaction_lines = [TransactionLine(item1, 4), TransactionLine(item2, 1)]
+      transaction.fulfilment_type = FulfilmentType.PICKUP
+      transaction.payment_method = PaymentMethod.CREDIT
+      return transaction
+
+    results = {}
+    results['cents'] = megamart_cents.checkout_cents(cart(), { '1' : (item1, 20, None), '2' : (item2, 12, None) }, {}, bundles)
+    results['reservation'] = StockReservation({ '1' : (item1, 20, None), '2' : (item2, 12, None) }).checkout(cart(), {}, bundles)
+    with SharedStockTable.create({ '1' : (item1, 20, None), '2' : (item2, 12, None) }) as table:
+      results['shared'] = table.checkout(cart(), None, {}, bundles)
+    for name, transaction in results.items():
+      with self.subTest(checkout=name):
+        self.assertEqual((transaction.final_total, transaction.amount_saved), (28.50, 5.50), "Bundle savings should be applied.")
+        self.assertEqual([(bundle.name, sets) for bundle, sets, _ in transaction.applied_bundles], [('3 for $10', 1), ('Tim Tam and coffee', 1)],
+                         "The applied bundles should be recorded for the receipt.")
+
+  ## megamart_numpy tests:
+
+  @unittest.skipIf(megamart_numpy is None, "numpy is not installed")
+  def test_numpy_kernels_match_scalar_functions(self):
+    prices = [4.50, 1.005, 0.125, 19.99, 2.675, 10.00, 3.00, 0.29]
+    types = [DiscountType.PERCENTAGE, None, DiscountType.FLAT, DiscountType.PERCENTAGE, DiscountType.FLAT, DiscountType.PERCENTAGE, DiscountType.FLAT, None]
+    values = [25, 0, 0.10, 33, 0.675, 12.5, 0.01, 0]
+    final, invalid = megamart_numpy.final_item_prices(prices, megamart_numpy.encode(types, DiscountType), values)
+    savings, _ = megamart_numpy.item_savings(prices, final)
+    for index, price in enumerate(prices):
+      item = Item(str(index), 'Item', price, ['Food'])
+      discounts_dict = {} if types[index] is None else { str(index) : Discount(types[index], values[index], str(index)) }
+      expected = megamart.calculate_final_item_price(item, discounts_dict)
+      self.assertFalse(invalid[index], "Valid discounts should not be masked.")
+      self.assertEqual(final[index], expected, "Final prices should match calculate_final_item_price exactly.")
+      self.assertEqual(savings[index], megamart.calculate_item_savings(price, expected), "Savings should match calculate_item_savings exactly.")
+
+    subtotals = [0.29, 10.01, 10.03, 12.345, 99.99, 0.125]
+    for method in (PaymentMethod.CASH, PaymentMethod.CREDIT):
+      rounded, _ = megamart_numpy.round_off_subtotals(subtotals, megamart_numpy.encode([method] * len(subtotals), PaymentMethod))
+      self.assertEqual(list(rounded), [megamart.round_off_subtotal(subtotal, method) for subtotal in subtotals],
+                       "Rounded subtotals should match round_off_subtotal exactly, including the 5 cent cash rule.")
+
+  @unittest.skipIf(megamart_numpy is None, "numpy is not installed")
+  def test_numpy_kernels_mask_invalid_rows(self):
+    final, invalid = megamart_numpy.final_item_prices([4.50, 4.50, 4.50, 4.50], megamart_numpy.encode([DiscountType.PERCENTAGE, DiscountType.PERCENTAGE, DiscountType.FLAT, DiscountType.FLAT], DiscountType), [0.5, 101, 5.00, -1.00])
+    self.assertEqual(list(invalid), [True] * 4, "Discounts calculate_final_item_price rejects should be masked.")
+    self.assertTrue(all(price != price for price in final), "Masked rows should hold NaN.")
+
+    _, invalid = megamart_numpy.item_savings([4.50, 4.50], [4.00, 5.00])
+    self.assertEqual(list(invalid), [False, True], "A final price above the original price should be masked.")
+
+    surcharges, invalid = megamart_numpy.fulfilment_surcharges(megamart_numpy.encode([FulfilmentType.DELIVERY, FulfilmentType.DELIVERY, FulfilmentType.DELIVERY, FulfilmentType.PICKUP, None], FulfilmentType), [12.5, 3, float('nan'), float('nan'), 5])
+    self.assertEqual(list(invalid), [False, False, True, False, True], "Deliveries without a distance and missing fulfilment types should be masked.")
+    self.assertEqual(list(surcharges[:2]) + [surcharges[3]], [6.25, 5, 0], "Surcharges should match cfs.")
+
+    _, invalid = megamart_numpy.round_off_subtotals([1.00, 1.00], megamart_numpy.encode([PaymentMethod.DEBIT, None], PaymentMethod))
+    self.assertEqual(list(invalid), [False, True], "A missing payment method should be masked.")
+
+  ## megamart_whatif tests:
+
+  def _whatif_carts(self):
+    item1 = Item('1', 'Tim Tam - Chocolate', 4.50, ['Confectionery', 'Biscuits'])
+    item2 = Item('2', 'Coffee Powder', 16.00, ['Coffee', 'Drinks'])
+    customer = Customer('1', 'Jane', '01/01/1990', True, 13.3)
+    carts = []
+    for lines, fulfilment, payment in (([(item1, 2), (item2, 1), (item1, 1)], FulfilmentType.PICKUP, PaymentMethod.CASH),
+                                       ([(item2, 3)], FulfilmentType.DELIVERY, PaymentMethod.CREDIT),
+                                       ([(item1, 5)], FulfilmentType.PICKUP, PaymentMethod.DEBIT)):
+      transaction = Transaction('02/08/2023', '12:00:00')
+      transaction.transaction_lines = [TransactionLine(item, qty) for item, qty in lines]
+      transaction.customer, transaction.fulfilment_type, transaction.payment_method = customer, fulfilment, payment
+      carts.append(transaction)
+    return { '1' : (item1, 20, None), '2' : (item2, 20, None) }, carts
+
+  @unittest.skipIf(megamart_numpy is None, "numpy is not installed")
+  def test_whatif_scenarios_match_checkout(self):
+    items_dict, carts = self._whatif_carts()
+    baseline = { '1' : Discount(DiscountType.PERCENTAGE, 20, '1') }
+    scenarios = { '25% off' : { '1' : Discount(DiscountType.PERCENTAGE, 25, '1') },
+                  'flat coffee' : dict(baseline, **{ '2' : Discount(DiscountType.FLAT, 1.15, '2') }) }
+    report = megamart_whatif.CartSet.from_transactions(carts).simulate(baseline, scenarios)
+
+    for outcome, discounts_dict in zip([report.baseline] + report.scenarios, [baseline] + list(scenarios.values())):
+      stock = dict(items_dict)
+      checked = [megamart.checkout(transaction, stock, discounts_dict) for transaction in carts]
+      self.assertEqual(outcome.checked_out, 3, "Every cart should be priced.")
+      self.assertAlmostEqual(outcome.revenue, sum(trans.final_total for trans in checked), 2, "Revenue should match checkout's final totals.")
+      self.assertAlmostEqual(outcome.amount_saved, sum(trans.amount_saved for trans in checked), 2, "Savings should match checkout.")
+      self.assertAlmostEqual(outcome.rounding, sum(trans.rounding_amount_applied for trans in checked), 2, "Rounding should match checkout.")
+    self.assertEqual(report.scenarios[0].item_deltas(report.baseline), [('1', 0, -1.76, 1.76)], "Only the repriced item should change.")
+    self.assertEqual(items_dict['1'][1], 20, "Simulating should not change stock.")
+
+  @unittest.skipIf(megamart_numpy is None, "numpy is not installed")
+  def test_whatif_rejects_carts_checkout_would_reject(self):
+    _, carts = self._whatif_carts()
+    report = megamart_whatif.CartSet.from_transactions(carts).simulate({}, { 'bad' : { '2' : Discount(DiscountType.PERCENTAGE, 120, '2') } })
+    self.assertEqual((report.baseline.checked_out, report.baseline.rejected), (3, 0), "No cart should be rejected without discounts.")
+    self.assertEqual((report.scenarios[0].checked_out, report.scenarios[0].rejected), (1, 2), "Carts holding an item with an invalid discount should be rejected.")
+    self.assertEqual(report.scenarios[0].units[1], 0, "Rejected carts should not count towards units sold.")
+
+  ## DispatchQueue tests:
+
+  def test_customer_surcharge_refreshed_when_distance_changes(self):
+    customer = Customer('1', 'Jane', '01/01/1990', True, 13.3)
+    self.assertEqual(megamart.cfs(FulfilmentType.DELIVERY, customer), 6.65, "The surcharge should be $0.50 per kilometre.")
+    customer.delivery_distance_km = 4
+    self.assertEqual(megamart.cfs(FulfilmentType.DELIVERY, customer), 5, "The surcharge should be refreshed when the distance changes.")
+    customer.delivery_distance_km = None
+    with self.assertRaises(FulfilmentException, msg="Customers without a distance should not have deliveries."):
+      megamart.cfs(FulfilmentType.DELIVERY, customer)
+
+  def test_dispatch_queue_orders_by_band_then_time(self):
+    near, far = Customer('1', 'Near', '01/01/1990', True, 2.5), Customer('2', 'Far', '01/01/1990', True, 12)
+    queue = DispatchQueue(band_km=5)
+    orders = []
+    for customer, time in ((far, '09:00:00'), (near, '11:00:00'), (near, '10:00:00'), (far, '08:00:00')):
+      transaction = Transaction('23/08/2023', time)
+      transaction.customer, transaction.fulfilment_type, transaction.finalised = customer, FulfilmentType.DELIVERY, True
+      queue.push(transaction)
+      orders.append(transaction)
+
+    self.assertEqual(len(queue), 4, "Every delivery should be queued.")
+    self.assertIs(queue.pop(), orders[2], "The nearest band's oldest order should be dispatched first.")
+    self.assertEqual(queue.pop_batch(2), [orders[1], orders[3]], "Batches should follow band, then time.")
+    self.assertEqual(queue.pop_batch(), [orders[0]], "A batch should stop when the queue is empty.")
+
+    pickup = Transaction('23/08/2023', '12:00:00')
+    pickup.customer, pickup.fulfilment_type, pickup.finalised = near, FulfilmentType.PICKUP, True
+    with self.assertRaises(FulfilmentException, msg="Only deliveries should be queued."):
+      queue.push(pickup)
+    pickup.fulfilment_type, pickup.finalised = FulfilmentType.DELIVERY, False
+    with self.assertRaises(ValueError, msg="Unfinalised transactions should not be queued."):
+      queue.push(pickup)
+
+if __name__ == '__main__':
+  unittest.main()